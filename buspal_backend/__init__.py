@@ -5,7 +5,13 @@ from datetime import datetime
 from buspal_backend.api import webhook
 from buspal_backend.api.webhook import handler_map
 from buspal_backend.services.ai.mcp.manager import mcp_manager
+from buspal_backend.services.storage.summary_worker import summary_worker
+from buspal_backend.services.storage.write_buffer import message_buffer
+from buspal_backend.services.reminders.backends import reminder_backend
+from buspal_backend.services.reminders.rephraser import reminder_rephraser
 from buspal_backend.utils.helpers import cleanup_http_session
+from buspal_backend.db.indexes import ensure_indexes
+from buspal_backend.db.migrations import run_migrations
 import uvicorn
 import os
 import json
@@ -21,10 +27,28 @@ with open('buspal_backend/config/mcp.json', 'r') as file:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Server starting up...")
+    try:
+        run_migrations()
+    except Exception as e:
+        logger.exception(f"Failed to apply database migrations: {e}")
+    try:
+        ensure_indexes()
+    except Exception as e:
+        # Missing unique or TTL indexes break upsert and retention guarantees
+        logger.critical(f"Failed to ensure database indexes: {e}")
+    try:
+        await reminder_backend.start()
+    except Exception as e:
+        logger.error(f"Failed to start reminder backend: {e}")
     await mcp_manager.connect_servers()
     yield
     logger.info("Server shutting down...")
     # Clean up resources
+    # Flush buffered messages first, flushing may schedule summaries
+    await message_buffer.shutdown()
+    await summary_worker.shutdown()
+    await reminder_backend.close()
+    await reminder_rephraser.shutdown()
     await cleanup_http_session()
     for handler in handler_map.values():
         # Clean up WhatsApp service sessions if they exist
@@ -65,7 +89,9 @@ async def health_check():
     return {
         "status": "healthy :)",
         "timestamp": datetime.now().isoformat(),
-        "version": SERVER_VERSION
+        "version": SERVER_VERSION,
+        "message_buffer": message_buffer.metrics,
+        "reminder_backend": {"name": reminder_backend.name, **reminder_backend.metrics}
     }
 
 app.include_router(webhook.router)
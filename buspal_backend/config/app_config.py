@@ -26,7 +26,19 @@ class MessageConfig:
     
     # Thresholds
     bot_trigger_threshold: int = 75
+    name_match_threshold: int = 85
     summary_message_threshold: int = 20
+    summary_max_concurrency: int = 4
+    summary_compaction_factor: int = 5
+    summary_max_level: int = 3
+    summary_context_count: int = 15
+    summary_retrieval_count: int = 5
+    retrieval_index_max_chats: int = 200
+    retrieval_index_max_entries: int = 5000
+    roster_cache_max_chats: int = 500
+    roster_cache_ttl_seconds: int = 300
+    roster_sync_interval_hours: int = 24
+    roster_name_lookup_concurrency: int = 8
     
     # Media processing
     media_skip_threshold: int = 5
@@ -79,12 +91,58 @@ class WhatsAppConfig:
         if self.api_url is None:
           raise ValueError("WHATSAPP_API_URL environment variable is required")
 
+@dataclass
+class StorageConfig:
+    """Configuration for media and conversation storage."""
+    media_backend: str = field(default_factory=lambda: os.environ.get("MEDIA_STORE_BACKEND", "local"))
+    media_path: str = field(default_factory=lambda: os.environ.get("MEDIA_STORE_PATH", ".media"))
+    media_bucket: str = "media"
+    write_flush_interval_ms: int = 250
+    write_flush_max_ops: int = 200
+    write_flush_max_attempts: int = 10
+    write_retry_max_backoff_ms: int = 30000
+
+    def __post_init__(self):
+        if self.media_backend not in ("local", "gridfs"):
+          raise ValueError("MEDIA_STORE_BACKEND must be 'local' or 'gridfs'")
+
+@dataclass
+class ReminderConfig:
+    """Configuration for reminder delivery."""
+    backend: str = field(default_factory=lambda: os.environ.get("REMINDER_BACKEND", "servicebus"))
+    queue_backend: str = field(default_factory=lambda: os.environ.get("REMINDER_QUEUE_BACKEND", "servicebus"))
+    connection_string: Optional[str] = field(default_factory=lambda: os.environ.get("AZURE_SERVICE_BUS_CONNECTION_STRING"))
+    queue_name: str = field(default_factory=lambda: os.environ.get("REMINDER_QUEUE_NAME") or "reminders")
+    send_batch_window_ms: int = 50
+    send_max_batch: int = 100
+    dispatch_max_concurrency: int = 8
+    dispatch_chat_interval_ms: int = 1000
+    claim_lease_seconds: int = 300
+    max_send_attempts: int = 3
+    send_retry_backoff_seconds: int = 60
+    coalesce_window_seconds: int = 60
+    rephrase_variant_count: int = 5
+    rephrase_refill_threshold: int = 1
+    service_bus_horizon_days: int = 14
+    wheel_tick_ms: int = 100
+    wheel_slot_bits: int = 6
+    wheel_levels: int = 6
+    wheel_load_horizon_minutes: int = 60
+
+    def __post_init__(self):
+        if self.backend not in ("servicebus", "wheel"):
+          raise ValueError("REMINDER_BACKEND must be 'servicebus' or 'wheel'")
+        if self.queue_backend not in ("servicebus", "memory"):
+          raise ValueError("REMINDER_QUEUE_BACKEND must be 'servicebus' or 'memory'")
+
 @dataclass
 class AppConfig:
     """Main application configuration."""
     message_config: MessageConfig = field(default_factory=MessageConfig)
     ai_config: AIConfig = field(default_factory=AIConfig)
     whatsapp_config: WhatsAppConfig = field(default_factory=WhatsAppConfig)
+    storage_config: StorageConfig = field(default_factory=StorageConfig)
+    reminder_config: ReminderConfig = field(default_factory=ReminderConfig)
 
 # Global configuration instance
 app_config = AppConfig()
\ No newline at end of file
@@ -1,4 +1,7 @@
 import os
 
 MONGO_URI = os.getenv('MONGO_URI')
-DB_NAME = "whatsapp-bot"
\ No newline at end of file
+DB_NAME = "whatsapp-bot"
+
+# Days finished (sent, failed, cancelled) reminders are kept before the TTL index removes them
+REMINDER_RETENTION_DAYS = int(os.getenv('REMINDER_RETENTION_DAYS', '30'))
@@ -57,4 +57,7 @@ class DatabaseConnectionError(ConversationStorageError):
 
 class ConfigurationError(BuspalException):
     """Raised when configuration is invalid or missing."""
-    pass
\ No newline at end of file
+    pass
+class IndexCreationError(BuspalException):
+    """Raised when declared database indexes could not be created."""
+    pass
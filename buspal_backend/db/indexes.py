@@ -0,0 +1,102 @@
+from typing import Any, Dict, Optional
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from buspal_backend.db.mongo import db
+from buspal_backend.core.exceptions import IndexCreationError
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing every query issued by the models, keyed by collection
+INDEXES = {
+    "conversations": [
+        IndexModel([("convo_id", ASCENDING)], name="convo_id_unique", unique=True),
+    ],
+    "users": [
+        IndexModel([("wa_id", ASCENDING)], name="wa_id_unique", unique=True),
+        IndexModel([("convo_id", ASCENDING), ("name_normalized", ASCENDING)], name="convo_id_name_normalized"),
+    ],
+    "expenses": [
+        IndexModel([("convo_id", ASCENDING), ("is_settled", ASCENDING), ("created_at", ASCENDING)], name="convo_id_is_settled_created_at"),
+        IndexModel([("convo_id", ASCENDING), ("_id", ASCENDING)], name="convo_id_id"),
+        IndexModel([("convo_id", ASCENDING), ("settlement_id", ASCENDING)], name="convo_id_settlement_id",
+                   partialFilterExpression={"settlement_id": {"$exists": True}}),
+    ],
+    "balances": [
+        IndexModel([("convo_id", ASCENDING)], name="convo_id_unique", unique=True),
+    ],
+    "reminders": [
+        IndexModel([("status", ASCENDING), ("scheduled_time", ASCENDING)], name="status_scheduled_time"),
+        IndexModel([("chat_id", ASCENDING), ("scheduled_time", ASCENDING)], name="chat_id_scheduled_time"),
+        IndexModel([("series_id", ASCENDING), ("scheduled_time", ASCENDING)], name="series_id_scheduled_time"),
+        # Only reminders waiting out a send retry carry retry_at
+        IndexModel([("retry_at", ASCENDING)], name="retry_at", sparse=True),
+        # TTL: finished reminders are deleted once expires_at passes. Partial filters only
+        # support $in from MongoDB 6.0, so the filter matches the `finished` flag instead
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_finished_ttl", expireAfterSeconds=0,
+                   partialFilterExpression={"finished": True}),
+    ],
+    "summary_archive": [
+        IndexModel([("convo_id", ASCENDING), ("created_at", ASCENDING)], name="convo_id_created_at"),
+    ],
+}
+
+# Superseded index -> the declared index replacing it, dropped once the replacement exists
+SUPERSEDED_INDEXES = {
+    "conversations": {"convo_id": "convo_id_unique"},
+    "users": {"wa_id": "wa_id_unique", "convo_id_name": "convo_id_name_normalized"},
+    "reminders": {"expires_at_ttl": "expires_at_finished_ttl"},
+}
+
+# Raised when an index with the same keys but other options already exists
+INDEX_CONFLICT_CODES = {85, 86}
+
+def ensure_indexes(database=db) -> None:
+    """
+    Create the declared indexes, then drop the indexes they supersede.
+
+    Existing indexes are left as they are and every index is created on its own,
+    so a failure (e.g. duplicates blocking a unique index) only leaves that index
+    missing. A superseded index is dropped only once its replacement exists.
+    Raises IndexCreationError listing every failure once all indexes were tried.
+    """
+    failures = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        superseded_by = {
+            replacement: name for name, replacement in SUPERSEDED_INDEXES.get(collection_name, {}).items()
+        }
+        existing = collection.index_information()
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                _create_index(collection, index, superseded_by.get(name), existing)
+            except PyMongoError as e:
+                logger.error(f"Failed to create index {collection_name}.{name}: {e}")
+                failures[f"{collection_name}.{name}"] = str(e)
+        logger.info(f"Indexes ensured for {collection_name}")
+
+    if failures:
+        raise IndexCreationError(f"Failed to create indexes: {', '.join(failures)}", details=failures)
+
+def _create_index(collection, index: IndexModel, superseded: Optional[str], existing: Dict[str, Any]) -> None:
+    """Create `index`, then drop the index it supersedes."""
+    if superseded not in existing:
+        collection.create_indexes([index])
+        return
+    try:
+        collection.create_indexes([index])
+    except OperationFailure as e:
+        if e.code not in INDEX_CONFLICT_CODES:
+            raise
+        # Same keys as the superseded index, which has to go first. Restore it if the replacement fails
+        collection.drop_index(superseded)
+        try:
+            collection.create_indexes([index])
+        except PyMongoError:
+            spec = {key: value for key, value in existing[superseded].items() if key not in ("key", "v", "ns")}
+            collection.create_indexes([IndexModel(existing[superseded]["key"], name=superseded, **spec)])
+            raise
+    else:
+        collection.drop_index(superseded)
+    logger.info(f"Replaced superseded index {collection.name}.{superseded} with {index.document['name']}")
@@ -0,0 +1,175 @@
+"""
+One-off data migrations, applied once per database at startup.
+
+Each migration is recorded in the `migrations` collection when it completes. A run
+holds a lease on its marker so concurrent instances never apply the same migration
+twice; a run that crashes is picked up again once the lease expires. Migrations run
+before `ensure_indexes` so they can prepare data for new (e.g. unique) indexes.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+from buspal_backend.db.mongo import db
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LEASE = timedelta(minutes=30)
+
+def backfill_summary_archive() -> int:
+    """Archive the summaries and digests stored before the summary archive existed."""
+    from buspal_backend.models.conversation import ConversationModel
+    from buspal_backend.models.summary_archive import SummaryArchiveModel
+
+    archived = 0
+    cursor = ConversationModel.collection.find({}, {"_id": 0, "convo_id": 1, "summaries": 1, "digests": 1})
+    for conversation in cursor:
+        convo_id = conversation["convo_id"]
+        digests = conversation.get("digests") or {}
+        summaries = list(conversation.get("summaries") or [])
+        for level in sorted(digests, key=int):
+            summaries.extend(digests[level])
+        existing = set(SummaryArchiveModel.get_contents(convo_id))
+        missing = [summary for summary in summaries if summary.get("content") not in existing]
+        archived += len(SummaryArchiveModel.create_many(convo_id, missing))
+    return archived
+
+def backfill_normalized_names() -> int:
+    from buspal_backend.models.user import UserModel
+    return UserModel.backfill_normalized_names()
+
+def _duplicate_groups(collection, key: str):
+    """Documents sharing `key`, oldest first, one list per duplicated value."""
+    groups = collection.aggregate([
+        {"$group": {"_id": f"${key}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"_id": {"$ne": None}, "count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    for group in groups:
+        yield list(collection.find({"_id": {"$in": group["ids"]}}).sort("_id", 1))
+
+def _fill_missing(keeper: Dict[str, Any], duplicates: List[Dict[str, Any]], fields) -> Dict[str, Any]:
+    """Values the keeper lacks, taken from the oldest duplicate that has them."""
+    updates = {}
+    for field in fields:
+        if keeper.get(field) is None:
+            value = next((doc[field] for doc in duplicates if doc.get(field) is not None), None)
+            if value is not None:
+                updates[field] = value
+    return updates
+
+def _merge_conversations(keeper: Dict[str, Any], duplicates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    update: Dict[str, Any] = {}
+    pushes = {}
+    for field in ("messages", "summaries", "receipts"):
+        items = [item for doc in duplicates for item in doc.get(field) or []]
+        if items:
+            pushes[field] = {"$each": items}
+    for doc in duplicates:
+        for level, summaries in (doc.get("digests") or {}).items():
+            if summaries:
+                pushes.setdefault(f"digests.{level}", {"$each": []})["$each"].extend(summaries)
+    if pushes:
+        update["$push"] = pushes
+    fields = _fill_missing(keeper, duplicates, ("name", "mode", "roster_synced_at"))
+    if fields:
+        update["$set"] = fields
+    return update
+
+def _merge_users(keeper: Dict[str, Any], duplicates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    fields = _fill_missing(keeper, duplicates, ("convo_id", "name", "name_normalized", "phone", "created_at"))
+    for field in ("preferences", "last_read"):
+        # Keys the keeper already has win
+        merged = {}
+        for doc in reversed(duplicates):
+            merged.update(doc.get(field) or {})
+        merged.update(keeper.get(field) or {})
+        if merged != (keeper.get(field) or {}):
+            fields[field] = merged
+    return {"$set": fields} if fields else {}
+
+def dedupe_identities() -> int:
+    """
+    Merge conversations sharing a convo_id and users sharing a wa_id into their oldest
+    document, so the unique indexes backing the atomic upserts can be built.
+    """
+    from buspal_backend.models.conversation import ConversationModel
+    from buspal_backend.models.user import UserModel
+
+    removed = 0
+    for collection, key, merge in (
+        (ConversationModel.collection, "convo_id", _merge_conversations),
+        (UserModel.collection, "wa_id", _merge_users),
+    ):
+        for keeper, *duplicates in _duplicate_groups(collection, key):
+            update = merge(keeper, duplicates)
+            if update:
+                collection.update_one({"_id": keeper["_id"]}, update)
+            result = collection.delete_many({"_id": {"$in": [doc["_id"] for doc in duplicates]}})
+            removed += result.deleted_count
+            logger.info(f"Merged {len(duplicates)} duplicate {collection.name} documents for {keeper[key]}")
+    return removed
+
+def build_balance_ledgers() -> int:
+    """Build the ledger of every chat whose unsettled expenses predate ledgers."""
+    from buspal_backend.models.expense import ExpenseModel
+    from buspal_backend.services.expense_settlement import ExpenseSettlementService
+
+    convo_ids = ExpenseModel.collection.distinct("convo_id", {"is_settled": False})
+    for convo_id in convo_ids:
+        ExpenseSettlementService.rebuild_ledger(convo_id, missing_only=True)
+    return len(convo_ids)
+
+def rebuild_balance_ledgers() -> int:
+    """Rebuild every ledger, dropping the cent drift of payer credits computed from rounded totals."""
+    from buspal_backend.models.balance import BalanceLedgerModel
+    from buspal_backend.services.expense_settlement import ExpenseSettlementService
+
+    convo_ids = BalanceLedgerModel.collection.distinct("convo_id")
+    for convo_id in convo_ids:
+        ExpenseSettlementService.rebuild_ledger(convo_id)
+    return len(convo_ids)
+
+def backfill_reminder_expiry() -> int:
+    """Flag the finished reminders stored before the TTL index filtered on `finished`."""
+    from buspal_backend.models.reminder import ReminderModel
+    return ReminderModel.backfill_expiry()
+
+# Applied in order, each at most once
+MIGRATIONS: List[Tuple[str, Callable[[], Any]]] = [
+    ("backfill_summary_archive", backfill_summary_archive),
+    ("backfill_normalized_names", backfill_normalized_names),
+    ("dedupe_identities", dedupe_identities),
+    ("build_balance_ledgers", build_balance_ledgers),
+    ("rebuild_balance_ledgers", rebuild_balance_ledgers),
+    ("backfill_reminder_expiry", backfill_reminder_expiry),
+]
+
+def _claim(database, name: str) -> bool:
+    """Take the lease on a migration that has not been applied yet."""
+    now = datetime.now(timezone.utc)
+    try:
+        database.migrations.update_one(
+            {"_id": name, "applied_at": None, "lease_expires_at": {"$not": {"$gt": now}}},
+            {"$set": {"lease_expires_at": now + MIGRATION_LEASE}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Already applied, or being applied by another instance
+        return False
+    return True
+
+def run_migrations(database=db) -> None:
+    """Apply the pending migrations. Stops at the first failure, later migrations may depend on it."""
+    for name, migration in MIGRATIONS:
+        if not _claim(database, name):
+            continue
+        try:
+            result = migration()
+        except Exception:
+            database.migrations.update_one({"_id": name}, {"$unset": {"lease_expires_at": ""}})
+            raise
+        database.migrations.update_one(
+            {"_id": name},
+            {"$set": {"applied_at": datetime.now(timezone.utc), "result": result}, "$unset": {"lease_expires_at": ""}}
+        )
+        logger.info(f"Applied migration {name}: {result}")
@@ -0,0 +1,196 @@
+"""
+Query-plan regression check.
+
+Runs every model query method against a scratch database on a local mongod,
+records the commands they issue, and runs `explain` on each one. Exits with
+status 1 if any winning plan contains a COLLSCAN.
+
+    MONGO_URI=mongodb://localhost:27017 python -m buspal_backend.db.query_plan_check
+"""
+from typing import Any, Callable, Dict, List, Tuple
+from pymongo import MongoClient, monitoring
+from buspal_backend.config.settings import MONGO_URI, DB_NAME
+from buspal_backend.db.indexes import ensure_indexes
+import datetime
+import sys
+
+EXPLAINABLE_COMMANDS = {"find", "findAndModify", "update", "delete", "aggregate", "count", "distinct"}
+
+class CommandRecorder(monitoring.CommandListener):
+    """Keeps the explainable commands issued while a model method runs."""
+
+    def __init__(self):
+        self.commands: List[Dict[str, Any]] = []
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            command = {key: value for key, value in event.command.items()
+                       if not key.startswith("$") and key not in ("lsid", "txnNumber")}
+            self.commands.append(command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def find_collscans(plan: Any) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(find_collscans(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(find_collscans(item) for item in plan)
+    return False
+
+def winning_plan(explain: Dict[str, Any]) -> Any:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations report their planner per pipeline stage
+        planner = [stage.get("$cursor", {}).get("queryPlanner", {}) for stage in explain.get("stages", [])]
+        return [p.get("winningPlan") for p in planner]
+    return planner.get("winningPlan")
+
+def model_classes() -> List[type]:
+    from buspal_backend.models.conversation import ConversationModel
+    from buspal_backend.models.user import UserModel
+    from buspal_backend.models.expense import ExpenseModel
+    from buspal_backend.models.reminder import ReminderModel
+    from buspal_backend.models.summary_archive import SummaryArchiveModel
+    from buspal_backend.models.balance import BalanceLedgerModel
+    return [ConversationModel, UserModel, ExpenseModel, ReminderModel, SummaryArchiveModel, BalanceLedgerModel]
+
+def seed() -> Dict[str, Any]:
+    """Insert one document per collection and return ids used by the checks."""
+    from buspal_backend.models.conversation import ConversationModel
+    from buspal_backend.models.user import UserModel
+    from buspal_backend.models.expense import ExpenseModel
+    from buspal_backend.models.reminder import ReminderModel
+    from buspal_backend.models.summary_archive import SummaryArchiveModel
+
+    convo_id = "plancheck@g.us"
+    ConversationModel.create(convo_id, "Plan check", messages=[], summaries=[])
+    UserModel.create(wa_id="961000000@c.us", name="Plan Check", convo_id=convo_id)
+    expense = ExpenseModel.create(convo_id, "Dinner", 10.0, "961000000@c.us", "Plan Check",
+                                  [{"user_id": "961000000@c.us", "name": "Plan Check", "share_amount": 10.0}])
+    ReminderModel.create("plancheck-reminder", convo_id, "Check plans", datetime.datetime.utcnow(), status="pending")
+    SummaryArchiveModel.create(convo_id, {"content": "Plan check", "participants": [], "start_date": None, "end_date": None})
+    return {"convo_id": convo_id, "wa_id": "961000000@c.us", "expense_id": str(expense["_id"]), "reminder_id": "plancheck-reminder"}
+
+def query_checks(ids: Dict[str, Any]) -> List[Tuple[str, Callable[[], Any]]]:
+    from buspal_backend.models.conversation import ConversationModel
+    from buspal_backend.models.user import UserModel
+    from buspal_backend.models.expense import ExpenseModel
+    from buspal_backend.models.reminder import ReminderModel
+    from buspal_backend.models.summary_archive import SummaryArchiveModel
+    from buspal_backend.models.balance import BalanceLedgerModel
+
+    convo_id, wa_id = ids["convo_id"], ids["wa_id"]
+    expense_id, reminder_id = ids["expense_id"], ids["reminder_id"]
+    return [
+        ("ConversationModel.get_by_id", lambda: ConversationModel.get_by_id(convo_id)),
+        ("ConversationModel.get_or_create", lambda: ConversationModel.get_or_create(convo_id)),
+        ("ConversationModel.set_name_if_missing", lambda: ConversationModel.set_name_if_missing(convo_id, "Plan check")),
+        ("ConversationModel.mark_roster_synced", lambda: ConversationModel.mark_roster_synced(convo_id)),
+        ("ConversationModel.get_header", lambda: ConversationModel.get_header(convo_id)),
+        ("ConversationModel.get_context", lambda: ConversationModel.get_context(convo_id, 15)),
+        ("ConversationModel.get_message_counts", lambda: ConversationModel.get_message_counts([convo_id])),
+        ("ConversationModel.update_by_id", lambda: ConversationModel.update_by_id(convo_id, {"name": "Plan check"})),
+        ("ConversationModel.push_messages_bulk", lambda: ConversationModel.push_messages_bulk({convo_id: [{"message": "hi"}]})),
+        ("ConversationModel.claim_messages", lambda: ConversationModel.claim_messages(convo_id, 1)),
+        ("ConversationModel.restore_messages", lambda: ConversationModel.restore_messages(convo_id, [{"message": "hi"}])),
+        ("ConversationModel.push_summary", lambda: ConversationModel.push_summary(convo_id, {"content": "hi"})),
+        ("ConversationModel.claim_summaries", lambda: ConversationModel.claim_summaries(convo_id, 0, 1, 1)),
+        ("UserModel.get_by_id", lambda: UserModel.get_by_id(wa_id)),
+        ("UserModel.get_or_create", lambda: UserModel.get_or_create(wa_id, convo_id)),
+        ("UserModel.bulk_upsert", lambda: UserModel.bulk_upsert(convo_id, [{"wa_id": wa_id, "name": "Plan Check"}])),
+        ("UserModel.get_many", lambda: UserModel.get_many([wa_id])),
+        ("UserModel.set_name_if_missing", lambda: UserModel.set_name_if_missing(wa_id, convo_id, "Plan Check")),
+        ("UserModel.get_by_name", lambda: UserModel.get_by_name("Plan", convo_id)),
+        ("UserModel.get_by_convo_id", lambda: UserModel.get_by_convo_id(convo_id)),
+        ("ExpenseModel.get_by_convo_id", lambda: ExpenseModel.get_by_convo_id(convo_id)),
+        ("ExpenseModel.get_by_convo_id(include_settled)", lambda: ExpenseModel.get_by_convo_id(convo_id, include_settled=True)),
+        ("ExpenseModel.aggregate_net_balances", lambda: ExpenseModel.aggregate_net_balances(convo_id)),
+        ("ExpenseModel.get_history", lambda: ExpenseModel.get_history(convo_id, 5)),
+        ("ExpenseModel.get_history(before)", lambda: ExpenseModel.get_history(convo_id, 5, before=expense_id)),
+        ("ExpenseModel.mark_settled_many(ids)", lambda: ExpenseModel.mark_settled_many(convo_id, "plancheck", [expense_id])),
+        ("ExpenseModel.get_by_settlement", lambda: ExpenseModel.get_by_settlement(convo_id, "plancheck")),
+        ("ExpenseModel.get_by_id", lambda: ExpenseModel.get_by_id(expense_id)),
+        ("ExpenseModel.mark_settled", lambda: ExpenseModel.mark_settled(expense_id)),
+        ("ExpenseModel.mark_settled_many", lambda: ExpenseModel.mark_settled_many(convo_id, "plancheck")),
+        ("BalanceLedgerModel.replace", lambda: BalanceLedgerModel.replace(convo_id, {wa_id: {"name": "Plan Check", "cents": 0}}, 0, 0, 0)),
+        ("BalanceLedgerModel.apply_deltas", lambda: BalanceLedgerModel.apply_deltas(convo_id, {wa_id: {"name": "Plan Check", "cents": 100}}, 100, 1)),
+        ("BalanceLedgerModel.get_by_convo_id", lambda: BalanceLedgerModel.get_by_convo_id(convo_id)),
+        ("BalanceLedgerModel.get_user_view", lambda: BalanceLedgerModel.get_user_view(convo_id, wa_id)),
+        ("BalanceLedgerModel.drop_zero_entries", lambda: BalanceLedgerModel.drop_zero_entries(convo_id, [wa_id])),
+        ("BalanceLedgerModel.save_plan", lambda: BalanceLedgerModel.save_plan(convo_id, 1, [])),
+        ("BalanceLedgerModel.get_version", lambda: BalanceLedgerModel.get_version(convo_id)),
+        ("ReminderModel.get_by_id", lambda: ReminderModel.get_by_id(reminder_id)),
+        ("ReminderModel.get_by_chat_id", lambda: ReminderModel.get_by_chat_id(convo_id, ["scheduled", "pending"])),
+        ("ReminderModel.get_due_reminders", lambda: ReminderModel.get_due_reminders()),
+        ("ReminderModel.get_pending_reminders_due_soon", lambda: list(ReminderModel.get_pending_reminders_due_soon())),
+        ("ReminderModel.get_scheduled_reminders", lambda: list(ReminderModel.get_scheduled_reminders(datetime.datetime.utcnow()))),
+        ("ReminderModel.get_recurring_tails", lambda: list(ReminderModel.get_recurring_tails(13))),
+        ("ReminderModel.link_occurrences", lambda: ReminderModel.link_occurrences({reminder_id: "plancheck-next"})),
+        ("ReminderModel.activate_pending", lambda: ReminderModel.activate_pending()),
+        ("ReminderModel.move_many_to_service_bus", lambda: ReminderModel.move_many_to_service_bus([reminder_id])),
+        ("ReminderModel.get_series_tail", lambda: ReminderModel.get_series_tail(reminder_id)),
+        ("ReminderModel.add_message_variants", lambda: ReminderModel.add_message_variants(reminder_id, ["Check plans"])),
+        ("ReminderModel.cancel_following", lambda: ReminderModel.cancel_following(reminder_id)),
+        ("ReminderModel.claim_many", lambda: ReminderModel.claim_many([reminder_id], 300)),
+        ("ReminderModel.claim_many(chat_windows)", lambda: ReminderModel.claim_many(
+            [reminder_id], 300, {convo_id: datetime.datetime.utcnow()})),
+        ("ReminderModel.claim_overdue_pending", lambda: ReminderModel.claim_overdue_pending(300)),
+        ("ReminderModel.get_leased", lambda: ReminderModel.get_leased([reminder_id])),
+        ("ReminderModel.recover_expired_leases", lambda: ReminderModel.recover_expired_leases()),
+        ("ReminderModel.mark_many_as_sent", lambda: ReminderModel.mark_many_as_sent({reminder_id: "plancheck-token"})),
+        ("ReminderModel.release_for_retry", lambda: ReminderModel.release_for_retry({reminder_id: "plan check"}, {reminder_id: datetime.datetime.utcnow()}, {reminder_id: "plancheck-token"})),
+        ("ReminderModel.mark_many_as_failed", lambda: ReminderModel.mark_many_as_failed({reminder_id: "plan check"}, {reminder_id: "plancheck-token"})),
+        ("ReminderModel.update_by_id", lambda: ReminderModel.update_by_id(reminder_id, {"message": "Check plans"})),
+        ("SummaryArchiveModel.get_recent", lambda: SummaryArchiveModel.get_recent(convo_id, 100)),
+        ("SummaryArchiveModel.get_contents", lambda: SummaryArchiveModel.get_contents(convo_id)),
+        ("ExpenseModel.delete_by_id", lambda: ExpenseModel.delete_by_id(expense_id)),
+        ("ReminderModel.delete_by_id", lambda: ReminderModel.delete_by_id(reminder_id)),
+    ]
+
+def run(uri: str = MONGO_URI) -> int:
+    recorder = CommandRecorder()
+    client = MongoClient(uri, event_listeners=[recorder])
+    database = client[f"{DB_NAME}-plancheck"]
+    client.drop_database(database.name)
+
+    # Point the models at the scratch database
+    originals = {}
+    for model in model_classes():
+        originals[model] = model.collection
+        model.collection = database[model.collection.name]
+
+    failures = []
+    try:
+        ensure_indexes(database)
+        ids = seed()
+        for label, check in query_checks(ids):
+            recorder.commands.clear()
+            check()
+            for command in list(recorder.commands):
+                explain = database.command({"explain": command, "verbosity": "queryPlanner"})
+                if find_collscans(winning_plan(explain)):
+                    failures.append(label)
+                    print(f"COLLSCAN  {label}: {command}")
+                    break
+            else:
+                print(f"ok        {label}")
+    finally:
+        for model, collection in originals.items():
+            model.collection = collection
+        client.drop_database(database.name)
+        client.close()
+
+    if failures:
+        print(f"\n{len(failures)} model queries fall back to a collection scan")
+        return 1
+    print("\nAll model queries use an index")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -15,7 +15,7 @@ PROMPTS = {
       - Your responses should not be repetitive or appear as dumb/boring.
       - You can express emotions, moods, or reactions using the `send_reaction` tool. These will appear as reactions (stickers) without you needing to mention them. You will receive the content description which you can use to generate a friendly, chatty caption message.
       - Use reactions like a real person would: naturally, not too often, and always with good timing and relevance. Be intelligent on when and what to use.
-      - You can set reminders for group members using the `schedule_reminder` tool. When someone asks to be reminded about something, use this tool with the reminder message, and scheduled time. Support both one-time and recurring reminders (daily, weekly, monthly).
+      - You can set reminders for group members using the `schedule_reminder` tool. When someone asks to be reminded about something, use this tool with the reminder message, and scheduled time. Support both one-time and recurring reminders (e.g. daily, every Monday and Thursday, monthly for 6 months) using an RRULE recurrence_pattern.
       - When asked for the active reminders, make sure to include the id of the reminder in the message.
       - You can manage group expenses using expense tools. When someone mentions spending money or asks about expenses, you can:
         * Add expenses using `add_expense` tool when members report what they paid
@@ -34,6 +34,10 @@ PROMPTS = {
   "SUMMARY": """
     Your role is to summarize the interaction that took place between members of the group. The summary will serve as a memory reference for another AI system. Keep the summary concise. Make sure to mention the sender's name in the summary instead of general reference. Your output must always be a valid JSON object with the following content, participants, and dates. Messages with random number represents a media message that was sent.
   """,
+  "SUMMARY_COMPACTION": """
+    You will be given a list of consecutive summaries of a WhatsApp group conversation, ordered from oldest to newest. Merge them into a single summary that will serve as long-term memory for another AI system.
+    Keep the facts that matter later: decisions, plans, recurring topics, preferences, and who said or did what. Drop small talk. Keep it concise and mention participants by name. Use the start date of the first summary and the end date of the last one. Your output must always be a valid JSON object with content, participants, and dates.
+  """,
   "REACTION_CHOICE_MAKER": """
     You are provided with the descriptions of the available stickers and their indices. Your role is to find the most suitable reaction based on the conversation context and the emotional tone. Remember that you are an entertainment-focused bot engaging with WhatsApp group members in a fun, human-like way.
 
@@ -46,6 +50,12 @@ PROMPTS = {
     Your role is to act as a message generator for a recurring reminder.
     You will be given the last reminder message that was sent. Based on it, generate a new reminder message using the same core information, but with different wording or tone to keep it fresh.
     If the reminder includes a countdown, you must decrement the countdown by 1 in the new message.
+  """,
+  "REMINDER_SERIES": """
+    Your role is to act as a message generator for a recurring reminder.
+    You will be given the last reminder message that was sent and a count. Generate exactly that many upcoming reminder messages, in the order they will be sent, each keeping the same core information with different wording or tone to keep it fresh.
+    If the reminder includes a countdown, decrement it by 1 in every message compared to the one before it.
+    - Make sure to return valid JSON without backticks or special chars.
   """
 }
 
@@ -93,5 +103,42 @@ SCHEMAS = {
               description = "The date of the last message included in this summary.",
           )
       }
+  ),
+  "SUMMARY_COMPACTION": genai.types.Schema(
+      type = genai.types.Type.OBJECT,
+      required=['content', 'participants', 'start_date', 'end_date'],
+      properties = {
+          "content": genai.types.Schema(
+              type = genai.types.Type.STRING,
+              description = "A concise summary covering every summary included in this interaction.",
+          ),
+          "participants": genai.types.Schema(
+              type = genai.types.Type.ARRAY,
+              items = genai.types.Schema(
+                  type = genai.types.Type.STRING,
+                  description = "The name of the participant involved in the conversation.",
+              ),
+              description="A list of unique participants across the included summaries.",
+          ),
+          "start_date": genai.types.Schema(
+              type = genai.types.Type.STRING,
+              description = "The start date of the earliest summary included.",
+          ),
+          "end_date": genai.types.Schema(
+              type = genai.types.Type.STRING,
+              description = "The end date of the latest summary included.",
+          )
+      }
+  ),
+  "REMINDER_SERIES": genai.types.Schema(
+      type = genai.types.Type.OBJECT,
+      required=['messages'],
+      properties = {
+          "messages": genai.types.Schema(
+              type = genai.types.Type.ARRAY,
+              items = genai.types.Schema(type = genai.types.Type.STRING),
+              description = "The upcoming reminder messages, in sending order.",
+          )
+      }
   )
 }
\ No newline at end of file
@@ -0,0 +1,128 @@
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from buspal_backend.db.mongo import db
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+def ledger_key(user_id: str) -> str:
+    """Encode a user id for use as a field name (Mongo paths cannot contain '.' or start with '$')."""
+    return user_id.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+class BalanceLedgerModel:
+    """
+    Materialized per-chat balances of unsettled expenses, in integer cents.
+
+    One document per chat:
+        {convo_id, entries: {<ledger_key>: {user_id, name, cents}}, total_cents, expense_count, version,
+         plan, plan_version}
+    Positive cents should be received, negative cents should be paid. `version`
+    is incremented on every change; `plan` holds the settlement transactions
+    computed at `plan_version` and is only valid while the two match.
+    """
+    collection = db.balances
+
+    @classmethod
+    def get_by_convo_id(cls, convo_id: str) -> Optional[Dict[str, Any]]:
+        return cls.collection.find_one({"convo_id": convo_id}, {"_id": 0})
+
+    @classmethod
+    def get_version(cls, convo_id: str) -> Optional[int]:
+        ledger = cls.collection.find_one({"convo_id": convo_id}, {"_id": 0, "version": 1})
+        return ledger.get("version", 0) if ledger else None
+
+    @classmethod
+    def get_user_view(cls, convo_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """One user's entry plus the cached plan transactions involving them."""
+        user = {"$literal": user_id}
+        involves_user = {"$or": [{"$eq": ["$$t.from", user]}, {"$eq": ["$$t.to", user]}]}
+        return cls.collection.find_one(
+            {"convo_id": convo_id},
+            {
+                "_id": 0,
+                "version": 1,
+                "plan_version": 1,
+                "expense_count": 1,
+                f"entries.{ledger_key(user_id)}": 1,
+                "plan": {"$filter": {"input": {"$ifNull": ["$plan", []]}, "as": "t", "cond": involves_user}}
+            }
+        )
+
+    @classmethod
+    def save_plan(cls, convo_id: str, version: int, transactions: List[Dict[str, Any]]) -> bool:
+        """Cache a settlement plan computed at `version`. Ignored if the ledger has changed since."""
+        result = cls.collection.update_one(
+            {"convo_id": convo_id, "version": version},
+            {"$set": {"plan": transactions, "plan_version": version}}
+        )
+        return result.modified_count > 0
+
+    @classmethod
+    def apply_deltas(cls, convo_id: str, deltas: Dict[str, Dict[str, Any]], total_cents: int, expense_count: int) -> None:
+        """
+        Apply balance changes in one atomic update, creating the ledger on the chat's first expense.
+
+        deltas: {user_id: {"name": str, "cents": int}}
+        """
+        inc = {"total_cents": total_cents, "expense_count": expense_count, "version": 1}
+        set_fields: Dict[str, Any] = {"updated_at": datetime.now(timezone.utc)}
+        for user_id, delta in deltas.items():
+            key = ledger_key(user_id)
+            inc[f"entries.{key}.cents"] = delta["cents"]
+            set_fields[f"entries.{key}.user_id"] = user_id
+            if delta.get("name"):
+                set_fields[f"entries.{key}.name"] = delta["name"]
+        update = {"$inc": inc, "$set": set_fields}
+        try:
+            cls.collection.update_one({"convo_id": convo_id}, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost the insert race to a concurrent first expense, the ledger exists now
+            cls.collection.update_one({"convo_id": convo_id}, update)
+
+    @classmethod
+    def replace(cls, convo_id: str, entries: Dict[str, Dict[str, Any]], total_cents: int, expense_count: int,
+                expected_version: Optional[int]) -> bool:
+        """
+        Overwrite the ledger with freshly computed balances. entries: {user_id: {"name", "cents"}}
+
+        Only succeeds while the ledger is still at `expected_version` (None: the ledger
+        must not exist yet), so deltas applied since the balances were computed are
+        never overwritten. Returns False on conflict.
+        """
+        fields = {
+            "entries": {
+                ledger_key(user_id): {"user_id": user_id, "name": entry.get("name", ""), "cents": entry["cents"]}
+                for user_id, entry in entries.items()
+            },
+            "total_cents": total_cents,
+            "expense_count": expense_count,
+            "updated_at": datetime.now(timezone.utc)
+        }
+        if expected_version is None:
+            try:
+                cls.collection.insert_one({"convo_id": convo_id, **fields, "version": 1})
+            except DuplicateKeyError:
+                return False
+            return True
+        result = cls.collection.update_one(
+            {"convo_id": convo_id, "version": expected_version},
+            {"$set": fields, "$inc": {"version": 1}}
+        )
+        return result.matched_count > 0
+
+    @classmethod
+    def drop_zero_entries(cls, convo_id: str, user_ids: List[str]) -> int:
+        """
+        Remove the entries of `user_ids` whose balance is zero. Each removal only matches
+        while the entry is still zero, so a concurrent delta is never lost. Returns the
+        number of entries removed.
+        """
+        if not user_ids:
+            return 0
+        result = cls.collection.bulk_write([
+            UpdateOne(
+                {"convo_id": convo_id, f"entries.{ledger_key(user_id)}.cents": 0},
+                {"$unset": {f"entries.{ledger_key(user_id)}": ""}}
+            )
+            for user_id in user_ids
+        ], ordered=False)
+        return result.modified_count
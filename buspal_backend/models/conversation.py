@@ -1,4 +1,7 @@
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from buspal_backend.db.mongo import db
 from buspal_backend.types.enums import AIMode
 class ConversationModel:
@@ -21,10 +24,136 @@ class ConversationModel:
     def get_by_id(cls, id) -> Optional[dict[str, Any]]:
         return cls.collection.find_one({"convo_id": id})
 
+    @classmethod
+    def get_or_create(cls, convo_id, mode=AIMode.BUDDY) -> Dict[str, Any]:
+        """
+        Atomically fetch the conversation header, creating the document on first contact.
+
+        Backed by the unique `convo_id` index, so concurrent first messages create
+        exactly one document. Newly created conversations have no name yet.
+        """
+        try:
+            return cls._upsert(convo_id, mode)
+        except DuplicateKeyError:
+            # Lost the insert race to a concurrent upsert, the document exists now
+            return cls._upsert(convo_id, mode)
+
+    @classmethod
+    def _upsert(cls, convo_id, mode: AIMode) -> Dict[str, Any]:
+        return cls.collection.find_one_and_update(
+            {"convo_id": convo_id},
+            {"$setOnInsert": {
+                "name": None,
+                "messages": [],
+                "summaries": [],
+                "receipts": [],
+                "mode": mode.value,
+            }},
+            projection={"_id": 0, "convo_id": 1, "name": 1, "mode": 1, "roster_synced_at": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    @classmethod
+    def set_name_if_missing(cls, convo_id, name: str):
+        return cls.collection.update_one({"convo_id": convo_id, "name": None}, {"$set": {"name": name}})
+
+    @classmethod
+    def mark_roster_synced(cls, convo_id):
+        return cls.update_by_id(convo_id, {"roster_synced_at": datetime.now(timezone.utc)})
+
+    @classmethod
+    def get_header(cls, convo_id) -> Optional[Dict[str, Any]]:
+        """Fetch the small identity fields only, without messages or summaries."""
+        return cls.collection.find_one({"convo_id": convo_id}, {"_id": 0, "convo_id": 1, "name": 1, "mode": 1, "roster_synced_at": 1})
+
+    @classmethod
+    def get_context(cls, convo_id, summary_count: int) -> Optional[Dict[str, Any]]:
+        """Fetch the last `summary_count` summaries and the compacted digests."""
+        return cls.collection.find_one(
+            {"convo_id": convo_id},
+            {"_id": 0, "summaries": {"$slice": -summary_count}, "digests": 1}
+        )
+
     @classmethod
     def update_by_id(cls, convo_id, update_fields: dict, type: str = "$set"):
       result = cls.collection.update_one(
           {"convo_id": convo_id},
           {type: update_fields}
       )
-      return result
\ No newline at end of file
+      return result
+
+    @classmethod
+    def push_messages_bulk(cls, appends: Dict[str, List[Dict[str, Any]]]):
+        """Append messages to many conversations in one round-trip, preserving per-chat order."""
+        operations = [
+            UpdateOne({"convo_id": convo_id}, {"$push": {"messages": {"$each": messages}}})
+            for convo_id, messages in appends.items()
+        ]
+        return cls.collection.bulk_write(operations, ordered=False)
+
+    @classmethod
+    def get_message_counts(cls, convo_ids: List[str]) -> Dict[str, int]:
+        cursor = cls.collection.find(
+            {"convo_id": {"$in": convo_ids}},
+            {"_id": 0, "convo_id": 1, "message_count": {"$size": {"$ifNull": ["$messages", []]}}}
+        )
+        return {doc["convo_id"]: doc["message_count"] for doc in cursor}
+
+    @classmethod
+    def claim_messages(cls, convo_id, count: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Atomically remove and return the oldest `count` messages.
+
+        Returns None when fewer than `count` messages are stored. Messages pushed
+        concurrently stay in the document since the claim only drops the slice it returns.
+        """
+        return cls._claim_head(convo_id, "messages", count)
+
+    @classmethod
+    def restore_messages(cls, convo_id, messages: List[Dict[str, Any]]):
+        """Put claimed messages back at the front of the queue (e.g. after a failed summary)."""
+        return cls._restore_head(convo_id, "messages", messages)
+
+    @staticmethod
+    def summary_field(level: int) -> str:
+        """Level 0 summaries live in `summaries`, compacted levels in `digests.<level>`."""
+        return "summaries" if level == 0 else f"digests.{level}"
+
+    @classmethod
+    def push_summary(cls, convo_id, summary: Dict[str, Any], level: int = 0, prepend: bool = False):
+        """Append a summary at the given level, or put it in front of the level when `prepend` is set."""
+        field = cls.summary_field(level)
+        if prepend:
+            return cls._restore_head(convo_id, field, [summary])
+        return cls.update_by_id(convo_id, {field: summary}, "$push")
+
+    @classmethod
+    def claim_summaries(cls, convo_id, level: int, count: int, min_size: int) -> Optional[List[Dict[str, Any]]]:
+        """Atomically remove and return the oldest `count` summaries of a level holding at least `min_size`."""
+        return cls._claim_head(convo_id, cls.summary_field(level), count, min_size)
+
+    @classmethod
+    def restore_summaries(cls, convo_id, level: int, summaries: List[Dict[str, Any]]):
+        return cls._restore_head(convo_id, cls.summary_field(level), summaries)
+
+    @classmethod
+    def _claim_head(cls, convo_id, field: str, count: int, min_size: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        result = cls.collection.find_one_and_update(
+            {"convo_id": convo_id, f"{field}.{(min_size or count) - 1}": {"$exists": True}},
+            [{"$set": {field: {"$slice": [f"${field}", count, {"$add": [{"$size": f"${field}"}, 1]}]}}}],
+            projection={"_id": 0, field: {"$slice": count}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not result:
+            return None
+        for key in field.split("."):
+            result = result.get(key, {})
+        return result or None
+
+    @classmethod
+    def _restore_head(cls, convo_id, field: str, items: List[Dict[str, Any]]):
+        return cls.collection.update_one(
+            {"convo_id": convo_id},
+            {"$push": {field: {"$each": items, "$position": 0}}}
+        )
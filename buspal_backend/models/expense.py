@@ -1,6 +1,6 @@
 from buspal_backend.db.mongo import db
 from datetime import datetime, timezone
-from typing import List, Dict
+from typing import List, Dict, Optional
 from dataclasses import dataclass
 
 @dataclass
@@ -39,6 +39,90 @@ class ExpenseModel:
             query["is_settled"] = False
         return list(cls.collection.find(query).sort("created_at", -1))
     
+    @classmethod
+    def get_history(cls, convo_id: str, limit: int, before: Optional[str] = None) -> List[Dict]:
+        """
+        One page of expenses, newest first, including settled ones.
+
+        `before` is the id of the last expense of the previous page. Ids increase
+        with insertion time, so paging on `_id` walks the (convo_id, _id) index
+        and each page costs the same however long the chat's history is.
+        """
+        from bson import ObjectId
+        query = {"convo_id": convo_id}
+        if before:
+            query["_id"] = {"$lt": ObjectId(before)}
+        projection = {
+            "description": 1, "total_amount": 1, "payer_id": 1, "payer_name": 1,
+            "participants.name": 1, "created_at": 1, "is_settled": 1
+        }
+        return list(cls.collection.find(query, projection).sort("_id", -1).limit(limit))
+    
+    @classmethod
+    def mark_settled_many(cls, convo_id: str, settlement_id: str, expense_ids: Optional[List] = None):
+        """
+        Settle the given expenses, or every unsettled expense of the chat, with one update.
+
+        Each settled expense is tagged with `settlement_id`, so the caller can load
+        exactly the expenses it settled, even when another settlement runs concurrently.
+        """
+        from bson import ObjectId
+        query = {"convo_id": convo_id, "is_settled": False}
+        if expense_ids is not None:
+            query["_id"] = {"$in": [ObjectId(expense_id) for expense_id in expense_ids if ObjectId.is_valid(expense_id)]}
+        return cls.collection.update_many(
+            query,
+            {"$set": {"is_settled": True, "settled_at": datetime.now(timezone.utc), "settlement_id": settlement_id}}
+        )
+    
+    @classmethod
+    def get_by_settlement(cls, convo_id: str, settlement_id: str) -> List[Dict]:
+        """The expenses settled by one `mark_settled_many` call, with the fields balances need."""
+        return list(cls.collection.find(
+            {"convo_id": convo_id, "settlement_id": settlement_id},
+            {"total_amount": 1, "payer_id": 1, "payer_name": 1, "participants": 1}
+        ))
+    
+    @classmethod
+    def aggregate_net_balances(cls, convo_id: str, include_settled: bool = False) -> Dict:
+        """
+        Compute per-user net balances and totals server-side.
+
+        Returns {"balances": {user_id: {"amount", "name"}}, "total_amount": float, "expense_count": int}
+        without transferring any expense documents.
+        """
+        match = {"convo_id": convo_id}
+        if not include_settled:
+            match["is_settled"] = False
+        pipeline = [
+            {"$match": match},
+            {"$facet": {
+                "balances": [
+                    # One entry for the payer (+total) and one per participant (-share)
+                    {"$project": {"entries": {"$concatArrays": [
+                        [{"user_id": "$payer_id", "name": "$payer_name", "amount": "$total_amount"}],
+                        {"$map": {
+                            "input": "$participants",
+                            "as": "p",
+                            "in": {"user_id": "$$p.user_id", "name": "$$p.name", "amount": {"$multiply": [-1, "$$p.share_amount"]}}
+                        }}
+                    ]}}},
+                    {"$unwind": "$entries"},
+                    {"$group": {"_id": "$entries.user_id", "amount": {"$sum": "$entries.amount"}, "name": {"$last": "$entries.name"}}}
+                ],
+                "totals": [
+                    {"$group": {"_id": None, "total_amount": {"$sum": "$total_amount"}, "expense_count": {"$sum": 1}}}
+                ]
+            }}
+        ]
+        result = next(cls.collection.aggregate(pipeline), {"balances": [], "totals": []})
+        totals = result["totals"][0] if result["totals"] else {}
+        return {
+            "balances": {row["_id"]: {"amount": row["amount"], "name": row["name"]} for row in result["balances"]},
+            "total_amount": totals.get("total_amount", 0),
+            "expense_count": totals.get("expense_count", 0)
+        }
+
     @classmethod
     def get_by_id(cls, expense_id):
         from bson import ObjectId
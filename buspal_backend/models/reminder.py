@@ -1,13 +1,25 @@
 from buspal_backend.db.mongo import db
+from buspal_backend.config.settings import REMINDER_RETENTION_DAYS
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
 import datetime
-from typing import Optional, List, Dict, Any, Union
+import uuid
+from typing import Optional, List, Dict, Any, Iterator, Union
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Statuses a reminder does not leave; reminders in them are flagged `finished` and
+# expire through the TTL index on expires_at
+FINAL_STATUSES = ["sent", "failed", "cancelled"]
 
 class ReminderModel:
     collection = db.reminders
+    retention = datetime.timedelta(days=REMINDER_RETENTION_DAYS)
 
     @classmethod
     def create(cls, reminder_id: str, chat_id: str, message: str, scheduled_time: datetime.datetime, 
-               recurrence_pattern: Optional[str] = None, status: str = "scheduled"):
+               recurrence_pattern: Optional[str] = None, status: str = "scheduled",
+               message_variants: Optional[List[str]] = None, series_id: Optional[str] = None):
         """
         Create a new reminder in the database.
         
@@ -16,24 +28,61 @@ class ReminderModel:
             chat_id: WhatsApp chat ID to send reminder to
             message: Reminder message text
             scheduled_time: When to send the reminder (UTC)
-            recurrence_pattern: Optional recurrence pattern (daily, weekly, monthly)
-            status: Reminder status (scheduled, sent, failed, cancelled)
+            recurrence_pattern: Optional recurrence rule (RRULE string or daily, weekly, monthly, yearly)
+            status: Reminder status (pending, scheduled, sending, sent, failed, cancelled)
+            message_variants: Pre-generated wordings for the next occurrences of a recurring reminder
+            series_id: ID of the first reminder of a recurring series (defaults to reminder_id)
         
         Returns:
             dict: Created reminder document
         """
-        reminder = {
+        reminder = cls._document(reminder_id, chat_id, message, scheduled_time, recurrence_pattern,
+                                 status, message_variants, series_id)
+        cls.collection.insert_one(reminder)
+        return reminder
+
+    @classmethod
+    def create_many(cls, reminders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Create several reminders with one insert. Reminders whose ID already
+        exists are skipped, so inserting the same occurrences twice is harmless.
+        
+        Args:
+            reminders: Keyword arguments of create() for each reminder
+        
+        Returns:
+            List of the reminder documents that were created
+        """
+        if not reminders:
+            return []
+        documents = [cls._document(**reminder) for reminder in reminders]
+        try:
+            cls.collection.insert_many(documents, ordered=False)
+            return documents
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+            return [document for index, document in enumerate(documents) if index not in duplicates]
+
+    @staticmethod
+    def _document(reminder_id: str, chat_id: str, message: str, scheduled_time: datetime.datetime,
+                  recurrence_pattern: Optional[str] = None, status: str = "scheduled",
+                  message_variants: Optional[List[str]] = None, series_id: Optional[str] = None) -> Dict[str, Any]:
+        now = datetime.datetime.utcnow()
+        return {
             "_id": reminder_id,
             "chat_id": chat_id,
             "message": message,
             "scheduled_time": scheduled_time,
             "recurrence_pattern": recurrence_pattern,
             "status": status,
-            "created_at": datetime.datetime.utcnow(),
-            "updated_at": datetime.datetime.utcnow()
+            "message_variants": message_variants or [],
+            "series_id": series_id or reminder_id,
+            "created_at": now,
+            "updated_at": now
         }
-        cls.collection.insert_one(reminder)
-        return reminder
 
     @classmethod
     def get_by_id(cls, reminder_id: str) -> Optional[Dict[str, Any]]:
@@ -102,6 +151,48 @@ class ReminderModel:
         )
         return result.modified_count > 0
 
+    @classmethod
+    def add_message_variants(cls, reminder_id: str, variants: List[str]) -> bool:
+        """
+        Append pre-generated wordings to a reminder.
+        
+        Args:
+            reminder_id: Reminder ID to update
+            variants: Wordings for the following occurrences, in order
+        
+        Returns:
+            bool: True if update was successful
+        """
+        result = cls.collection.update_one(
+            {"_id": reminder_id},
+            {
+                "$push": {"message_variants": {"$each": variants}},
+                "$set": {"updated_at": datetime.datetime.utcnow()}
+            }
+        )
+        return result.modified_count > 0
+
+    @classmethod
+    def get_series_tail(cls, reminder_id: str) -> str:
+        """
+        Follow `next_occurrence_id` links to the latest occurrence created for a series.
+        
+        Args:
+            reminder_id: Any occurrence of the series
+        
+        Returns:
+            str: ID of the last linked occurrence, `reminder_id` itself if none follows it
+        """
+        tail, next_id = reminder_id, reminder_id
+        seen = set()
+        while next_id and next_id not in seen:
+            reminder = cls.collection.find_one({"_id": next_id}, {"next_occurrence_id": 1})
+            if not reminder:
+                break
+            seen.add(next_id)
+            tail, next_id = next_id, reminder.get("next_occurrence_id")
+        return tail
+
     @classmethod
     def cancel_reminder(cls, reminder_id: str) -> bool:
         """
@@ -113,44 +204,228 @@ class ReminderModel:
         Returns:
             bool: True if cancellation was successful
         """
+        now = datetime.datetime.utcnow()
         return cls.update_by_id(reminder_id, {
             "status": "cancelled",
-            "cancelled_at": datetime.datetime.utcnow()
+            "cancelled_at": now,
+            "finished": True,
+            "expires_at": now + cls.retention
         })
 
     @classmethod
-    def mark_as_sent(cls, reminder_id: str) -> bool:
+    def cancel_following(cls, reminder_id: str) -> List[str]:
         """
-        Mark a reminder as sent.
+        Cancel the occurrences of a recurring series scheduled after a reminder.
         
         Args:
-            reminder_id: Reminder ID to mark as sent
+            reminder_id: Reminder ID whose later occurrences are cancelled
         
         Returns:
-            bool: True if update was successful
+            List of the cancelled reminder IDs
         """
-        return cls.update_by_id(reminder_id, {
-            "status": "sent",
-            "sent_at": datetime.datetime.utcnow()
-        })
+        reminder = cls.collection.find_one({"_id": reminder_id}, {"series_id": 1, "scheduled_time": 1})
+        if not reminder or not reminder.get("series_id"):
+            return []
+        query = {
+            "series_id": reminder["series_id"],
+            "status": {"$in": ["scheduled", "pending"]},
+            "scheduled_time": {"$gt": reminder["scheduled_time"]}
+        }
+        reminder_ids = [doc["_id"] for doc in cls.collection.find(query, {"_id": 1})]
+        if reminder_ids:
+            now = datetime.datetime.utcnow()
+            cls.collection.update_many(
+                {"_id": {"$in": reminder_ids}, "status": {"$in": ["scheduled", "pending"]}},
+                {"$set": {"status": "cancelled", "cancelled_at": now, "finished": True, "expires_at": now + cls.retention, "updated_at": now}}
+            )
+        return reminder_ids
 
     @classmethod
-    def mark_as_failed(cls, reminder_id: str, error: str) -> bool:
+    def claim_many(cls, reminder_ids: List[str], lease_seconds: int,
+                   chat_windows: Optional[Dict[str, datetime.datetime]] = None) -> List[Dict[str, Any]]:
         """
-        Mark a reminder as failed.
+        Atomically move reminders from scheduled to sending, leased for `lease_seconds`.
+        A reminder whose lease has expired (its sender died) can be claimed again.
+        
+        The reminders are claimed with one update that tags them with a claim
+        token, then read back by that token, so each reminder is claimed by
+        exactly one caller however many race for it.
         
         Args:
-            reminder_id: Reminder ID to mark as failed
-            error: Error message
+            reminder_ids: Reminder IDs to claim
+            lease_seconds: How long the claim is held before another instance may take over
+            chat_windows: Also claim every reminder of these chats due by the given UTC time,
+                except those released for a retry whose `retry_at` has not come yet
         
         Returns:
-            bool: True if update was successful
+            The claimed reminders, earliest first. Reminders that are not claimable
+            (already claimed, sent, cancelled or missing) are left out.
         """
-        return cls.update_by_id(reminder_id, {
-            "status": "failed",
-            "error": error,
-            "failed_at": datetime.datetime.utcnow()
-        })
+        now = datetime.datetime.utcnow()
+        targets = [{"_id": {"$in": reminder_ids}}] if reminder_ids else []
+        targets += [
+            {"chat_id": chat_id, "scheduled_time": {"$lte": window_end}, "retry_at": {"$not": {"$gt": now}}}
+            for chat_id, window_end in (chat_windows or {}).items()
+        ]
+        if not targets:
+            return []
+        claim_token = str(uuid.uuid4())
+        cls.collection.update_many(
+            {
+                "$or": targets,
+                "status": {"$in": ["scheduled", "sending"]},
+                "$nor": [{"status": "sending", "lease_expires_at": {"$gt": now}}]
+            },
+            cls._claim_update(claim_token, now, lease_seconds)
+        )
+        return list(cls.collection.find({"$or": targets, "claim_token": claim_token}).sort("scheduled_time", 1))
+
+    @classmethod
+    def claim_overdue_pending(cls, lease_seconds: int) -> List[Dict[str, Any]]:
+        """
+        Atomically move every overdue pending reminder to sending, leased for `lease_seconds`.
+        Same claim token scheme as `claim_many`, so overlapping daily runs send each reminder once.
+        
+        Args:
+            lease_seconds: How long the claim is held before the reminder is recovered
+        
+        Returns:
+            The claimed reminders, earliest first
+        """
+        now = datetime.datetime.utcnow()
+        claim_token = str(uuid.uuid4())
+        cls.collection.update_many(
+            {"status": "pending", "scheduled_time": {"$lte": now}},
+            cls._claim_update(claim_token, now, lease_seconds)
+        )
+        return list(cls.collection.find({
+            "status": "sending",
+            "scheduled_time": {"$lte": now},
+            "claim_token": claim_token
+        }).sort("scheduled_time", 1))
+
+    @staticmethod
+    def _claim_update(claim_token: str, now: datetime.datetime, lease_seconds: int) -> Dict[str, Any]:
+        return {
+            "$set": {
+                "status": "sending",
+                "claim_token": claim_token,
+                "claimed_at": now,
+                "lease_expires_at": now + datetime.timedelta(seconds=lease_seconds),
+                "updated_at": now
+            },
+            "$unset": {"retry_at": ""},
+            "$inc": {"attempts": 1}
+        }
+
+    @classmethod
+    def recover_expired_leases(cls) -> int:
+        """
+        Return reminders stuck in sending past their lease to pending, so the
+        overdue dispatcher delivers them.
+        
+        Returns:
+            int: Number of reminders recovered
+        """
+        now = datetime.datetime.utcnow()
+        result = cls.collection.update_many(
+            {"status": "sending", "lease_expires_at": {"$lte": now}},
+            {"$set": {"status": "pending", "updated_at": now}, "$unset": {"lease_expires_at": ""}}
+        )
+        return result.modified_count
+
+    @staticmethod
+    def _held_by(reminder_id: str, claim_tokens: Dict[str, str]) -> Dict[str, Any]:
+        """Filter matching a reminder only while the claim it was sent under still holds it."""
+        return {"_id": reminder_id, "claim_token": claim_tokens[reminder_id], "status": "sending"}
+
+    @classmethod
+    def mark_many_as_sent(cls, claim_tokens: Dict[str, str]) -> int:
+        """
+        Mark several reminders as sent, with one update per claim.
+        
+        Only reminders still held by the claim they were sent under are updated, so
+        a sender whose lease expired and was taken over never overwrites the result
+        of the instance that took over.
+        
+        Args:
+            claim_tokens: Claim token each delivered reminder was claimed with, keyed by reminder ID
+        
+        Returns:
+            int: Number of reminders updated
+        """
+        if not claim_tokens:
+            return 0
+        by_claim: Dict[str, List[str]] = {}
+        for reminder_id, claim_token in claim_tokens.items():
+            by_claim.setdefault(claim_token, []).append(reminder_id)
+        now = datetime.datetime.utcnow()
+        result = cls.collection.bulk_write([
+            UpdateMany(
+                {"_id": {"$in": reminder_ids}, "claim_token": claim_token, "status": "sending"},
+                {"$set": {"status": "sent", "sent_at": now, "finished": True, "expires_at": now + cls.retention, "updated_at": now}}
+            )
+            for claim_token, reminder_ids in by_claim.items()
+        ], ordered=False)
+        return result.modified_count
+
+    @classmethod
+    def mark_many_as_failed(cls, errors: Dict[str, str], claim_tokens: Dict[str, str]) -> int:
+        """
+        Mark several reminders as failed in one bulk write, if still held by their claim.
+        
+        Args:
+            errors: Error message keyed by reminder ID
+            claim_tokens: Claim token each reminder was claimed with, keyed by reminder ID
+        
+        Returns:
+            int: Number of reminders updated
+        """
+        if not errors:
+            return 0
+        now = datetime.datetime.utcnow()
+        result = cls.collection.bulk_write([
+            UpdateOne(
+                cls._held_by(reminder_id, claim_tokens),
+                {"$set": {"status": "failed", "error": error, "failed_at": now,
+                          "finished": True, "expires_at": now + cls.retention, "updated_at": now}}
+            )
+            for reminder_id, error in errors.items()
+        ], ordered=False)
+        return result.modified_count
+
+    @classmethod
+    def release_for_retry(cls, errors: Dict[str, str], retry_at: Dict[str, datetime.datetime],
+                          claim_tokens: Dict[str, str]) -> int:
+        """
+        Return reminders whose send failed to scheduled so they can be delivered again.
+        Until `retry_at` they are not picked up with other reminders of their chat.
+        Reminders no longer held by their claim (e.g. already sent by an instance that
+        took over an expired lease) are left as they are.
+        
+        Args:
+            errors: Error message of the failed attempt keyed by reminder ID
+            retry_at: UTC time each reminder is retried at, keyed by reminder ID
+            claim_tokens: Claim token each reminder was claimed with, keyed by reminder ID
+        
+        Returns:
+            int: Number of reminders updated
+        """
+        if not errors:
+            return 0
+        now = datetime.datetime.utcnow()
+        result = cls.collection.bulk_write([
+            UpdateOne(
+                cls._held_by(reminder_id, claim_tokens),
+                {
+                    "$set": {"status": "scheduled", "last_error": error, "retry_at": retry_at[reminder_id],
+                             "updated_at": now},
+                    "$unset": {"lease_expires_at": "", "claim_token": "", "finished": "", "expires_at": ""}
+                }
+            )
+            for reminder_id, error in errors.items()
+        ], ordered=False)
+        return result.modified_count
 
     @classmethod
     def delete_by_id(cls, reminder_id: str) -> bool:
@@ -167,23 +442,24 @@ class ReminderModel:
         return result.deleted_count > 0
 
     @classmethod
-    def get_pending_reminders_due_soon(cls, days_ahead: int = 7) -> List[Dict[str, Any]]:
+    def get_pending_reminders_due_soon(cls, days_ahead: int = 7, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
         """
-        Get pending reminders that are due within the specified number of days.
+        Stream pending reminders that are due within the specified number of days.
         These are candidates for moving to Service Bus.
         
         Args:
             days_ahead: Number of days to look ahead (default: 7)
+            batch_size: Documents fetched per cursor round-trip
         
         Returns:
-            List of pending reminder documents due within the timeframe
+            Cursor over pending reminder documents due within the timeframe
         """
         cutoff_time = datetime.datetime.utcnow() + datetime.timedelta(days=days_ahead)
         
-        return list(cls.collection.find({
-            "status": "pending",
-            "scheduled_time": {"$lte": cutoff_time}
-        }).sort("scheduled_time", 1))
+        return cls.collection.find(
+            {"status": "pending", "scheduled_time": {"$lte": cutoff_time}},
+            {"chat_id": 1, "message": 1, "recurrence_pattern": 1, "scheduled_time": 1, "created_at": 1, "message_variants": 1}
+        ).sort("scheduled_time", 1).batch_size(batch_size)
 
     @classmethod
     def move_to_service_bus(cls, reminder_id: str, service_bus_message_id: str = None) -> bool:
@@ -208,37 +484,147 @@ class ReminderModel:
         return cls.update_by_id(reminder_id, update_fields)
 
     @classmethod
-    def get_overdue_pending_reminders(cls) -> List[Dict[str, Any]]:
+    def get_scheduled_reminders(cls, until: datetime.datetime, after: Optional[datetime.datetime] = None,
+                                batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
         """
-        Get pending reminders that are already overdue (should have been sent).
-        These need to be processed immediately.
+        Stream the reminders due in a time window, used to load an in-process scheduler.
+        
+        Args:
+            until: Latest due time to include
+            after: Only include reminders due strictly after this time (default: include overdue ones)
+            batch_size: Documents fetched per cursor round-trip
         
         Returns:
-            List of overdue pending reminder documents
+            Cursor over reminder documents, earliest first. Scheduled reminders released
+            for a retry are due at their `retry_at`, and reminders left in sending are due
+            when their lease expires, so one whose sender died is delivered again.
+        """
+        window: Dict[str, Any] = {"$lte": until}
+        if after is not None:
+            window["$gt"] = after
+        return cls.collection.find(
+            {"$or": [
+                {"status": "scheduled", "scheduled_time": window},
+                {"status": "scheduled", "retry_at": window},
+                {"status": "sending", "lease_expires_at": window},
+            ]},
+            {"chat_id": 1, "message": 1, "recurrence_pattern": 1, "scheduled_time": 1, "created_at": 1,
+             "message_variants": 1, "status": 1, "retry_at": 1, "lease_expires_at": 1}
+        ).sort("scheduled_time", 1).batch_size(batch_size)
+
+    @classmethod
+    def get_leased(cls, reminder_ids: List[str]) -> List[Dict[str, Any]]:
         """
-        current_time = datetime.datetime.utcnow()
+        Reminders among `reminder_ids` held by a claim whose lease has not expired.
         
-        return list(cls.collection.find({
-            "status": "pending",
-            "scheduled_time": {"$lte": current_time}
-        }).sort("scheduled_time", 1))
+        Args:
+            reminder_ids: Reminder IDs to look up
+        
+        Returns:
+            The leased reminder documents, with `lease_expires_at`
+        """
+        return list(cls.collection.find(
+            {"_id": {"$in": reminder_ids}, "status": "sending", "lease_expires_at": {"$gt": datetime.datetime.utcnow()}},
+            {"chat_id": 1, "message": 1, "recurrence_pattern": 1, "scheduled_time": 1, "created_at": 1,
+             "lease_expires_at": 1}
+        ))
 
     @classmethod
-    def cleanup_old_reminders(cls, days_old: int = 30) -> int:
+    def get_recurring_tails(cls, days_ahead: int, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
         """
-        Clean up old completed/failed reminders.
+        Stream the latest occurrence of every recurring series due within the
+        specified number of days, i.e. recurring reminders without a next occurrence yet.
         
         Args:
-            days_old: Remove reminders older than this many days
+            days_ahead: Number of days to look ahead
+            batch_size: Documents fetched per cursor round-trip
         
         Returns:
-            int: Number of reminders deleted
+            Cursor over recurring reminder documents
         """
-        cutoff_date = datetime.datetime.utcnow() - datetime.timedelta(days=days_old)
+        cutoff_time = datetime.datetime.utcnow() + datetime.timedelta(days=days_ahead)
+        return cls.collection.find(
+            {
+                "status": {"$in": ["scheduled", "pending"]},
+                "scheduled_time": {"$lte": cutoff_time},
+                "recurrence_pattern": {"$type": "string"},
+                "next_occurrence_id": {"$exists": False}
+            },
+            {"chat_id": 1, "message": 1, "recurrence_pattern": 1, "scheduled_time": 1,
+             "message_variants": 1, "series_id": 1}
+        ).batch_size(batch_size)
+
+    @classmethod
+    def link_occurrences(cls, links: Dict[str, str]) -> int:
+        """
+        Record the next occurrence of recurring reminders in one bulk write.
         
-        result = cls.collection.delete_many({
-            "status": {"$in": ["sent", "failed", "cancelled"]},
-            "updated_at": {"$lt": cutoff_date}
-        })
+        Args:
+            links: Next occurrence ID keyed by reminder ID
+        
+        Returns:
+            int: Number of reminders updated
+        """
+        if not links:
+            return 0
+        now = datetime.datetime.utcnow()
+        result = cls.collection.bulk_write([
+            UpdateOne({"_id": reminder_id}, {"$set": {"next_occurrence_id": next_id, "updated_at": now}})
+            for reminder_id, next_id in links.items()
+        ], ordered=False)
+        return result.modified_count
+
+    @classmethod
+    def activate_pending(cls) -> int:
+        """
+        Mark every pending reminder as scheduled, for backends without a scheduling horizon.
+        
+        Returns:
+            int: Number of reminders updated
+        """
+        now = datetime.datetime.utcnow()
+        result = cls.collection.update_many(
+            {"status": "pending"},
+            {"$set": {"status": "scheduled", "updated_at": now}}
+        )
+        return result.modified_count
+
+    @classmethod
+    def move_many_to_service_bus(cls, reminder_ids: List[str]) -> int:
+        """
+        Mark pending reminders as scheduled in Service Bus with a single update.
         
-        return result.deleted_count
\ No newline at end of file
+        Args:
+            reminder_ids: Reminder IDs that were enqueued
+        
+        Returns:
+            int: Number of reminders updated
+        """
+        now = datetime.datetime.utcnow()
+        result = cls.collection.update_many(
+            {"_id": {"$in": reminder_ids}, "status": "pending"},
+            {"$set": {"status": "scheduled", "moved_to_service_bus_at": now, "updated_at": now}}
+        )
+        return result.modified_count
+
+    @classmethod
+    def backfill_expiry(cls) -> int:
+        """
+        Flag finished reminders stored before the `finished` flag existed and give
+        those without one an expiry, counted from their last update, so the TTL
+        index removes them too. Applied once, as a migration.
+        
+        Returns:
+            int: Number of reminders updated
+        """
+        flagged = cls.collection.update_many(
+            {"status": {"$in": FINAL_STATUSES}, "finished": {"$ne": True}, "expires_at": {"$ne": None}},
+            {"$set": {"finished": True}}
+        )
+        expiring = cls.collection.update_many(
+            {"status": {"$in": FINAL_STATUSES}, "expires_at": None},
+            [{"$set": {"finished": True, "expires_at": {"$add": [
+                {"$ifNull": ["$updated_at", "$$NOW"]}, int(cls.retention.total_seconds() * 1000)
+            ]}}}]
+        )
+        return flagged.modified_count + expiring.modified_count
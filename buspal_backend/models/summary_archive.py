@@ -0,0 +1,38 @@
+from buspal_backend.db.mongo import db
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+class SummaryArchiveModel:
+    """
+    Every level-0 summary ever produced for a chat, kept outside the conversation document,
+    together with the messages each summary was generated from (`kind: "message"`).
+    """
+    collection = db.summary_archive
+
+    @classmethod
+    def create(cls, convo_id: str, summary: Dict[str, Any]) -> Dict[str, Any]:
+        return cls.create_many(convo_id, [summary])[0]
+
+    @classmethod
+    def create_many(cls, convo_id: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Archive several entries in one round-trip. Returns them with their `_id` set."""
+        now = datetime.now(timezone.utc)
+        documents = [{"convo_id": convo_id, **entry, "created_at": now} for entry in entries]
+        if documents:
+            cls.collection.insert_many(documents)
+        return documents
+
+    @classmethod
+    def get_recent(cls, convo_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The `limit` most recently archived entries of a chat, oldest first."""
+        entries = list(cls.collection.find(
+            {"convo_id": convo_id},
+            {"kind": 1, "content": 1, "participants": 1, "start_date": 1, "end_date": 1}
+        ).sort("created_at", -1).limit(limit))
+        entries.reverse()
+        return entries
+
+    @classmethod
+    def get_contents(cls, convo_id: str) -> List[str]:
+        """Contents already archived for a chat, used to skip duplicates when backfilling."""
+        return [entry.get("content") for entry in cls.collection.find({"convo_id": convo_id}, {"_id": 0, "content": 1})]
@@ -1,5 +1,13 @@
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from buspal_backend.db.mongo import db
 from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import re
+
+def normalize_name(name: str) -> str:
+    """Case-folded name with collapsed whitespace, stored as `name_normalized` for index-friendly lookups."""
+    return " ".join((name or "").split()).casefold()
 
 class UserModel:
     collection = db.users
@@ -10,6 +18,7 @@ class UserModel:
             "wa_id": wa_id,
             "convo_id": convo_id,
             "name": name,
+            "name_normalized": normalize_name(name),
             "phone": phone,
             "created_at": datetime.now(timezone.utc),
             "preferences": preferences or {},
@@ -19,28 +28,113 @@ class UserModel:
         return user
 
     @classmethod
-    def get_by_id(cls, user_id, convo_id):
-        user = cls.collection.find_one({"wa_id": user_id})
-        if user and not user.get("convo_id"):
-            user["convo_id"] = convo_id
-            cls.collection.update_one({"wa_id": user_id}, {"$set": {"convo_id": convo_id}})
-            return user
+    def get_by_id(cls, user_id):
+        return cls.collection.find_one({"wa_id": user_id})
+
+    @classmethod
+    def get_or_create(cls, wa_id, convo_id) -> Dict[str, Any]:
+        """
+        Atomically fetch a user, creating it on first contact and filling a missing `convo_id`.
+
+        Backed by the unique `wa_id` index, so concurrent webhooks create exactly
+        one document. Newly created users have no name yet.
+        """
+        try:
+            user = cls._upsert(wa_id, convo_id)
+        except DuplicateKeyError:
+            # Lost the insert race to a concurrent upsert, the document exists now
+            user = cls._upsert(wa_id, convo_id)
         return user
-            
+
+    @classmethod
+    def _upsert(cls, wa_id, convo_id) -> Dict[str, Any]:
+        return cls.collection.find_one_and_update(
+            {"wa_id": wa_id},
+            cls._upsert_pipeline(convo_id),
+            projection={"_id": 0, "wa_id": 1, "convo_id": 1, "name": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def _upsert_pipeline(convo_id, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Fill missing fields only, so existing users keep their data.
+
+        Values come from WhatsApp (e.g. a contact named "$name"), so they are wrapped
+        in $literal to keep the pipeline from reading them as field paths or operators.
+        """
+        return [{"$set": {
+            "convo_id": {"$ifNull": ["$convo_id", {"$literal": convo_id}]},
+            "name": {"$ifNull": ["$name", {"$literal": name}]},
+            "name_normalized": {"$ifNull": ["$name_normalized", {"$literal": normalize_name(name) if name is not None else None}]},
+            "phone": {"$ifNull": ["$phone", None]},
+            "created_at": {"$ifNull": ["$created_at", "$$NOW"]},
+            "preferences": {"$ifNull": ["$preferences", {"$literal": {}}]},
+            "last_read": {"$ifNull": ["$last_read", {"$literal": {}}]},
+        }}]
+
+    @classmethod
+    def bulk_upsert(cls, convo_id, users: List[Dict[str, Any]]):
+        """Get-or-create many users of a chat in one bulk write. `users` holds `wa_id` and `name`."""
+        if not users:
+            return None
+        operations = [
+            UpdateOne({"wa_id": user["wa_id"]}, cls._upsert_pipeline(convo_id, user.get("name")), upsert=True)
+            for user in users
+        ]
+        return cls.collection.bulk_write(operations, ordered=False)
+
+    @classmethod
+    def get_many(cls, wa_ids: List[str]) -> List[Dict[str, Any]]:
+        """Users by id, with the same fields `get_or_create` returns."""
+        return list(cls.collection.find({"wa_id": {"$in": wa_ids}}, {"_id": 0, "wa_id": 1, "convo_id": 1, "name": 1}))
+
+    @classmethod
+    def set_name_if_missing(cls, wa_id, convo_id, name: str):
+        result = cls.collection.update_one(
+            {"wa_id": wa_id, "name": None},
+            {"$set": {"name": name, "name_normalized": normalize_name(name)}}
+        )
+        return result
+
     
     @classmethod
     def get_by_name(cls, name, convo_id):
-        # First try exact match (case insensitive)
+        normalized = normalize_name(name)
+        # First try exact match on the normalized name
         user = cls.collection.find_one({
-            "name": {"$regex": f"^{name}$", "$options": "i"},
+            "name_normalized": normalized,
             "convo_id": convo_id
         })
         
-        # If no exact match, try prefix match with space separator (case insensitive)
+        # If no exact match, try prefix match with space separator
         if not user:
             user = cls.collection.find_one({
-                "name": {"$regex": f"^{name}($|\\s)", "$options": "i"},
+                "name_normalized": {"$regex": f"^{re.escape(normalized)}($|\\s)"},
                 "convo_id": convo_id
             })
         
         return user
+
+    @classmethod
+    def get_by_convo_id(cls, convo_id) -> List[Dict[str, Any]]:
+        """All users of a chat, with only the fields needed for name resolution."""
+        return list(cls.collection.find(
+            {"convo_id": convo_id},
+            {"_id": 0, "wa_id": 1, "name": 1, "name_normalized": 1, "convo_id": 1}
+        ))
+
+    @classmethod
+    def backfill_normalized_names(cls, batch_size: int = 1000) -> int:
+        """Set `name_normalized` on users created before the field existed, in batched bulk writes."""
+        updated = 0
+        operations = []
+        for user in cls.collection.find({"name_normalized": {"$exists": False}}, {"name": 1}).batch_size(batch_size):
+            operations.append(UpdateOne({"_id": user["_id"]}, {"$set": {"name_normalized": normalize_name(user.get("name"))}}))
+            if len(operations) == batch_size:
+                updated += cls.collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += cls.collection.bulk_write(operations, ordered=False).modified_count
+        return updated
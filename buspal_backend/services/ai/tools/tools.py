@@ -7,12 +7,14 @@ import json
 import pytz
 import datetime
 import uuid
-from azure.servicebus import ServiceBusClient, ServiceBusMessage
 from buspal_backend.models.reminder import ReminderModel
-from buspal_backend.models.user import UserModel
 from buspal_backend.models.conversation import ConversationModel
 from buspal_backend.types.enums import AIMode
 from buspal_backend.services.expense_settlement import ExpenseSettlementService
+from buspal_backend.services.user_roster import roster_cache
+from buspal_backend.services.reminders.backends import reminder_backend
+from buspal_backend.services.reminders.rephraser import reminder_rephraser
+from buspal_backend.services.reminders.recurrence import RecurrenceRule, LOCAL_TIMEZONE
 from azure.servicebus.exceptions import ServiceBusError
 import logging
 
@@ -60,46 +62,56 @@ async def send_reaction(query, reaction_type="GIF"):
         logger.error(f"Unexpected error fetching reaction: {e}")
         return {}
 
-def schedule_reminder(chat_id: str, message: str, scheduled_time: str, recurrence_pattern: Optional[str] = None):
+async def schedule_reminder(chat_id: str, message: str, scheduled_time: str, recurrence_pattern: Optional[str] = None,
+                            message_variants: Optional[list] = None):
     """
-    Schedule a reminder using hybrid approach: Service Bus (≤7 days) or Database (>7 days).
+    Schedule a reminder on the reminder backend, or in the database when beyond the backend's horizon.
     
     Args:
         chat_id: WhatsApp chat ID to send reminder to
         message: Reminder message text
         scheduled_time: ISO format datetime string (e.g., "2024-06-25T15:30:00")
-        recurrence_pattern: Optional recurrence pattern (e.g., "daily", "weekly", "monthly")
+        recurrence_pattern: Optional recurrence rule (e.g., "FREQ=WEEKLY;BYDAY=MO,TH;COUNT=8", or "daily", "weekly", "monthly")
+        message_variants: Pre-generated wordings for the following occurrences (internal, not exposed to the model)
     
     Returns:
         dict: Success/error status and reminder ID
     """
     try:
         reminder_id = str(uuid.uuid4())
-        beirut_tz = pytz.timezone("Asia/Beirut")
+        if recurrence_pattern:
+            try:
+                recurrence_pattern = str(RecurrenceRule.parse(recurrence_pattern))
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
         if 'T' in scheduled_time:
             local_dt = datetime.datetime.fromisoformat(scheduled_time.replace('Z', ''))
         else:
             local_dt = datetime.datetime.strptime(scheduled_time, "%Y-%m-%d %H:%M:%S")
         
         if local_dt.tzinfo is None:
-            local_dt = beirut_tz.localize(local_dt)
+            local_dt = LOCAL_TIMEZONE.localize(local_dt)
         
         utc_dt = local_dt.astimezone(pytz.utc)
         
-        # Calculate days until reminder
-        now_utc =  datetime.datetime.now(pytz.utc)
-        days_until_reminder = (utc_dt - now_utc).days
-        if days_until_reminder < 14:
-            return _schedule_with_service_bus(
+        # Near reminders go to the backend, those beyond its horizon wait in the database
+        if reminder_backend.accepts(utc_dt):
+            result = await _schedule_with_backend(
                 reminder_id, chat_id, message, utc_dt, local_dt, 
-                recurrence_pattern, scheduled_time
+                recurrence_pattern, scheduled_time, message_variants
             )
         else:
-            return _schedule_with_database(
+            result = _schedule_with_database(
                 reminder_id, chat_id, message, utc_dt, local_dt, 
-                recurrence_pattern, scheduled_time
+                recurrence_pattern, scheduled_time, message_variants
             )
         
+        # Keep recurring reminders stocked with wordings so firing never waits on the model
+        variants = message_variants or []
+        if result.get("success") and recurrence_pattern and reminder_rephraser.needs_refill(variants):
+            reminder_rephraser.refill(reminder_id, variants[-1] if variants else message)
+        return result
+        
     except Exception as e:
         print("Failed to schedule ", e)
         return {"success": False, "error": f"Failed to schedule reminder: {str(e)}"}
@@ -120,22 +132,26 @@ def get_scheduled_reminders(chat_id):
     except Exception as e:
         return {"success": False, "error": f"Failed to get scheduled reminders: {str(e)}"}
 
-def cancel_reminder(reminder_id):
-    """Get the scheduled reminders for the current conversation"""
+async def cancel_reminder(reminder_id):
+    """Cancel a scheduled reminder"""
     try:
         if reminder_id is None:
             return {"success": False, "error": "Could not cancel the scheduled reminder"}
         
         result = ReminderModel.cancel_reminder(reminder_id)
+        if result:
+            # Precomputed occurrences of a recurring reminder are cancelled with it
+            for cancelled_id in [reminder_id, *ReminderModel.cancel_following(reminder_id)]:
+                await reminder_backend.cancel(cancelled_id)
         
         return { "success": result }
         
     except Exception as e:
         return {"success": False, "error": f"Failed to store reminder: {str(e)}"}
 
-def _schedule_with_service_bus(reminder_id, chat_id, message, utc_dt, local_dt, 
-                              recurrence_pattern, scheduled_time):
-    """Schedule reminder using Service Bus (for reminders ≤7 days)."""
+async def _schedule_with_backend(reminder_id, chat_id, message, utc_dt, local_dt, 
+                                recurrence_pattern, scheduled_time, message_variants=None):
+    """Schedule reminder on the reminder backend (for reminders within its horizon)."""
     try:
         reminder_payload = {
             "reminder_id": reminder_id,
@@ -152,41 +168,26 @@ def _schedule_with_service_bus(reminder_id, chat_id, message, utc_dt, local_dt,
             message=message,
             scheduled_time=utc_dt,
             recurrence_pattern=recurrence_pattern,
-            status="scheduled"
+            status="scheduled",
+            message_variants=message_variants
         )
         
-        connection_str = os.getenv("AZURE_SERVICE_BUS_CONNECTION_STRING")
-        queue_name = os.getenv("REMINDER_QUEUE_NAME", "reminders")
-
-        if not connection_str:
-            return {"success": False, "error": "Service Bus connection string not configured"}
-        
-        with ServiceBusClient.from_connection_string(connection_str) as client:
-            with client.get_queue_sender(queue_name) as sender:
-                message_body = json.dumps(reminder_payload)
-                scheduled_message = ServiceBusMessage(
-                    body=message_body,
-                    scheduled_enqueue_time_utc=utc_dt
-                )
-                
-                sender.send_messages(scheduled_message)
+        await reminder_backend.schedule(reminder_payload, utc_dt)
         
         return {
             "success": True, 
             "reminder_id": reminder_id,
-            "message": f"Reminder scheduled for {local_dt.strftime('%Y-%m-%d %H:%M %Z')} (Service Bus)"
+            "message": f"Reminder scheduled for {local_dt.strftime('%Y-%m-%d %H:%M %Z')} ({reminder_backend.name})"
         }
         
     except ServiceBusError as e:
-        print(f"ServiceBus Error Details:")
-        print(f"Message: {e.message}")
-        print(f"Inner Exception: {e.__cause__}")
-        print(f"Full Exception: {e}")
-        
+        logger.error(f"Service Bus error scheduling reminder {reminder_id}: {e} (cause: {e.__cause__})")
         return {"success": False, "error": f"Failed to store reminder: {str(e)}"}
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
 
 def _schedule_with_database(reminder_id, chat_id, message, utc_dt, local_dt, 
-                           recurrence_pattern, scheduled_time):
+                           recurrence_pattern, scheduled_time, message_variants=None):
     """Schedule reminder using database storage (for reminders >7 days or Service Bus fallback)."""
     try:
         # Store reminder metadata in MongoDB with pending status
@@ -196,7 +197,8 @@ def _schedule_with_database(reminder_id, chat_id, message, utc_dt, local_dt,
             message=message,
             scheduled_time=utc_dt,
             recurrence_pattern=recurrence_pattern,
-            status="pending"
+            status="pending",
+            message_variants=message_variants
         )
         
         return {
@@ -223,7 +225,9 @@ def add_expense(chat_id: str, amount: float, payer_name: str, participants: Opti
         dict: Success/error status and expense details
     """
     try:
-        payer = UserModel.get_by_name(payer_name, chat_id)
+        # Resolve every name against the chat roster in one lookup
+        resolved = roster_cache.resolve_many(chat_id, [payer_name, *(participants or [])])
+        payer = resolved[payer_name]
         if not payer:
           payer_id = f"{chat_id}_{payer_name.lower().replace(' ', '_')}"
         else:
@@ -236,7 +240,7 @@ def add_expense(chat_id: str, amount: float, payer_name: str, participants: Opti
             # Convert participant names to user objects
             participant_objects = []
             for name in participants:
-                participant = UserModel.get_by_name(name, chat_id)
+                participant = resolved[name]
                 if participant:
                     participant_id = participant['wa_id']
                 else:
@@ -321,7 +325,7 @@ def get_expense_balance(chat_id: str, user_name: str):
         dict: User's balance and transaction details
     """
     try:
-        user = UserModel.get_by_name(user_name, chat_id)
+        user = roster_cache.resolve(chat_id, user_name)
         if user:
             user_id = user['wa_id']
         else:
@@ -380,19 +384,20 @@ def settle_payments(chat_id: str, expense_ids: Optional[str] = None):
         logger.error(f"Failed to settle payments: {e}")
         return {"success": False, "error": f"Failed to settle payments: {str(e)}"}
 
-def get_expense_history(chat_id: str, limit: int = 5):
+def get_expense_history(chat_id: str, limit: int = 5, before: Optional[str] = None):
     """
     Get recent expense history for a group chat.
     
     Args:
         chat_id: WhatsApp chat ID
         limit: Number of recent expenses to return
+        before: Cursor returned by a previous call, to fetch older expenses
     
     Returns:
         dict: List of recent expenses
     """
     try:
-        expenses = ExpenseSettlementService.get_expense_history(chat_id, limit)
+        expenses = ExpenseSettlementService.get_expense_history(chat_id, limit, before)
         
         if not expenses:
             return {
@@ -411,7 +416,8 @@ def get_expense_history(chat_id: str, limit: int = 5):
         return {
             "success": True,
             "message": message,
-            "expenses": expenses
+            "expenses": expenses,
+            "next_cursor": str(expenses[-1]["_id"]) if len(expenses) == limit else None
         }
         
     except Exception as e:
@@ -1,9 +1,20 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
 from buspal_backend.models.expense import ExpenseModel
+from buspal_backend.models.balance import BalanceLedgerModel, ledger_key
 import heapq
+import logging
 from bson import ObjectId
 
+logger = logging.getLogger(__name__)
+
+# Largest number of non-zero balances settled with the exact (exponential) solver
+EXACT_SOLVER_MAX_PEOPLE = 12
+
+# Version-guarded ledger rebuilds retried on conflict before giving up
+LEDGER_REBUILD_ATTEMPTS = 5
+
 class ExpenseSettlementService:
     
     @staticmethod
@@ -46,59 +57,191 @@ class ExpenseSettlementService:
         """
         Minimize number of transactions using debt minimization algorithm
         Returns list of transactions: [{"from": user_id, "from_name": str, "to": user_id, "to_name": str, "amount": float}]
+
+        Balances are settled in integer cents. Groups of up to EXACT_SOLVER_MAX_PEOPLE
+        non-zero balances get a provably minimal plan, larger ones use the greedy heap.
         """
-        # Filter out zero balances
-        non_zero_balances = {k: v for k, v in balances.items() if abs(v["amount"]) > 0.01}
+        cents = {
+            user_id: ExpenseSettlementService.to_cents(info["amount"])
+            for user_id, info in balances.items()
+        }
+        cents = {user_id: amount for user_id, amount in cents.items() if amount}
         
-        if not non_zero_balances:
+        if not cents:
             return []
         
-        # Create heaps for creditors (max heap) and debtors (min heap)
-        creditors = []  # People who should receive money
-        debtors = []    # People who should pay money
-        
-        for user_id, balance_info in non_zero_balances.items():
-            balance = balance_info["amount"]
-            if balance > 0:
-                heapq.heappush(creditors, (-balance, user_id))  # Negative for max heap
-            else:
-                heapq.heappush(debtors, (balance, user_id))     # Positive for min heap
-        
-        transactions = []
+        if sum(cents.values()) == 0 and len(cents) <= EXACT_SOLVER_MAX_PEOPLE:
+            transfers = ExpenseSettlementService._settle_exact(cents)
+        else:
+            transfers = ExpenseSettlementService._settle_greedy(cents)
         
-        while creditors and debtors:
-            # Get the person who should receive the most and owes the most
-            creditor_balance, creditor_id = heapq.heappop(creditors)
-            debtor_balance, debtor_id = heapq.heappop(debtors)
-            
-            creditor_amount = -creditor_balance
-            debtor_amount = -debtor_balance
-            
-            # Settle the smaller amount
-            settlement_amount = min(creditor_amount, debtor_amount)
-            
-            transactions.append({
+        return [
+            {
                 "from": debtor_id,
                 "from_name": balances[debtor_id]["name"],
                 "to": creditor_id,
                 "to_name": balances[creditor_id]["name"],
-                "amount": round(settlement_amount, 2)
-            })
+                "amount": ExpenseSettlementService.from_cents(amount)
+            }
+            for debtor_id, creditor_id, amount in transfers
+        ]
+    
+    @staticmethod
+    def _settle_greedy(cents: Dict[str, int]) -> List[Tuple[str, str, int]]:
+        """Repeatedly settle the largest creditor against the largest debtor. Returns (from, to, cents)."""
+        creditors = []  # People who should receive money (max heap)
+        debtors = []    # People who should pay money (max heap on debt)
+        
+        for user_id, amount in cents.items():
+            if amount > 0:
+                heapq.heappush(creditors, (-amount, user_id))
+            elif amount < 0:
+                heapq.heappush(debtors, (amount, user_id))
+        
+        transfers = []
+        while creditors and debtors:
+            creditor_amount, creditor_id = heapq.heappop(creditors)
+            debtor_amount, debtor_id = heapq.heappop(debtors)
+            creditor_amount, debtor_amount = -creditor_amount, -debtor_amount
             
-            # Update balances
-            remaining_creditor = creditor_amount - settlement_amount
-            remaining_debtor = debtor_amount - settlement_amount
+            settlement_amount = min(creditor_amount, debtor_amount)
+            transfers.append((debtor_id, creditor_id, settlement_amount))
             
-            # Re-add to heaps if there's remaining balance
-            if remaining_creditor > 0.01:
-                heapq.heappush(creditors, (-remaining_creditor, creditor_id))
-            if remaining_debtor > 0.01:
-                heapq.heappush(debtors, (-remaining_debtor, debtor_id))
+            if creditor_amount > settlement_amount:
+                heapq.heappush(creditors, (-(creditor_amount - settlement_amount), creditor_id))
+            if debtor_amount > settlement_amount:
+                heapq.heappush(debtors, (-(debtor_amount - settlement_amount), debtor_id))
         
-        return transactions
+        return transfers
     
     @staticmethod
-    def calculate_settlements(convo_id: str, include_settled: bool = False) -> Dict:
+    def _settle_exact(cents: Dict[str, int]) -> List[Tuple[str, str, int]]:
+        """
+        Minimal number of transfers for balances that sum to zero.
+
+        Splitting n people into k disjoint zero-sum groups lets each group settle
+        with size - 1 transfers, so the minimum is n - k for the largest k. That k
+        is found with a DP over bitmasks: best[mask] is the most zero-sum groups a
+        prefix ordering of `mask` can close, in O(2^n * n).
+        """
+        user_ids = list(cents)
+        amounts = [cents[user_id] for user_id in user_ids]
+        n = len(user_ids)
+        full = (1 << n) - 1
+        
+        totals = [0] * (1 << n)
+        for mask in range(1, full + 1):
+            low = mask & -mask
+            totals[mask] = totals[mask ^ low] + amounts[low.bit_length() - 1]
+        
+        best = [0] * (1 << n)
+        for mask in range(1, full + 1):
+            closes = 1 if totals[mask] == 0 else 0
+            bits, value = mask, 0
+            while bits:
+                low = bits & -bits
+                value = max(value, best[mask ^ low])
+                bits ^= low
+            best[mask] = value + closes
+        
+        # Walk back from the full set to recover the ordering, then cut it into groups
+        order = []
+        mask = full
+        while mask:
+            closes = 1 if totals[mask] == 0 else 0
+            bits = mask
+            while bits:
+                low = bits & -bits
+                if best[mask ^ low] + closes == best[mask]:
+                    break
+                bits ^= low
+            order.append(low.bit_length() - 1)
+            mask ^= low
+        order.reverse()
+        
+        transfers = []
+        group, running = {}, 0
+        for index in order:
+            group[user_ids[index]] = amounts[index]
+            running += amounts[index]
+            if running == 0:
+                # Greedy within a zero-sum group zeroes someone on every transfer: size - 1 at most
+                transfers.extend(ExpenseSettlementService._settle_greedy(group))
+                group = {}
+        
+        return transfers
+    
+    @staticmethod
+    def calculate_settlements(convo_id: str, include_settled: bool = False, include_expenses: bool = False) -> Dict:
+        """
+        Calculate balances and the settlement plan for a conversation.
+
+        Unsettled balances come from the materialized ledger, so the cost depends on
+        the number of participants, not expenses. Including settled expenses sums
+        balances with a Mongo aggregation, and only the raw expense list requires
+        loading every expense.
+        """
+        if include_expenses:
+            return ExpenseSettlementService._calculate_settlements_from_expenses(convo_id, include_settled)
+        if include_settled:
+            return ExpenseSettlementService._calculate_settlements_aggregated(convo_id, include_settled)
+        
+        ledger = ExpenseSettlementService.get_ledger(convo_id)
+        if not ledger.get("expense_count"):
+            return {
+                "balances": {},
+                "transactions": [],
+                "total_expenses": 0,
+                "summary": "No expenses found"
+            }
+        
+        balances = ExpenseSettlementService.ledger_balances(ledger)
+        total_expenses = ExpenseSettlementService.from_cents(ledger.get("total_cents", 0))
+        transactions = ExpenseSettlementService.settlement_plan(convo_id, ledger)
+        summary = ExpenseSettlementService.create_settlement_summary(
+            balances, transactions, total_expenses
+        )
+        
+        return {
+            "balances": balances,
+            "transactions": transactions,
+            "total_expenses": total_expenses,
+            "summary": summary
+        }
+    
+    @staticmethod
+    def _calculate_settlements_aggregated(convo_id: str, include_settled: bool = False) -> Dict:
+        """Settlements from balances summed by Mongo. Falls back to the Python path if the aggregation fails."""
+        try:
+            aggregated = ExpenseModel.aggregate_net_balances(convo_id, include_settled)
+        except Exception as e:
+            logger.warning(f"Balance aggregation failed for {convo_id}, computing in Python: {e}")
+            return ExpenseSettlementService._calculate_settlements_from_expenses(convo_id, include_settled)
+        
+        if not aggregated["expense_count"]:
+            return {
+                "balances": {},
+                "transactions": [],
+                "total_expenses": 0,
+                "summary": "No expenses found"
+            }
+        
+        balances = aggregated["balances"]
+        total_expenses = aggregated["total_amount"]
+        transactions = ExpenseSettlementService.minimize_transactions(balances)
+        summary = ExpenseSettlementService.create_settlement_summary(
+            balances, transactions, total_expenses
+        )
+        
+        return {
+            "balances": balances,
+            "transactions": transactions,
+            "total_expenses": total_expenses,
+            "summary": summary
+        }
+    
+    @staticmethod
+    def _calculate_settlements_from_expenses(convo_id: str, include_settled: bool = False) -> Dict:
         expenses = ExpenseModel.get_by_convo_id(convo_id, include_settled)
         
         if not expenses:
@@ -134,6 +277,137 @@ class ExpenseSettlementService:
             "expenses": serializable_expenses
         }
     
+    @staticmethod
+    def to_cents(amount: float) -> int:
+        return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    
+    @staticmethod
+    def from_cents(cents: int) -> float:
+        return cents / 100
+    
+    @staticmethod
+    def expense_deltas(expenses: List[Dict], sign: int = 1) -> Dict[str, Dict]:
+        """
+        Per-user balance changes in cents caused by a set of expenses.
+
+        The payer is credited the sum of the rounded shares rather than the rounded
+        total, so every expense nets to exactly zero across the chat.
+        """
+        deltas = defaultdict(lambda: {"name": "", "cents": 0})
+        for expense in expenses:
+            shared = 0
+            for participant in expense["participants"]:
+                share = ExpenseSettlementService.to_cents(participant["share_amount"])
+                entry = deltas[participant["user_id"]]
+                entry["cents"] -= sign * share
+                entry["name"] = participant["name"]
+                shared += share
+            payer = deltas[expense["payer_id"]]
+            payer["cents"] += sign * shared
+            payer["name"] = expense["payer_name"]
+        return dict(deltas)
+    
+    @staticmethod
+    def update_ledger(convo_id: str, expenses: List[Dict], sign: int = 1) -> None:
+        """Add (sign=1) or remove (sign=-1) expenses from the chat's ledger with one atomic $inc."""
+        if not expenses:
+            return
+        deltas = ExpenseSettlementService.expense_deltas(expenses, sign)
+        total_cents = sign * sum(ExpenseSettlementService.to_cents(e["total_amount"]) for e in expenses)
+        BalanceLedgerModel.apply_deltas(convo_id, deltas, total_cents, sign * len(expenses))
+    
+    @staticmethod
+    def _compute_ledger(convo_id: str) -> Dict:
+        expenses = ExpenseModel.get_by_convo_id(convo_id, include_settled=False)
+        return {
+            "entries": ExpenseSettlementService.expense_deltas(expenses),
+            "total_cents": sum(ExpenseSettlementService.to_cents(e["total_amount"]) for e in expenses),
+            "expense_count": len(expenses)
+        }
+    
+    @staticmethod
+    def rebuild_ledger(convo_id: str, missing_only: bool = False) -> Dict:
+        """
+        Recompute the ledger from raw unsettled expenses and store it.
+
+        The write is guarded by the ledger version read before the expenses, so a
+        delta applied in between makes it fail and the rebuild is retried. With
+        `missing_only`, an existing ledger is left as it is.
+        """
+        for _ in range(LEDGER_REBUILD_ATTEMPTS):
+            version = BalanceLedgerModel.get_version(convo_id)
+            if version is not None and missing_only:
+                break
+            computed = ExpenseSettlementService._compute_ledger(convo_id)
+            if BalanceLedgerModel.replace(convo_id, computed["entries"], computed["total_cents"], computed["expense_count"], version):
+                break
+            logger.info(f"Ledger of {convo_id} changed during rebuild, retrying")
+        else:
+            raise RuntimeError(f"Ledger of {convo_id} kept changing during {LEDGER_REBUILD_ATTEMPTS} rebuild attempts")
+        return BalanceLedgerModel.get_by_convo_id(convo_id) or {}
+    
+    @staticmethod
+    def get_ledger(convo_id: str) -> Dict:
+        """
+        The chat's ledger. Ledgers are created by the first expense's delta (chats that
+        predate them are built by a migration), so a missing ledger means no expenses.
+        """
+        ledger = BalanceLedgerModel.get_by_convo_id(convo_id)
+        if ledger is None:
+            ledger = {"convo_id": convo_id, "entries": {}, "total_cents": 0, "expense_count": 0, "version": 0}
+        return ledger
+    
+    @staticmethod
+    def ledger_balances(ledger: Dict) -> Dict[str, Dict]:
+        """Ledger entries in the same shape as calculate_net_balances."""
+        return {
+            entry["user_id"]: {
+                "amount": ExpenseSettlementService.from_cents(entry.get("cents", 0)),
+                "name": entry.get("name", "")
+            }
+            for entry in (ledger.get("entries") or {}).values()
+        }
+    
+    @staticmethod
+    def settlement_plan(convo_id: str, ledger: Dict) -> List[Dict]:
+        """The ledger's settlement transactions, reusing the cached plan while the ledger version is unchanged."""
+        version = ledger.get("version", 0)
+        if "plan" in ledger and ledger.get("plan_version") == version:
+            return ledger["plan"]
+        transactions = ExpenseSettlementService.minimize_transactions(
+            ExpenseSettlementService.ledger_balances(ledger)
+        )
+        BalanceLedgerModel.save_plan(convo_id, version, transactions)
+        return transactions
+    
+    @staticmethod
+    def check_ledger_consistency(convo_id: str, repair: bool = False) -> Dict:
+        """
+        Compare the materialized ledger with balances rebuilt from raw expenses.
+        Returns the per-user differences in cents, and rewrites the ledger when `repair` is set.
+        """
+        computed = ExpenseSettlementService._compute_ledger(convo_id)
+        ledger = BalanceLedgerModel.get_by_convo_id(convo_id) or {}
+        stored = {entry["user_id"]: entry.get("cents", 0) for entry in (ledger.get("entries") or {}).values()}
+        expected = {user_id: entry["cents"] for user_id, entry in computed["entries"].items()}
+        
+        differences = {
+            user_id: {"stored": stored.get(user_id, 0), "expected": expected.get(user_id, 0)}
+            for user_id in set(stored) | set(expected)
+            if stored.get(user_id, 0) != expected.get(user_id, 0)
+        }
+        consistent = (
+            not differences
+            and ledger.get("total_cents", 0) == computed["total_cents"]
+            and ledger.get("expense_count", 0) == computed["expense_count"]
+        )
+        repaired = False
+        if not consistent and repair:
+            ExpenseSettlementService.rebuild_ledger(convo_id)
+            repaired = True
+        
+        return {"consistent": consistent, "differences": differences, "repaired": repaired}
+    
     @staticmethod
     def create_settlement_summary(balances: Dict[str, Dict], 
                                 transactions: List[Dict], 
@@ -175,43 +449,55 @@ class ExpenseSettlementService:
             participants=participants,
             expense_type=expense_type
         )
+        ExpenseSettlementService.update_ledger(convo_id, [expense])
         
         return expense
     
     @staticmethod
     def split_equally(total_amount: float, participants: List[Dict]) -> List[Dict]:
-        """Split amount equally among participants"""
+        """Split amount equally among participants, spreading leftover cents so shares sum exactly"""
         if not participants:
             return []
         
-        per_person = total_amount / len(participants)
+        per_person, remainder = divmod(ExpenseSettlementService.to_cents(total_amount), len(participants))
         
-        for participant in participants:
-            participant["share_amount"] = round(per_person, 2)
-        
-        # Handle rounding by adjusting the last participant
-        total_shares = sum(p["share_amount"] for p in participants)
-        if abs(total_shares - total_amount) > 0.01:
-            participants[-1]["share_amount"] += round(total_amount - total_shares, 2)
+        for index, participant in enumerate(participants):
+            share = per_person + (1 if index < remainder else 0)
+            participant["share_amount"] = ExpenseSettlementService.from_cents(share)
         
         return participants
     
     @staticmethod
-    def get_expense_history(convo_id: str, limit: int = 10) -> List[Dict]:
-        """Get recent expense history for a conversation"""
-        expenses = ExpenseModel.get_by_convo_id(convo_id, include_settled=True)
-        return expenses[:limit]
+    def get_expense_history(convo_id: str, limit: int = 10, before: Optional[str] = None) -> List[Dict]:
+        """Get one page of recent expense history. Pass the last expense's id as `before` for the next page."""
+        return ExpenseModel.get_history(convo_id, limit, before)
+    
+    @staticmethod
+    def _settle(convo_id: str, expense_ids: Optional[List[str]] = None) -> int:
+        """
+        Settle expenses and remove them from the ledger as negative deltas, like any other change.
+
+        Only the expenses this call actually settled are reversed: they are tagged with
+        a settlement id, so concurrent settlements or expenses added meanwhile are unaffected.
+        """
+        settlement_id = str(ObjectId())
+        settled_count = ExpenseModel.mark_settled_many(convo_id, settlement_id, expense_ids).modified_count
+        if settled_count:
+            expenses = ExpenseModel.get_by_settlement(convo_id, settlement_id)
+            ExpenseSettlementService.update_ledger(convo_id, expenses, sign=-1)
+            # Users whose balance the settlement brought back to zero leave the ledger
+            user_ids = {expense["payer_id"] for expense in expenses}
+            user_ids.update(participant["user_id"] for expense in expenses for participant in expense["participants"])
+            BalanceLedgerModel.drop_zero_entries(convo_id, list(user_ids))
+        return settled_count
     
     @staticmethod
     def settle_payments(convo_id: str, expense_ids: Optional[List[str]] = None) -> Dict:
         """Mark expenses as settled - either all or specific ones"""
         try:
             if expense_ids:
-                # Settle specific expenses
-                settled_count = 0
-                for expense_id in expense_ids:
-                    ExpenseModel.mark_settled(expense_id)
-                    settled_count += 1
+                # Settle specific expenses, reversing only those that were still open
+                settled_count = ExpenseSettlementService._settle(convo_id, expense_ids)
                 
                 return {
                     "success": True,
@@ -220,21 +506,15 @@ class ExpenseSettlementService:
                 }
             else:
                 # Settle all unsettled expenses
-                expenses = ExpenseModel.get_by_convo_id(convo_id, include_settled=False)
+                settled_count = ExpenseSettlementService._settle(convo_id)
                 
-                if not expenses:
+                if not settled_count:
                     return {
                         "success": True,
                         "message": "No unsettled expenses found",
                         "settled_count": 0
                     }
                 
-                # Mark all expenses as settled
-                settled_count = 0
-                for expense in expenses:
-                    ExpenseModel.mark_settled(expense["_id"])
-                    settled_count += 1
-                
                 return {
                     "success": True,
                     "message": f"Successfully settled all {settled_count} expenses",
@@ -250,24 +530,30 @@ class ExpenseSettlementService:
     
     @staticmethod
     def get_user_balance_summary(convo_id: str, user_id: str) -> Dict:
-        """Get balance summary for a specific user"""
-        settlement_data = ExpenseSettlementService.calculate_settlements(convo_id)
-        balances = settlement_data["balances"]
-        transactions = settlement_data["transactions"]
-        
-        user_balance_info = balances.get(user_id, {"amount": 0, "name": ""})
-        user_balance = user_balance_info["amount"]
-        
-        # Find transactions involving this user
-        user_transactions = [
-            t for t in transactions 
-            if t["from"] == user_id or t["to"] == user_id
-        ]
+        """
+        Get balance summary for a specific user.
+
+        Reads only the user's ledger entry and their part of the cached plan. The
+        full ledger is loaded only when the plan is stale or missing.
+        """
+        view = BalanceLedgerModel.get_user_view(convo_id, user_id)
+        if view is not None and "plan" in view and view.get("plan_version") == view.get("version"):
+            entry = next(iter((view.get("entries") or {}).values()), None)
+            user_transactions = view["plan"]
+        else:
+            ledger = ExpenseSettlementService.get_ledger(convo_id)
+            entry = (ledger.get("entries") or {}).get(ledger_key(user_id))
+            user_transactions = [
+                t for t in ExpenseSettlementService.settlement_plan(convo_id, ledger)
+                if t["from"] == user_id or t["to"] == user_id
+            ]
+        
+        user_balance = ExpenseSettlementService.from_cents(entry.get("cents", 0)) if entry else 0
         
         return {
             "user_id": user_id,
-            "name": user_balance_info["name"],
+            "name": entry.get("name", "") if entry else "",
             "net_balance": user_balance,
             "transactions": user_transactions,
             "status": "creditor" if user_balance > 0 else "debtor" if user_balance < 0 else "settled"
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,359 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Set, TypeVar
+from buspal_backend.models.reminder import ReminderModel
+from buspal_backend.services.reminders.reminder_queue import QueuedReminder, ReminderQueue, reminder_queue
+from buspal_backend.config.app_config import app_config, ReminderConfig
+import asyncio
+import datetime
+import math
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+ReminderHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+T = TypeVar("T")
+
+def reminder_payload(reminder: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue payload for a reminder document."""
+    return {
+        "reminder_id": reminder["_id"],
+        "chat_id": reminder["chat_id"],
+        "message": reminder["message"],
+        "recurrence_pattern": reminder.get("recurrence_pattern"),
+        "scheduled_time": reminder["scheduled_time"].isoformat(),
+        "created_at": reminder["created_at"].isoformat() if reminder.get("created_at") else None
+    }
+
+def to_timestamp(moment: datetime.datetime) -> float:
+    """POSIX timestamp of a datetime, treating naive values as UTC like Mongo does."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+def to_datetime(timestamp: float) -> datetime.datetime:
+    """Naive UTC datetime of a POSIX timestamp, as reminders are stored."""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None)
+
+def coalesce(items: List[T], window_seconds: float, timestamp: Callable[[T], float]) -> List[List[T]]:
+    """
+    Group time-ordered reminders of one chat so that each group spans at
+    most `window_seconds` from its first reminder.
+    """
+    groups: List[List[T]] = []
+    for item in items:
+        if groups and timestamp(item) - timestamp(groups[-1][0]) <= window_seconds:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    return groups
+
+class ReminderBackend(ABC):
+    """
+    Where scheduled reminders wait until they are due.
+
+    Reminders due within `horizon` are handed to the backend. Reminders further
+    out are stored as pending and promoted later by the daily job. A `horizon`
+    of None means the backend accepts any due time.
+    """
+    name: str = ""
+    horizon: Optional[datetime.timedelta] = None
+
+    @abstractmethod
+    async def schedule(self, payload: Dict[str, Any], fire_at: datetime.datetime) -> None:
+        """Deliver `payload` to the reminder processor at `fire_at`."""
+        pass
+
+    async def schedule_many(self, reminders: List[QueuedReminder]) -> None:
+        """Schedule several reminders. Backends that can batch sends override this."""
+        for payload, fire_at in reminders:
+            await self.schedule(payload, fire_at)
+
+    async def cancel(self, reminder_id: str) -> None:
+        """Drop a scheduled reminder. Cancelled reminders are also skipped when claimed."""
+        pass
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {}
+
+    def accepts(self, fire_at: datetime.datetime) -> bool:
+        if self.horizon is None:
+            return True
+        return to_timestamp(fire_at) - time.time() < self.horizon.total_seconds()
+
+class ServiceBusReminderBackend(ReminderBackend):
+    """
+    Scheduled Service Bus messages, processed by the reminder function.
+
+    When reminders are scheduled together, those of the same chat due within
+    `coalesce_window_seconds` of each other share one message at the time of
+    the first, listing every ID in `reminder_ids`, so the group costs a single
+    function invocation.
+    """
+    name = "Service Bus"
+
+    def __init__(self, queue: ReminderQueue, config: ReminderConfig):
+        self.queue = queue
+        self.horizon = datetime.timedelta(days=config.service_bus_horizon_days)
+        self.coalesce_window_seconds = config.coalesce_window_seconds
+
+    async def schedule(self, payload: Dict[str, Any], fire_at: datetime.datetime) -> None:
+        await self.queue.send(payload, fire_at)
+
+    async def schedule_many(self, reminders: List[QueuedReminder]) -> None:
+        by_chat: Dict[str, List[QueuedReminder]] = {}
+        for reminder in sorted(reminders, key=lambda r: to_timestamp(r[1])):
+            by_chat.setdefault(reminder[0]["chat_id"], []).append(reminder)
+
+        queued: List[QueuedReminder] = []
+        for chat_reminders in by_chat.values():
+            for group in coalesce(chat_reminders, self.coalesce_window_seconds, lambda r: to_timestamp(r[1])):
+                payload, fire_at = group[0]
+                if len(group) > 1:
+                    payload = {**payload, "reminder_ids": [p["reminder_id"] for p, _ in group]}
+                queued.append((payload, fire_at))
+        await self.queue.send_many(queued)
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return self.queue.metrics
+
+    async def start(self) -> None:
+        await self.queue.start()
+
+    async def close(self) -> None:
+        await self.queue.close()
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel with O(1) insert and cancel.
+
+    Time advances in ticks of `tick_seconds`. Level l has 2^slot_bits slots
+    covering 2^(slot_bits * l) ticks each. An entry sits on the lowest level
+    whose span covers its remaining delay, and is cascaded one level down
+    whenever the wheel reaches the start of its slot. With 100ms ticks, 6 bits
+    and 6 levels the wheel covers over 200 years.
+    """
+
+    def __init__(self, tick_seconds: float, slot_bits: int, levels: int, now: Optional[float] = None):
+        self.tick_seconds = tick_seconds
+        self.slot_bits = slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+        self.levels = levels
+        self.max_delay = (1 << (slot_bits * levels)) - 1
+        self.current_tick = self.tick_of(time.time() if now is None else now)
+        self._slots: List[List[Dict[str, Any]]] = [[{} for _ in range(1 << slot_bits)] for _ in range(levels)]
+        # key -> (expiry tick, level, slot) so entries can be removed in O(1)
+        self._locations: Dict[str, tuple] = {}
+        self._values: Dict[str, Any] = {}
+
+    def tick_of(self, timestamp: float) -> int:
+        return int(timestamp / self.tick_seconds)
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._locations
+
+    def add(self, key: str, value: Any, timestamp: float) -> bool:
+        """
+        Schedule `value` under `key` for `timestamp`, replacing any existing entry.
+        Returns False if it is already due, in which case nothing is stored.
+        """
+        self.remove(key)
+        # Round up so entries never fire before their time
+        expiry = math.ceil(timestamp / self.tick_seconds)
+        if expiry <= self.current_tick:
+            return False
+        self._values[key] = value
+        self._place(key, expiry)
+        return True
+
+    def remove(self, key: str) -> Optional[Any]:
+        location = self._locations.pop(key, None)
+        if location is None:
+            return None
+        _, level, slot = location
+        del self._slots[level][slot][key]
+        return self._values.pop(key)
+
+    def _place(self, key: str, expiry: int) -> None:
+        delay = min(expiry - self.current_tick, self.max_delay)
+        level = min(max(delay.bit_length() - 1, 0) // self.slot_bits, self.levels - 1)
+        expiry = self.current_tick + delay
+        slot = (expiry >> (self.slot_bits * level)) & self.slot_mask
+        self._slots[level][slot][key] = expiry
+        self._locations[key] = (expiry, level, slot)
+
+    def advance(self, timestamp: float) -> List[Any]:
+        """Move the wheel up to `timestamp` and return the values that came due, in order."""
+        target = self.tick_of(timestamp)
+        due = []
+        while self.current_tick < target:
+            self.current_tick += 1
+            tick = self.current_tick
+            # Cascade every level whose slot boundary was just reached, highest first
+            for level in range(self.levels - 1, 0, -1):
+                if tick & ((1 << (self.slot_bits * level)) - 1) == 0:
+                    self._cascade(level, (tick >> (self.slot_bits * level)) & self.slot_mask)
+            bucket = self._slots[0][tick & self.slot_mask]
+            if bucket:
+                for key in list(bucket):
+                    due.append(self.remove(key))
+        return due
+
+    def _cascade(self, level: int, slot: int) -> None:
+        bucket = self._slots[level][slot]
+        if not bucket:
+            return
+        self._slots[level][slot] = {}
+        for key, expiry in bucket.items():
+            del self._locations[key]
+            self._place(key, max(expiry, self.current_tick))
+
+class TimingWheelReminderBackend(ReminderBackend):
+    """
+    In-process reminder backend for self-hosted deployments and tests.
+
+    Reminders live in a `TimingWheel` ticking every `wheel_tick_ms`. Mongo
+    remains the source of truth: every scheduled reminder is already stored
+    there, so the wheel only holds those due within the next
+    `wheel_load_horizon_minutes`. On start it loads that window, firing
+    anything that came due while the process was down, and it loads the next
+    window from Mongo once half of the current one has passed. Reminders
+    scheduled beyond the loaded window are left to that load. Reminders left
+    in sending are loaded for the time their lease expires, so those of a
+    crashed process are recovered without the daily job.
+    Due reminders go through the same claim-send-mark path as the Service
+    Bus function, at most `dispatch_max_concurrency` at a time.
+    """
+    name = "Timing wheel"
+    horizon = None
+
+    def __init__(self, config: ReminderConfig, handler: Optional[ReminderHandler] = None):
+        self.config = config
+        self.handler = handler
+        self.wheel = TimingWheel(config.wheel_tick_ms / 1000, config.wheel_slot_bits, config.wheel_levels)
+        self._semaphore = asyncio.Semaphore(config.dispatch_max_concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self.load_horizon = config.wheel_load_horizon_minutes * 60
+        # Every scheduled reminder due up to this timestamp is in the wheel
+        self.loaded_until = 0.0
+        self._loading: Optional[asyncio.Task] = None
+        self._metrics = {"scheduled": 0, "loaded": 0, "fired": 0, "failed": 0, "cancelled": 0}
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "waiting": len(self.wheel)}
+
+    async def schedule(self, payload: Dict[str, Any], fire_at: datetime.datetime) -> None:
+        self._metrics["scheduled"] += 1
+        self._add(payload, to_timestamp(fire_at))
+
+    def _add(self, payload: Dict[str, Any], timestamp: float) -> None:
+        # Reminders past the loaded window are already stored and loaded with it
+        if timestamp > self.loaded_until:
+            return
+        if not self.wheel.add(payload["reminder_id"], payload, timestamp):
+            self._fire(payload)
+
+    async def cancel(self, reminder_id: str) -> None:
+        if self.wheel.remove(reminder_id) is not None:
+            self._metrics["cancelled"] += 1
+
+    async def start(self) -> None:
+        if self.handler is None:
+            from buspal_backend.services.reminders.processor import process_reminder
+            self.handler = process_reminder
+        # Reminders stored as pending by the Service Bus backend belong in the wheel too
+        ReminderModel.activate_pending()
+        restored = await self.load(time.time() + self.load_horizon, overdue=True)
+        logger.info(f"Timing wheel restored {restored} reminders, {len(self.wheel)} waiting")
+        self._task = asyncio.create_task(self._run())
+
+    async def load(self, until: float, overdue: bool = False) -> int:
+        """
+        Add the scheduled reminders due after the loaded window and up to `until`,
+        or every one due up to `until` when `overdue` is set. Returns how many were read.
+        """
+        after, self.loaded_until = self.loaded_until, until
+        # The window is extended before reading so reminders scheduled meanwhile go straight in
+        try:
+            reminders = await asyncio.to_thread(
+                lambda: list(ReminderModel.get_scheduled_reminders(
+                    to_datetime(until), None if overdue else to_datetime(after)
+                ))
+            )
+        except Exception:
+            self.loaded_until = after
+            raise
+        for reminder in reminders:
+            if reminder.get("status") == "sending":
+                # Claimed by a sender that may have died, delivered again once its lease expires
+                fire_at = reminder["lease_expires_at"]
+            else:
+                # Reminders released for a retry wait out their backoff
+                fire_at = max(reminder["scheduled_time"], reminder.get("retry_at") or reminder["scheduled_time"])
+            self._add(reminder_payload(reminder), to_timestamp(fire_at))
+        self._metrics["loaded"] += len(reminders)
+        return len(reminders)
+
+    async def _load_next(self) -> None:
+        try:
+            await self.load(time.time() + self.load_horizon)
+        except Exception as e:
+            logger.error(f"Failed to load reminders into the timing wheel: {e}")
+            # Back off instead of retrying on every tick
+            await asyncio.sleep(min(60, self.load_horizon / 4))
+        finally:
+            self._loading = None
+
+    async def _run(self) -> None:
+        tick = self.config.wheel_tick_ms / 1000
+        while True:
+            for payload in self.wheel.advance(time.time()):
+                self._fire(payload)
+            if self._loading is None and self.loaded_until - time.time() < self.load_horizon / 2:
+                self._loading = asyncio.create_task(self._load_next())
+            # Sleep to the next tick boundary so firing does not drift
+            await asyncio.sleep(tick - (time.time() % tick))
+
+    def _fire(self, payload: Dict[str, Any]) -> None:
+        task = asyncio.create_task(self._deliver(payload))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, payload: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await self.handler(payload) # type: ignore
+                self._metrics["fired"] += 1
+            except Exception as e:
+                self._metrics["failed"] += 1
+                logger.error(f"Failed to deliver reminder {payload.get('reminder_id')}: {e}")
+
+    async def close(self) -> None:
+        for task in (self._task, self._loading):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        self._loading = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+def create_reminder_backend(config: ReminderConfig) -> ReminderBackend:
+    if config.backend == "wheel":
+        return TimingWheelReminderBackend(config)
+    return ServiceBusReminderBackend(reminder_queue, config)
+
+reminder_backend = create_reminder_backend(app_config.reminder_config)
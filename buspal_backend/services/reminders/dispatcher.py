@@ -0,0 +1,145 @@
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
+from buspal_backend.models.reminder import ReminderModel
+from buspal_backend.services.reminders.backends import ReminderBackend, coalesce, reminder_backend, reminder_payload, to_timestamp
+from buspal_backend.services.whatsapp import WhatsappService
+from buspal_backend.config.app_config import app_config, ReminderConfig
+import asyncio
+import datetime
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+def format_reminder(message: str) -> str:
+    return f"🔔 {message}"
+
+def format_reminders(messages: List[str]) -> str:
+    """One WhatsApp message for reminders of the same chat delivered together."""
+    if len(messages) == 1:
+        return format_reminder(messages[0])
+    return "🔔 Reminders:\n" + "\n".join(f"• {message}" for message in messages)
+
+@dataclass
+class DispatchResult:
+    """Outcome of one dispatch run."""
+    sent: List[Dict[str, Any]] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    retried: Dict[str, str] = field(default_factory=dict)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Delivered reminders per second."""
+        return len(self.sent) / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "sent": len(self.sent),
+            "failed": len(self.failed),
+            "retried": len(self.retried),
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "per_second": round(self.throughput, 2)
+        }
+
+class ReminderDispatcher:
+    """
+    Sends reminders through a shared WhatsApp client with bounded concurrency.
+
+    Reminders of the same chat due within `coalesce_window_seconds` of each
+    other go out as one combined message. A chat's messages are sent one
+    after the other in scheduled order, at least `dispatch_chat_interval_ms`
+    apart, while different chats are sent concurrently up to
+    `dispatch_max_concurrency`. Results are
+    written back with one update for the sent reminders and one bulk write
+    for the failed ones.
+
+    A failed reminder is retried on its own: it goes back to scheduled and is
+    handed to the reminder backend again after `send_retry_backoff_seconds`,
+    doubling per attempt. After `max_send_attempts` it is marked failed.
+    """
+
+    def __init__(self, whatsapp_client: WhatsappService, config: ReminderConfig, backend: ReminderBackend):
+        self.whatsapp_client = whatsapp_client
+        self.config = config
+        self.backend = backend
+
+    async def dispatch(self, reminders: List[Dict[str, Any]]) -> DispatchResult:
+        result = DispatchResult()
+        if not reminders:
+            return result
+
+        by_chat: Dict[str, List[Dict[str, Any]]] = {}
+        for reminder in sorted(reminders, key=lambda r: r["scheduled_time"]):
+            by_chat.setdefault(reminder["chat_id"], []).append(reminder)
+
+        semaphore = asyncio.Semaphore(self.config.dispatch_max_concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self._send_chat(chat_reminders, semaphore, result)
+            for chat_reminders in by_chat.values()
+        ))
+        result.elapsed_seconds = time.perf_counter() - started
+
+        # Results are only written while the claims still hold the reminders
+        claim_tokens = {reminder["_id"]: reminder["claim_token"] for reminder in reminders}
+        ReminderModel.mark_many_as_sent({reminder["_id"]: claim_tokens[reminder["_id"]] for reminder in result.sent})
+        await self._settle_failures({reminder["_id"]: reminder for reminder in reminders}, claim_tokens, result)
+        logger.info(f"Dispatched reminders: {result.report()}")
+        return result
+
+    async def _settle_failures(self, reminders: Dict[str, Dict[str, Any]], claim_tokens: Dict[str, str],
+                               result: DispatchResult) -> None:
+        retries = {
+            reminder_id: error for reminder_id, error in result.failed.items()
+            if reminders[reminder_id].get("attempts", 0) < self.config.max_send_attempts
+        }
+        if retries:
+            now = datetime.datetime.utcnow()
+            retry_at = {reminder_id: now + self._backoff(reminders[reminder_id]) for reminder_id in retries}
+            try:
+                ReminderModel.release_for_retry(retries, retry_at, claim_tokens)
+                await self.backend.schedule_many([
+                    (reminder_payload(reminders[reminder_id]), retry_at[reminder_id])
+                    for reminder_id in retries
+                ])
+                result.retried = retries
+                result.failed = {
+                    reminder_id: error for reminder_id, error in result.failed.items() if reminder_id not in retries
+                }
+            except Exception as e:
+                logger.error(f"Failed to reschedule {len(retries)} reminders for retry: {e}")
+        ReminderModel.mark_many_as_failed(result.failed, claim_tokens)
+
+    def _backoff(self, reminder: Dict[str, Any]) -> datetime.timedelta:
+        attempts = max(reminder.get("attempts", 0), 1)
+        return datetime.timedelta(seconds=self.config.send_retry_backoff_seconds * 2 ** (attempts - 1))
+
+    async def _send_chat(self, reminders: List[Dict[str, Any]], semaphore: asyncio.Semaphore,
+                         result: DispatchResult) -> None:
+        interval = self.config.dispatch_chat_interval_ms / 1000
+        last_sent: Optional[float] = None
+        groups = coalesce(reminders, self.config.coalesce_window_seconds, lambda r: to_timestamp(r["scheduled_time"]))
+        for group in groups:
+            if last_sent is not None:
+                # Per-chat rate limit, waited outside the semaphore so other chats keep sending
+                await asyncio.sleep(max(0.0, interval - (time.perf_counter() - last_sent)))
+            chat_id = group[0]["chat_id"]
+            async with semaphore:
+                try:
+                    await self.whatsapp_client.send_message(
+                        chat_id, format_reminders([reminder["message"] for reminder in group]), raise_errors=True
+                    )
+                    result.sent.extend(group)
+                except Exception as e:
+                    logger.error(f"Failed to send {len(group)} reminders to {chat_id}: {e}")
+                    for reminder in group:
+                        result.failed[reminder["_id"]] = str(e)
+            last_sent = time.perf_counter()
+
+# Shared by the reminder functions so they reuse one pooled HTTP session
+whatsapp_client = WhatsappService(
+    api_url=os.environ.get("WHATSAPP_API_URL") # type: ignore
+)
+reminder_dispatcher = ReminderDispatcher(whatsapp_client, app_config.reminder_config, reminder_backend)
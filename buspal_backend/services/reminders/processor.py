@@ -0,0 +1,96 @@
+from buspal_backend.services.reminders.dispatcher import DispatchResult, reminder_dispatcher
+from buspal_backend.services.reminders.backends import reminder_backend, reminder_payload
+from buspal_backend.models.reminder import ReminderModel
+from buspal_backend.services.reminders.recurrence import recurrence_scheduler
+from buspal_backend.config.app_config import app_config
+from typing import Dict, Any, List
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def process_reminders(payloads: List[Dict[str, Any]]) -> DispatchResult:
+    """
+    Deliver a batch of reminder payloads: claim them, send them, record the
+    results and schedule the next occurrence of recurring reminders. Shared
+    by every reminder backend and the Service Bus function.
+    
+    All reminders are claimed in one round-trip, together with every other
+    reminder of their chats due within `coalesce_window_seconds`, which are
+    delivered in the same combined message. Payloads whose reminders were
+    already claimed elsewhere find nothing left to claim and are skipped;
+    those still held by a live claim are rescheduled for its lease expiry.
+    Sending goes through the shared dispatcher, so chats are sent
+    concurrently, results are written in bulk and each failed reminder is
+    retried on its own.
+    
+    Args:
+        payloads: Reminder payloads as enqueued by schedule_reminder, or
+            coalesced payloads listing several reminders in `reminder_ids`
+    
+    Returns:
+        DispatchResult: Outcome of the deliveries
+    """
+    valid = []
+    for payload in payloads:
+        if not all(payload.get(key) for key in ("reminder_id", "chat_id", "message")):
+            logger.error(f"Missing required fields in reminder data: {payload}")
+            continue
+        valid.append(payload)
+    if not valid:
+        return DispatchResult()
+    
+    # Claim before sending so duplicate deliveries and parallel instances send once
+    config = app_config.reminder_config
+    window_end = datetime.datetime.utcnow() + datetime.timedelta(seconds=config.coalesce_window_seconds)
+    reminder_ids = [
+        reminder_id for payload in valid
+        for reminder_id in (payload.get("reminder_ids") or [payload["reminder_id"]])
+    ]
+    reminders = ReminderModel.claim_many(
+        reminder_ids, config.claim_lease_seconds, {payload["chat_id"]: window_end for payload in valid}
+    )
+    skipped = list(set(reminder_ids) - {reminder["_id"] for reminder in reminders})
+    if skipped:
+        logger.info(f"{len(skipped)} reminders already claimed or completed, skipping")
+        await _recheck_at_lease_expiry(skipped)
+    
+    result = await reminder_dispatcher.dispatch(reminders)
+    
+    # Recurring reminders continue from their stored records, unless the next occurrence was precomputed
+    recurring = [reminder for reminder in result.sent if reminder.get("recurrence_pattern")]
+    if recurring:
+        try:
+            await recurrence_scheduler.extend(recurring)
+            logger.info(f"Next occurrences scheduled for {len(recurring)} recurring reminders")
+        except Exception as e:
+            logger.error(f"Failed to schedule next occurrence: {str(e)}")
+    
+    return result
+
+async def _recheck_at_lease_expiry(reminder_ids: List[str]) -> None:
+    """
+    Deliver skipped reminders again when the lease holding them expires, so a
+    reminder whose sender died mid-send is not lost with this delivery.
+    
+    Args:
+        reminder_ids: Reminders whose claim was skipped
+    """
+    try:
+        leased = ReminderModel.get_leased(reminder_ids)
+        if leased:
+            await reminder_backend.schedule_many(
+                [(reminder_payload(reminder), reminder["lease_expires_at"]) for reminder in leased]
+            )
+            logger.info(f"{len(leased)} leased reminders rescheduled for their lease expiry")
+    except Exception as e:
+        logger.error(f"Failed to reschedule leased reminders: {str(e)}")
+
+async def process_reminder(reminder_data: Dict[str, Any]) -> None:
+    """
+    Deliver one reminder payload, see process_reminders.
+    
+    Args:
+        reminder_data: Reminder payload as enqueued by schedule_reminder
+    """
+    await process_reminders([reminder_data])
@@ -0,0 +1,341 @@
+from dataclasses import dataclass, replace
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from buspal_backend.models.reminder import ReminderModel
+from buspal_backend.services.reminders.backends import ReminderBackend, reminder_backend, reminder_payload
+from buspal_backend.services.reminders.rephraser import ReminderRephraser, reminder_rephraser
+import calendar
+import datetime
+import uuid
+import pytz
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Reminders are written and repeated in the group's wall-clock time
+LOCAL_TIMEZONE = pytz.timezone("Asia/Beirut")
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+
+# Guard against rules that never produce a later occurrence in a window
+MAX_OCCURRENCES_PER_WINDOW = 400
+
+@dataclass(frozen=True)
+class RecurrenceRule:
+    """
+    A subset of RFC 5545 RRULE: FREQ, INTERVAL, BYDAY, BYMONTHDAY, COUNT and UNTIL.
+
+    Rules are stored on each occurrence as a string, e.g.
+    "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;COUNT=6". COUNT is the number of
+    occurrences left including the one it is stored on, so it goes down by
+    one per occurrence. The legacy "daily", "weekly", "monthly" and "yearly"
+    patterns parse as the matching FREQ.
+    """
+    freq: str
+    interval: int = 1
+    by_weekday: Tuple[int, ...] = ()
+    by_month_day: Optional[int] = None
+    count: Optional[int] = None
+    until: Optional[datetime.datetime] = None
+
+    @classmethod
+    def parse(cls, pattern: str) -> "RecurrenceRule":
+        """
+        Parse a recurrence pattern.
+
+        Args:
+            pattern: RRULE string (with or without the "RRULE:" prefix) or a legacy pattern name
+
+        Returns:
+            RecurrenceRule: The parsed rule
+
+        Raises:
+            ValueError: If the pattern is not a supported rule
+        """
+        text = pattern.strip().upper()
+        if text.startswith("RRULE:"):
+            text = text[len("RRULE:"):]
+        if text in FREQUENCIES:
+            return cls(freq=text)
+
+        parts: Dict[str, str] = {}
+        for part in filter(None, text.split(";")):
+            key, separator, value = part.partition("=")
+            if not separator or not value:
+                raise ValueError(f"Invalid recurrence rule part: {part}")
+            parts[key] = value
+
+        freq = parts.pop("FREQ", None)
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Recurrence rule needs FREQ set to one of {', '.join(FREQUENCIES)}")
+        try:
+            interval = int(parts.pop("INTERVAL", "1"))
+            count = int(parts["COUNT"]) if "COUNT" in parts else None
+            by_month_day = int(parts["BYMONTHDAY"]) if "BYMONTHDAY" in parts else None
+        except ValueError:
+            raise ValueError(f"Invalid number in recurrence rule: {pattern}")
+        parts.pop("COUNT", None)
+        parts.pop("BYMONTHDAY", None)
+
+        by_weekday = ()
+        if "BYDAY" in parts:
+            days = parts.pop("BYDAY").split(",")
+            if any(day not in WEEKDAYS for day in days):
+                raise ValueError(f"Invalid BYDAY in recurrence rule: {pattern}")
+            by_weekday = tuple(sorted({WEEKDAYS.index(day) for day in days}))
+
+        until = cls._parse_until(parts.pop("UNTIL")) if "UNTIL" in parts else None
+        if parts:
+            raise ValueError(f"Unsupported recurrence rule parts: {', '.join(parts)}")
+        if interval < 1 or (count is not None and count < 1):
+            raise ValueError("INTERVAL and COUNT must be positive")
+        if by_weekday and freq not in ("DAILY", "WEEKLY"):
+            raise ValueError("BYDAY is only supported with FREQ=DAILY or FREQ=WEEKLY")
+        if by_month_day is not None and (freq not in ("MONTHLY", "YEARLY") or not 1 <= by_month_day <= 31):
+            raise ValueError("BYMONTHDAY must be 1-31 and is only supported with FREQ=MONTHLY or FREQ=YEARLY")
+        return cls(freq, interval, by_weekday, by_month_day, count, until)
+
+    @staticmethod
+    def _parse_until(value: str) -> datetime.datetime:
+        # A trailing Z means UTC, otherwise the time is local wall-clock time
+        for fmt in ("%Y%m%dT%H%M%SZ", "%Y%m%dT%H%M%S"):
+            try:
+                until = datetime.datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+            return until.replace(tzinfo=pytz.utc) if value.endswith("Z") else until
+        try:
+            # A date alone includes the whole day
+            return datetime.datetime.strptime(value, "%Y%m%d").replace(hour=23, minute=59, second=59)
+        except ValueError:
+            raise ValueError(f"Invalid UNTIL in recurrence rule: {value}")
+
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.by_weekday:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in self.by_weekday))
+        if self.by_month_day is not None:
+            parts.append(f"BYMONTHDAY={self.by_month_day}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append("UNTIL=" + self.until.strftime("%Y%m%dT%H%M%S" + ("Z" if self.until.tzinfo else "")))
+        return ";".join(parts)
+
+    def anchored(self, local: datetime.datetime) -> "RecurrenceRule":
+        """Pin monthly and yearly rules to the day of `local`, so short months do not shift the series."""
+        if self.freq in ("MONTHLY", "YEARLY") and self.by_month_day is None:
+            return replace(self, by_month_day=local.day)
+        return self
+
+    def following(self) -> Optional["RecurrenceRule"]:
+        """The rule stored on the next occurrence, or None if this occurrence is the last one."""
+        if self.count is None:
+            return self
+        if self.count <= 1:
+            return None
+        return replace(self, count=self.count - 1)
+
+    def next_after(self, local: datetime.datetime) -> Optional[datetime.datetime]:
+        """
+        The occurrence after `local`, in naive local wall-clock time.
+
+        Args:
+            local: Naive local time of the current occurrence
+
+        Returns:
+            The next occurrence, or None if the rule has none
+        """
+        if self.freq == "DAILY":
+            candidate = local
+            # Seven steps visit every weekday the interval can reach
+            for _ in range(7):
+                candidate += datetime.timedelta(days=self.interval)
+                if not self.by_weekday or candidate.weekday() in self.by_weekday:
+                    return candidate
+            return None
+        if self.freq == "WEEKLY":
+            days = self.by_weekday or (local.weekday(),)
+            later = [day for day in days if day > local.weekday()]
+            if later:
+                return local + datetime.timedelta(days=later[0] - local.weekday())
+            week_start = local - datetime.timedelta(days=local.weekday())
+            return week_start + datetime.timedelta(weeks=self.interval, days=days[0])
+        months = self.interval if self.freq == "MONTHLY" else 12 * self.interval
+        return add_months(local, months, self.by_month_day or local.day)
+
+    def is_past_until(self, local: datetime.datetime, utc: datetime.datetime) -> bool:
+        if self.until is None:
+            return False
+        if self.until.tzinfo is None:
+            return local > self.until
+        return utc > self.until
+
+    def occurrences(self, start: datetime.datetime, end: Optional[datetime.datetime] = None,
+                    limit: int = MAX_OCCURRENCES_PER_WINDOW) -> Iterator[Tuple[datetime.datetime, Optional["RecurrenceRule"]]]:
+        """
+        Occurrences following the one at `start`, each with the rule it carries.
+
+        Args:
+            start: UTC time (naive or aware) of the current occurrence, which this rule is stored on
+            end: Stop before occurrences later than this UTC time; None yields only the next occurrence
+            limit: Maximum number of occurrences to yield
+
+        Yields:
+            (naive UTC time, rule) pairs; the rule is None on the last occurrence of the series
+        """
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=pytz.utc)
+        if end is not None and end.tzinfo is None:
+            end = end.replace(tzinfo=pytz.utc)
+        local = start.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)
+        rule: Optional[RecurrenceRule] = self.anchored(local)
+        for _ in range(limit if end is not None else 1):
+            following = rule.following() if rule else None
+            if following is None:
+                return
+            local = following.next_after(local)
+            if local is None:
+                return
+            # Localize the wall-clock time so occurrences keep their hour across DST changes
+            utc = LOCAL_TIMEZONE.localize(local).astimezone(pytz.utc)
+            if following.is_past_until(local, utc) or (end is not None and utc > end):
+                return
+            last = following.following() is None
+            yield utc.replace(tzinfo=None), None if last else following
+            rule = following
+
+def add_months(dt: datetime.datetime, months: int, day: int) -> datetime.datetime:
+    """
+    Move a datetime by whole months onto `day`, clamped to the length of the target month.
+
+    Args:
+        dt: datetime object
+        months: number of months to add
+        day: day of the month to land on
+
+    Returns:
+        datetime: new datetime with months added
+    """
+    month = dt.month - 1 + months
+    year = dt.year + month // 12
+    month = month % 12 + 1
+    return dt.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+
+def occurrence_id(series_id: str, scheduled_time: datetime.datetime) -> str:
+    """Deterministic ID of a series occurrence, so concurrent schedulers create it only once."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{series_id}/{scheduled_time.isoformat()}"))
+
+class RecurrenceScheduler:
+    """
+    Creates the upcoming occurrences of recurring reminders.
+
+    Occurrences are written straight to the database in one insert, linked
+    from the occurrence before them through `next_occurrence_id`, and handed
+    to the reminder backend in one batch. Occurrence IDs derive from the
+    series and time, so the daily precompute and a firing reminder can race
+    without creating duplicates.
+    """
+
+    def __init__(self, backend: ReminderBackend, rephraser: ReminderRephraser):
+        self.backend = backend
+        self.rephraser = rephraser
+
+    def expand(self, reminder: Dict[str, Any], end: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Build the occurrences following `reminder`, up to `end` or just the next one.
+
+        Args:
+            reminder: Reminder document with a recurrence pattern
+            end: UTC end of the window; None for only the next occurrence
+
+        Returns:
+            Occurrence fields for ReminderModel.create_many, in order
+        """
+        try:
+            rule = RecurrenceRule.parse(reminder["recurrence_pattern"])
+        except ValueError as e:
+            logger.warning(f"Skipping reminder {reminder['_id']} with invalid recurrence: {e}")
+            return []
+
+        series_id = reminder.get("series_id") or reminder["_id"]
+        variants = list(reminder.get("message_variants") or [])
+        occurrences = []
+        for scheduled_time, next_rule in rule.occurrences(reminder["scheduled_time"], end):
+            # Each occurrence takes the next pre-generated wording and carries the rest forward
+            message = variants.pop(0) if variants else reminder["message"]
+            occurrences.append({
+                "reminder_id": occurrence_id(series_id, scheduled_time),
+                "chat_id": reminder["chat_id"],
+                "message": message,
+                "scheduled_time": scheduled_time,
+                "recurrence_pattern": str(next_rule) if next_rule else None,
+                "status": "pending",
+                "message_variants": list(variants),
+                "series_id": series_id
+            })
+        return occurrences
+
+    async def extend(self, reminders: List[Dict[str, Any]], end: Optional[datetime.datetime] = None) -> int:
+        """
+        Create and schedule the occurrences following each reminder.
+
+        Args:
+            reminders: Recurring reminder documents that are the latest of their series
+            end: UTC end of the window; None for only the next occurrence of each
+
+        Returns:
+            int: Number of occurrences created
+        """
+        occurrences: List[Dict[str, Any]] = []
+        links: Dict[str, str] = {}
+        tails: List[Dict[str, Any]] = []
+        for reminder in reminders:
+            if reminder.get("next_occurrence_id") or not reminder.get("recurrence_pattern"):
+                continue
+            series = self.expand(reminder, end)
+            if not series:
+                continue
+            previous = reminder["_id"]
+            for occurrence in series:
+                links[previous] = occurrence["reminder_id"]
+                previous = occurrence["reminder_id"]
+            occurrences.extend(series)
+            tails.append(series[-1])
+        if not occurrences:
+            return 0
+
+        created = ReminderModel.create_many(occurrences)
+        ReminderModel.link_occurrences(links)
+        await self._schedule(created)
+
+        for tail in tails:
+            variants = tail["message_variants"]
+            if tail["recurrence_pattern"] and self.rephraser.needs_refill(variants):
+                self.rephraser.refill(tail["reminder_id"], variants[-1] if variants else tail["message"])
+        logger.info(f"Created {len(created)} occurrences for {len(tails)} recurring reminders")
+        return len(created)
+
+    async def _schedule(self, reminders: List[Dict[str, Any]]) -> None:
+        # Occurrences beyond the backend's horizon stay pending for the daily job
+        accepted = [reminder for reminder in reminders if self.backend.accepts(reminder["scheduled_time"])]
+        if not accepted:
+            return
+        await self.backend.schedule_many([(reminder_payload(reminder), reminder["scheduled_time"]) for reminder in accepted])
+        ReminderModel.move_many_to_service_bus([reminder["_id"] for reminder in accepted])
+
+    async def precompute(self, days_ahead: int, batch_size: int = 1000) -> int:
+        """
+        Create every occurrence due within `days_ahead` days for all recurring
+        series whose latest occurrence falls in that window.
+
+        Returns:
+            int: Number of occurrences created
+        """
+        end = datetime.datetime.utcnow() + datetime.timedelta(days=days_ahead)
+        tails = list(ReminderModel.get_recurring_tails(days_ahead, batch_size))
+        return await self.extend(tails, end)
+
+recurrence_scheduler = RecurrenceScheduler(reminder_backend, reminder_rephraser)
@@ -0,0 +1,233 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Set, Tuple
+from buspal_backend.config.app_config import app_config, ReminderConfig
+import asyncio
+import datetime
+import heapq
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+QueuedReminder = Tuple[Dict[str, Any], datetime.datetime]
+
+class ReminderQueue(ABC):
+    """
+    Delayed queue that reminder payloads are enqueued on until they are due.
+
+    `send` coalesces reminders created in the same burst: the first send opens
+    a `send_batch_window_ms` window, and everything sent within it (up to
+    `send_max_batch`) goes out in one batch. Each caller still awaits its own
+    result, so a failed batch fails every reminder in it.
+    """
+
+    def __init__(self, config: ReminderConfig):
+        self.config = config
+        self._pending: List[Tuple[QueuedReminder, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self.metrics = {
+            "sent": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "last_batch_size": 0,
+            "last_batch_ms": 0.0,
+        }
+
+    async def send(self, payload: Dict[str, Any], scheduled_time: datetime.datetime) -> None:
+        """Enqueue one reminder payload to be delivered at `scheduled_time` (UTC)."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((payload, scheduled_time), future))
+        if len(self._pending) >= self.config.send_max_batch:
+            batch, self._pending = self._pending, []
+            self._spawn(self._flush(batch))
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after(self.config.send_batch_window_ms / 1000))
+        await future
+
+    async def send_many(self, reminders: List[QueuedReminder]) -> None:
+        """Enqueue reminders the caller has already grouped, without waiting for a window."""
+        for start in range(0, len(reminders), self.config.send_max_batch):
+            await self._send_timed(reminders[start:start + self.config.send_max_batch])
+
+    def _spawn(self, coroutine) -> None:
+        # Keep a reference so in-flight flushes are not garbage collected
+        task = asyncio.create_task(coroutine)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _flush_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        batch, self._pending = self._pending, []
+        self._flush_task = None
+        await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[QueuedReminder, asyncio.Future]]) -> None:
+        if not batch:
+            return
+        try:
+            await self._send_timed([reminder for reminder, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def _send_timed(self, reminders: List[QueuedReminder]) -> None:
+        started = time.perf_counter()
+        try:
+            await self._send_batch(reminders)
+        except Exception:
+            self.metrics["failed_batches"] += 1
+            raise
+        self.metrics["sent"] += len(reminders)
+        self.metrics["batches"] += 1
+        self.metrics["last_batch_size"] = len(reminders)
+        self.metrics["last_batch_ms"] = (time.perf_counter() - started) * 1000
+
+    @abstractmethod
+    async def _send_batch(self, reminders: List[QueuedReminder]) -> None:
+        """Deliver a batch of reminders to the underlying queue."""
+        pass
+
+    async def start(self) -> None:
+        """Open connections ahead of the first send. Optional, sends connect lazily."""
+        pass
+
+    async def close(self) -> None:
+        """Send anything still waiting for its window and release connections."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        batch, self._pending = self._pending, []
+        await self._flush(batch)
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+class ServiceBusReminderQueue(ReminderQueue):
+    """
+    Azure Service Bus queue using scheduled messages.
+
+    A single client and sender are kept open for the life of the process.
+    When a send fails with a Service Bus error the connection is dropped and
+    the reminders not sent yet are retried once on a fresh one.
+    """
+
+    def __init__(self, config: ReminderConfig):
+        super().__init__(config)
+        self._client = None
+        self._sender = None
+        self._connect_lock = asyncio.Lock()
+        self.metrics["reconnects"] = 0
+
+    async def _get_sender(self):
+        async with self._connect_lock:
+            if self._sender is None:
+                from azure.servicebus.aio import ServiceBusClient
+                if not self.config.connection_string:
+                    raise ValueError("Service Bus connection string not configured")
+                self._client = ServiceBusClient.from_connection_string(self.config.connection_string)
+                self._sender = self._client.get_queue_sender(self.config.queue_name)
+            return self._sender
+
+    async def _disconnect(self) -> None:
+        async with self._connect_lock:
+            sender, client = self._sender, self._client
+            self._sender = self._client = None
+        for resource in (sender, client):
+            if resource is None:
+                continue
+            try:
+                await resource.close()
+            except Exception as e:
+                logger.warning(f"Error closing Service Bus connection: {e}")
+
+    async def _send_batch(self, reminders: List[QueuedReminder]) -> None:
+        from azure.servicebus.exceptions import ServiceBusError
+        # Reminders leave `unsent` once Service Bus accepted their batch, so the retry never resends them
+        unsent = list(reminders)
+        try:
+            await self._send_with(await self._get_sender(), unsent)
+        except ServiceBusError as e:
+            logger.warning(f"Service Bus send failed after {len(reminders) - len(unsent)} of {len(reminders)} messages, reconnecting: {e}")
+            await self._disconnect()
+            self.metrics["reconnects"] += 1
+            await self._send_with(await self._get_sender(), unsent)
+
+    async def _send_with(self, sender, unsent: List[QueuedReminder]) -> None:
+        """Send `unsent` in as few message batches as fit, removing reminders as their batch is sent."""
+        from azure.servicebus import ServiceBusMessage
+        from azure.servicebus.exceptions import MessageSizeExceededError
+        batch = await sender.create_message_batch()
+        batched = 0
+        for payload, scheduled_time in list(unsent):
+            message = ServiceBusMessage(body=json.dumps(payload), scheduled_enqueue_time_utc=scheduled_time)
+            try:
+                batch.add_message(message)
+            except MessageSizeExceededError:
+                # Batch is full: send it and start a new one
+                await sender.send_messages(batch)
+                del unsent[:batched]
+                batch = await sender.create_message_batch()
+                batched = 0
+                batch.add_message(message)
+            batched += 1
+        if batched:
+            await sender.send_messages(batch)
+            del unsent[:batched]
+
+    async def start(self) -> None:
+        await self._get_sender()
+
+    async def close(self) -> None:
+        await super().close()
+        await self._disconnect()
+
+class InMemoryReminderQueue(ReminderQueue):
+    """
+    Process-local stand-in for the Service Bus queue.
+
+    Messages are kept in a heap ordered by scheduled time. `latency_ms`
+    simulates the round-trip of one batch send so batching behaviour and
+    latency can be measured without a cloud service.
+    """
+
+    def __init__(self, config: ReminderConfig, latency_ms: float = 0.0):
+        super().__init__(config)
+        self.latency_ms = latency_ms
+        self._messages: List[Tuple[datetime.datetime, int, Dict[str, Any]]] = []
+        self._sequence = 0
+        self.batch_sizes: List[int] = []
+
+    async def _send_batch(self, reminders: List[QueuedReminder]) -> None:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        for payload, scheduled_time in reminders:
+            if scheduled_time.tzinfo is None:
+                scheduled_time = scheduled_time.replace(tzinfo=datetime.timezone.utc)
+            # Round-trip through JSON so payloads look exactly like received messages
+            heapq.heappush(self._messages, (scheduled_time, self._sequence, json.loads(json.dumps(payload))))
+            self._sequence += 1
+        self.batch_sizes.append(len(reminders))
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def pop_due(self, now: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """Remove and return every payload whose scheduled time has passed."""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        due = []
+        while self._messages and self._messages[0][0] <= now:
+            due.append(heapq.heappop(self._messages)[2])
+        return due
+
+def create_reminder_queue(config: ReminderConfig) -> ReminderQueue:
+    if config.queue_backend == "memory":
+        return InMemoryReminderQueue(config)
+    return ServiceBusReminderQueue(config)
+
+reminder_queue = create_reminder_queue(app_config.reminder_config)
@@ -0,0 +1,72 @@
+from typing import List, Optional, Set
+from buspal_backend.models.reminder import ReminderModel
+from buspal_backend.services.ai.ai_provider import AIProvider
+from buspal_backend.types.enums import AIMode
+from buspal_backend.config.app_config import app_config, ReminderConfig
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ReminderRephraser:
+    """
+    Keeps recurring reminders stocked with pre-written wordings.
+
+    The next `rephrase_variant_count` messages of a series are generated in a
+    single request and stored on the reminder as `message_variants`. Each
+    occurrence takes the first variant and hands the rest to the next one,
+    so firing a reminder never waits on the model. When a reminder is left
+    with `rephrase_refill_threshold` variants or fewer, a refill continuing
+    from the last queued wording runs in the background. Short-lived callers
+    (the reminder functions) await `shutdown` before returning so refills are
+    not dropped with the invocation.
+    """
+
+    def __init__(self, config: ReminderConfig):
+        self.config = config
+        self._ai_service: Optional[AIProvider] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    @property
+    def ai_service(self) -> AIProvider:
+        if self._ai_service is None:
+            # Imported here: the AI services import the tools, which use this module
+            from buspal_backend.services.ai.ai_service_factory import AIServiceFactory
+            self._ai_service = AIServiceFactory.get_service(AIMode.BUDDY, "gemini")
+        return self._ai_service
+
+    async def generate(self, last_message: str, count: int) -> List[str]:
+        """The next `count` wordings of a reminder series, following `last_message`."""
+        result = await self.ai_service.generate_completion(
+            [{"message": last_message, "count": count}], "REMINDER_SERIES"
+        )
+        messages = json.loads(result or "{}").get("messages") or []
+        return [message.strip() for message in messages if isinstance(message, str) and message.strip()][:count]
+
+    def needs_refill(self, variants: List[str]) -> bool:
+        return len(variants) <= self.config.rephrase_refill_threshold
+
+    def refill(self, reminder_id: str, last_message: str) -> None:
+        """Append a fresh batch of variants to a reminder in the background."""
+        task = asyncio.create_task(self._refill(reminder_id, last_message))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _refill(self, reminder_id: str, last_message: str) -> None:
+        try:
+            variants = await self.generate(last_message, self.config.rephrase_variant_count)
+            if variants:
+                # Occurrences created while generating took the old variants along, store on the newest
+                tail_id = ReminderModel.get_series_tail(reminder_id)
+                ReminderModel.add_message_variants(tail_id, variants)
+                logger.info(f"Stored {len(variants)} message variants for reminder {tail_id}")
+        except Exception as e:
+            logger.error(f"Failed to generate message variants for reminder {reminder_id}: {e}")
+
+    async def shutdown(self) -> None:
+        """Wait for in-flight refills to finish."""
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+
+reminder_rephraser = ReminderRephraser(app_config.reminder_config)
@@ -0,0 +1,61 @@
+from typing import Dict, Any, Optional
+from bson import encode
+from buspal_backend.models.conversation import ConversationModel
+from buspal_backend.types.enums import AIMode
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class ConversationSnapshot:
+    """
+    Request-scoped view of a conversation document.
+
+    Each projection is read at most once per webhook, and the number of BSON
+    bytes returned by Mongo is tracked so it can be reported per message.
+    """
+
+    def __init__(self, convo_id: str):
+        self.convo_id = convo_id
+        self.bytes_read = 0
+        self.reads = 0
+        self._header: Any = _MISSING
+        self._context: Any = _MISSING
+
+    def _track(self, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        self.reads += 1
+        if document:
+            self.bytes_read += len(encode(document))
+        return document
+
+    @property
+    def header(self) -> Optional[Dict[str, Any]]:
+        if self._header is _MISSING:
+            self._header = self._track(ConversationModel.get_header(self.convo_id))
+        return self._header
+
+    @property
+    def exists(self) -> bool:
+        return self.header is not None
+
+    @property
+    def mode(self) -> AIMode:
+        mode = (self.header or {}).get("mode")
+        return AIMode(mode) if mode else AIMode.BUDDY
+
+    @property
+    def roster_synced_at(self):
+        return (self.header or {}).get("roster_synced_at")
+
+    def mark_created(self, conversation: Dict[str, Any]) -> None:
+        """Record a conversation created during this request so later reads skip the lookup."""
+        self._header = {key: conversation.get(key) for key in ("convo_id", "name", "mode", "roster_synced_at")}
+
+    def context(self, summary_count: int) -> Optional[Dict[str, Any]]:
+        if self._context is _MISSING:
+            self._context = self._track(ConversationModel.get_context(self.convo_id, summary_count))
+        return self._context
+
+    def report(self) -> None:
+        logger.info(f"Conversation reads for {self.convo_id}: {self.reads} queries, {self.bytes_read} bytes")
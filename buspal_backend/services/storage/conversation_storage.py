@@ -1,8 +1,9 @@
 from typing import Dict, Any, List, Optional
 from buspal_backend.models.conversation import ConversationModel
-from buspal_backend.services.ai.ai_provider import AIProvider
-from buspal_backend.services.ai.ai_service_factory import AIServiceFactory
-from buspal_backend.types.enums import AIMode
+from buspal_backend.services.storage.write_buffer import message_buffer
+from buspal_backend.services.storage.retrieval_index import conversation_index
+from buspal_backend.services.storage.conversation_snapshot import ConversationSnapshot
+from buspal_backend.services.storage.media_store import media_store
 from buspal_backend.utils.helpers import get_user_by
 from buspal_backend.core.exceptions import ConversationStorageError
 from buspal_backend.config.app_config import app_config
@@ -15,81 +16,80 @@ class ConversationStorage:
     """Handles conversation storage and summarization logic."""
     
     def __init__(self):
-        self.ai_service = AIServiceFactory.get_service(AIMode.BUDDY, "gemini")
         self.config = app_config.message_config
     
-    async def store_message_and_summarize(self, remote_id: str, messages: List[Dict[str, Any]]) -> None:
-        """Store messages and handle summarization when threshold is reached."""
+    async def store_message_and_summarize(self, remote_id: str, messages: List[Dict[str, Any]], snapshot: Optional[ConversationSnapshot] = None) -> None:
+        """Queue the latest message for storage. The write buffer schedules summarization once the threshold is reached."""
         try:
-            conversation = await get_user_by(remote_id)
-            current_message_count = len(conversation.get("messages", []))
-            
-            if current_message_count >= self.config.summary_message_threshold:
-                await self._create_summary_and_reset(remote_id, conversation)
-            else:
-                await self._store_latest_message(remote_id, messages)
+            # Ensures the conversation document exists
+            if snapshot is None or not snapshot.exists:
+                conversation = await get_user_by(remote_id)
+                if snapshot and conversation:
+                    snapshot.mark_created(conversation)
+            await self._store_latest_message(remote_id, messages)
                 
         except Exception as e:
             logger.error(f"Error in message storage for {remote_id}: {e}")
             raise ConversationStorageError(f"Failed to store conversation: {e}")
     
-    async def _create_summary_and_reset(self, remote_id: str, conversation: Dict[str, Any]) -> None:
-        """Create summary and reset message history."""
-        try:
-            result = await self.ai_service.generate_completion(conversation["messages"], "SUMMARY")
-            response = json.loads(result)
-            
-            logger.debug(f"Summary generated for {remote_id}: {result}")
-            
-            # Store summary
-            ConversationModel.update_by_id(remote_id, {
-                "summaries": {
-                    "content": response.get('content'),
-                    "participants": response.get('participants'),
-                    "start_date": response.get('start_date'),
-                    "end_date": response.get('end_date')
-                }
-            }, "$push")
-            
-            # Reset messages
-            ConversationModel.update_by_id(remote_id, {"messages": []})
-            
-        except Exception as e:
-            raise ConversationStorageError(f"Failed to create summary: {e}")
-    
     async def _store_latest_message(self, remote_id: str, messages: List[Dict[str, Any]]) -> None:
         """Store the latest message."""
         try:
             if not messages:
                 return
             
-            last_index = len(messages) - 1
-            if last_index < 0:
-                return
             logger.debug(f"Adding message for {remote_id}")
-            ConversationModel.update_by_id(
-                remote_id, 
-                {"messages": messages[last_index]}, 
-                "$push"
-            )
+            # Media goes to the blob store, the document only keeps a reference
+            message_buffer.append(remote_id, media_store.offload(messages[-1]))
             
         except Exception as e:
             raise ConversationStorageError(f"Failed to store message: {e}")
     
-    def get_conversation_context(self, remote_id: str) -> Optional[str]:
-        """Retrieve conversation context for AI processing."""
+    async def get_conversation_context(self, remote_id: str, query: Optional[str] = None, snapshot: Optional[ConversationSnapshot] = None) -> Optional[str]:
+        """
+        Retrieve conversation context for AI processing: a digest of compacted history,
+        the archived summaries and messages most relevant to `query`, and the most recent summaries.
+
+        Context is built from summarized history only. Summaries are produced from flushed
+        messages, so appends still sitting in the write buffer never change it.
+        """
         try:
-            conversation = ConversationModel.get_by_id(remote_id)
+            summary_count = self.config.summary_context_count
+            if snapshot:
+                conversation = snapshot.context(summary_count)
+            else:
+                conversation = ConversationModel.get_context(remote_id, summary_count)
             
-            if not conversation or not conversation.get('summaries'):
+            if not conversation or not (conversation.get('summaries') or conversation.get('digests')):
                 return None
             
-            last_15_summaries = '\n'.join(
-                f"{json.dumps(summary)}" 
-                for summary in conversation['summaries'][-15:]
-            )
+            sections = []
+            digests = conversation.get('digests') or {}
+            # Highest level covers the oldest history
+            digest = [
+                summary
+                for level in sorted(digests, key=int, reverse=True)
+                for summary in digests[level]
+            ]
+            if digest:
+                sections.append("#History digest:\n" + '\n'.join(json.dumps(summary) for summary in digest))
+            
+            recent_summaries = conversation.get('summaries', [])
+            
+            if query:
+                recent_contents = {summary.get('content') for summary in recent_summaries}
+                relevant = [
+                    summary
+                    for summary in await conversation_index.search(remote_id, query, self.config.summary_retrieval_count)
+                    if summary.get('content') not in recent_contents
+                ]
+                if relevant:
+                    sections.append("#Relevant history:\n" + '\n'.join(json.dumps(summary) for summary in relevant))
+            
+            if recent_summaries:
+                sections.append("#History:\n" + '\n'.join(json.dumps(summary) for summary in recent_summaries))
             
-            return f"#History:\n{last_15_summaries}"
+            return '\n'.join(sections)
             
         except Exception as e:
             logger.error(f"Error retrieving context for {remote_id}: {e}")
@@ -0,0 +1,138 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional
+from buspal_backend.config.app_config import app_config, StorageConfig
+import base64
+import hashlib
+import os
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+MEDIA_REF_KEY = "media_ref"
+
+class MediaStore(ABC):
+    """
+    Content-addressed store for message media.
+
+    Messages keep a `media_ref` (the SHA-256 of the media bytes) instead of the
+    base64 payload, so identical media is stored once and conversation documents
+    stay small. References are resolved back to base64 only when a reader needs them.
+    """
+
+    @abstractmethod
+    def put(self, data: bytes, mime_type: str) -> str:
+        """Store media bytes and return their reference. Storing existing content is a no-op."""
+        pass
+
+    @abstractmethod
+    def get(self, ref: str) -> Optional[bytes]:
+        """Return the bytes for a reference, or None if it is unknown."""
+        pass
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def offload(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a copy of the message with inline base64 media replaced by a reference."""
+        message = dict(message)
+        if "base64" in message:
+            message = self._offload_part(message)
+        reply_to = message.get("reply_to")
+        if isinstance(reply_to, dict) and "base64" in reply_to:
+            message["reply_to"] = self._offload_part(reply_to)
+        return message
+
+    def resolve(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a copy of the message with media references loaded back as base64."""
+        message = dict(message)
+        if MEDIA_REF_KEY in message:
+            message = self._resolve_part(message)
+        reply_to = message.get("reply_to")
+        if isinstance(reply_to, dict) and MEDIA_REF_KEY in reply_to:
+            message["reply_to"] = self._resolve_part(reply_to)
+        return message
+
+    def _offload_part(self, part: Dict[str, Any]) -> Dict[str, Any]:
+        part = dict(part)
+        data = base64.b64decode(part.pop("base64"))
+        part[MEDIA_REF_KEY] = self.put(data, part.get("mimeType", "application/octet-stream"))
+        return part
+
+    def _resolve_part(self, part: Dict[str, Any]) -> Dict[str, Any]:
+        part = dict(part)
+        ref = part.pop(MEDIA_REF_KEY)
+        data = self.get(ref)
+        if data is None:
+            logger.warning(f"Media {ref} not found in store")
+            return part
+        part["base64"] = base64.b64encode(data).decode("ascii")
+        return part
+
+class LocalMediaStore(MediaStore):
+    """Stores media as files under `root`, sharded by the first two hash characters."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, ref: str) -> str:
+        return os.path.join(self.root, ref[:2], ref)
+
+    def put(self, data: bytes, mime_type: str) -> str:
+        ref = self.content_hash(data)
+        path = self._path(ref)
+        if os.path.exists(path):
+            return ref
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent writers never expose a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return ref
+
+    def get(self, ref: str) -> Optional[bytes]:
+        try:
+            with open(self._path(ref), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+class GridFSMediaStore(MediaStore):
+    """Stores media in GridFS, using the content hash as the file id."""
+
+    def __init__(self, database, bucket: str = "media"):
+        import gridfs
+        self.fs = gridfs.GridFS(database, collection=bucket)
+
+    def put(self, data: bytes, mime_type: str) -> str:
+        from gridfs.errors import FileExists
+        ref = self.content_hash(data)
+        if self.fs.exists(ref):
+            return ref
+        try:
+            self.fs.put(data, _id=ref, content_type=mime_type)
+        except FileExists:
+            pass
+        return ref
+
+    def get(self, ref: str) -> Optional[bytes]:
+        from gridfs.errors import NoFile
+        try:
+            return self.fs.get(ref).read()
+        except NoFile:
+            return None
+
+def create_media_store(config: StorageConfig) -> MediaStore:
+    if config.media_backend == "gridfs":
+        from buspal_backend.db.mongo import db
+        return GridFSMediaStore(db, config.media_bucket)
+    return LocalMediaStore(config.media_path)
+
+media_store = create_media_store(app_config.storage_config)
@@ -0,0 +1,158 @@
+from typing import Dict, Any, List, Tuple
+from array import array
+from collections import Counter, defaultdict
+from cachetools import LRUCache
+from buspal_backend.models.summary_archive import SummaryArchiveModel
+from buspal_backend.config.app_config import app_config
+import asyncio
+import heapq
+import math
+import re
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have",
+    "he", "her", "his", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "she",
+    "so", "that", "the", "their", "them", "they", "this", "to", "was", "we", "were", "what",
+    "when", "who", "will", "with", "you", "your", "bot", "ava"
+})
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS and len(token) > 1]
+
+class BM25Index:
+    """Incremental Okapi BM25 index over archived conversation summaries and messages."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.entries: List[Dict[str, Any]] = []
+        self.doc_lengths = array("I")
+        # term -> (doc ids, term frequencies), kept as compact arrays to bound memory on large chats
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def entry_text(entry: Dict[str, Any]) -> str:
+        participants = entry.get("participants") or []
+        return f"{entry.get('content') or ''} {' '.join(participants)}"
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        """Index an entry. Only postings for its own terms are touched."""
+        doc_id = len(self.entries)
+        terms = Counter(tokenize(self.entry_text(entry)))
+        self.entries.append(entry)
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        for term, frequency in terms.items():
+            if term not in self.postings:
+                self.postings[term] = (array("I"), array("I"))
+            doc_ids, frequencies = self.postings[term]
+            doc_ids.append(doc_id)
+            frequencies.append(frequency)
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        """Return the `k` best matching entries, most relevant first."""
+        if not self.entries or k <= 0:
+            return []
+        doc_count = len(self.entries)
+        avg_length = self.total_length / doc_count or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            doc_ids, frequencies = postings
+            idf = math.log(1 + (doc_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            for doc_id, frequency in zip(doc_ids, frequencies):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.entries[doc_id] for doc_id, _ in best]
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the index structures (excluding the entry payloads)."""
+        size = sys.getsizeof(self.entries) + sys.getsizeof(self.doc_lengths) + sys.getsizeof(self.postings)
+        for term, (doc_ids, frequencies) in self.postings.items():
+            size += sys.getsizeof(term) + sys.getsizeof(doc_ids) + sys.getsizeof(frequencies)
+        return size
+
+class ConversationIndexRegistry:
+    """
+    Keeps one BM25 index per recently active chat, loaded lazily from the summary archive.
+
+    An index covers the `max_entries` most recently archived entries of its chat. Loading
+    runs in a worker thread and at most once per chat at a time. Entries archived while a
+    load is in flight are applied once it completes unless the load already read them.
+    An index that grows to twice `max_entries` is dropped and reloaded on next use, so
+    long-lived chats stay bounded.
+    """
+
+    def __init__(self, max_chats: int, max_entries: int):
+        self.max_entries = max_entries
+        self._indexes: LRUCache = LRUCache(maxsize=max_chats)
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._pending: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+
+    async def get(self, convo_id: str) -> BM25Index:
+        index = self._indexes.get(convo_id)
+        if index is not None:
+            return index
+        loading = self._loading.get(convo_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(convo_id))
+            self._loading[convo_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(convo_id, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, convo_id: str) -> BM25Index:
+        try:
+            entries = await asyncio.to_thread(SummaryArchiveModel.get_recent, convo_id, self.max_entries)
+            index = BM25Index()
+            for entry in entries:
+                index.add(self._strip(entry))
+            loaded_ids = {entry["_id"] for entry in entries}
+            for entry in self._pending.pop(convo_id, []):
+                if entry.get("_id") not in loaded_ids:
+                    index.add(self._strip(entry))
+        except Exception:
+            self._pending.pop(convo_id, None)
+            raise
+        self._indexes[convo_id] = index
+        logger.debug(f"Loaded retrieval index for {convo_id}: {len(index)} entries, ~{index.memory_bytes()} bytes")
+        return index
+
+    def add(self, convo_id: str, entries: List[Dict[str, Any]]) -> None:
+        """Add newly archived entries to a loaded index. Unloaded chats pick them up from the archive on first use."""
+        index = self._indexes.get(convo_id)
+        if index is not None:
+            for entry in entries:
+                index.add(self._strip(entry))
+            if len(index) >= 2 * self.max_entries:
+                del self._indexes[convo_id]
+        elif convo_id in self._loading:
+            self._pending[convo_id].extend(entries)
+
+    async def search(self, convo_id: str, query: str, k: int) -> List[Dict[str, Any]]:
+        index = await self.get(convo_id)
+        return index.search(query, k)
+
+    @staticmethod
+    def _strip(entry: Dict[str, Any]) -> Dict[str, Any]:
+        stripped = {key: entry.get(key) for key in ("content", "participants", "start_date", "end_date")}
+        if entry.get("kind"):
+            stripped["kind"] = entry["kind"]
+        return stripped
+
+conversation_index = ConversationIndexRegistry(
+    app_config.message_config.retrieval_index_max_chats,
+    app_config.message_config.retrieval_index_max_entries
+)
@@ -0,0 +1,155 @@
+from typing import Dict, Any, List, Optional, Set
+from buspal_backend.models.conversation import ConversationModel
+from buspal_backend.models.summary_archive import SummaryArchiveModel
+from buspal_backend.services.storage.retrieval_index import conversation_index
+from buspal_backend.services.storage.media_store import media_store
+from buspal_backend.services.ai.ai_provider import AIProvider
+from buspal_backend.services.ai.ai_service_factory import AIServiceFactory
+from buspal_backend.types.enums import AIMode
+from buspal_backend.core.exceptions import ConversationStorageError
+from buspal_backend.config.app_config import app_config
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SummaryWorker:
+    """
+    Summarizes conversations in the background.
+
+    At most one summarization pass runs per chat (single-flight) and at most
+    `summary_max_concurrency` passes run overall. Each pass claims a batch of
+    messages atomically, so concurrent webhooks never summarize the same batch
+    twice nor lose messages pushed while a summary is being generated.
+
+    Summaries are compacted hierarchically: whenever a level holds 2K entries,
+    its oldest K are merged into one summary on the next level (K being
+    `summary_compaction_factor`). The top level merges into itself, so the
+    number of stored summaries stays bounded however old a chat is.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.config = app_config.message_config
+        self._semaphore = asyncio.Semaphore(max_concurrency or self.config.summary_max_concurrency)
+        self._active: Dict[str, asyncio.Task] = {}
+        self._rerun: Set[str] = set()
+        self._ai_service: Optional[AIProvider] = None
+
+    @property
+    def ai_service(self) -> AIProvider:
+        if self._ai_service is None:
+            self._ai_service = AIServiceFactory.get_service(AIMode.BUDDY, "gemini")
+        return self._ai_service
+
+    def schedule(self, remote_id: str) -> None:
+        """Request a summarization pass. Coalesces with a pass already running for the chat."""
+        if remote_id in self._active:
+            self._rerun.add(remote_id)
+            return
+        task = asyncio.create_task(self._run(remote_id))
+        self._active[remote_id] = task
+        task.add_done_callback(lambda _: self._on_done(remote_id))
+
+    def _on_done(self, remote_id: str) -> None:
+        self._active.pop(remote_id, None)
+        # A request may have arrived after the last pass checked for reruns
+        if remote_id in self._rerun:
+            self._rerun.discard(remote_id)
+            self.schedule(remote_id)
+
+    async def _run(self, remote_id: str) -> None:
+        async with self._semaphore:
+            while True:
+                self._rerun.discard(remote_id)
+                try:
+                    await self._summarize_pending(remote_id)
+                    await self._compact(remote_id)
+                except Exception as e:
+                    logger.error(f"Summarization failed for {remote_id}: {e}")
+                    return
+                if remote_id not in self._rerun:
+                    return
+
+    async def _summarize_pending(self, remote_id: str) -> None:
+        """Summarize claimed batches until fewer than the threshold remain."""
+        batch_size = self.config.summary_message_threshold
+        while True:
+            messages = ConversationModel.claim_messages(remote_id, batch_size)
+            if not messages:
+                return
+            try:
+                await self._create_summary(remote_id, messages)
+            except Exception:
+                ConversationModel.restore_messages(remote_id, messages)
+                raise
+
+    async def _create_summary(self, remote_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Generate a summary for a claimed batch and store it."""
+        try:
+            resolved = [media_store.resolve(message) for message in messages]
+            result = await self.ai_service.generate_completion(resolved, "SUMMARY")
+            response = json.loads(result)
+
+            logger.debug(f"Summary generated for {remote_id}: {result}")
+
+            summary = self._build_summary(response)
+            ConversationModel.push_summary(remote_id, summary)
+
+            # Compaction drops level-0 summaries from the document, the archive keeps them
+            # and the messages they were generated from searchable
+            archived = SummaryArchiveModel.create_many(remote_id, [summary, *self._archive_messages(messages)])
+            conversation_index.add(remote_id, archived)
+
+        except Exception as e:
+            raise ConversationStorageError(f"Failed to create summary: {e}")
+
+    async def _compact(self, remote_id: str) -> None:
+        """Merge the oldest summaries of every overfull level into the level above."""
+        factor = self.config.summary_compaction_factor
+        max_level = self.config.summary_max_level
+        for level in range(max_level + 1):
+            while True:
+                summaries = ConversationModel.claim_summaries(remote_id, level, factor, 2 * factor)
+                if not summaries:
+                    break
+                try:
+                    result = await self.ai_service.generate_completion(summaries, "SUMMARY_COMPACTION")
+                    merged = self._build_summary(json.loads(result))
+                    next_level = min(level + 1, max_level)
+                    ConversationModel.push_summary(remote_id, merged, next_level, prepend=next_level == level)
+                except Exception as e:
+                    ConversationModel.restore_summaries(remote_id, level, summaries)
+                    raise ConversationStorageError(f"Failed to compact summaries: {e}")
+                logger.debug(f"Compacted {len(summaries)} level {level} summaries for {remote_id}")
+
+    @staticmethod
+    def _build_summary(response: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": response.get('content'),
+            "participants": response.get('participants'),
+            "start_date": response.get('start_date'),
+            "end_date": response.get('end_date')
+        }
+
+    @staticmethod
+    def _archive_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Archive entries for the text messages of a summarized batch. Media is only kept by reference."""
+        return [
+            {
+                "kind": "message",
+                "content": message.get('message'),
+                "participants": [message.get('sender')] if message.get('sender') else [],
+                "start_date": message.get('date'),
+                "end_date": message.get('date')
+            }
+            for message in messages
+            if isinstance(message.get('message'), str) and message.get('message')
+        ]
+
+    async def shutdown(self) -> None:
+        """Wait for in-flight summarization passes to finish."""
+        while self._active:
+            await asyncio.gather(*list(self._active.values()), return_exceptions=True)
+
+summary_worker = SummaryWorker()
@@ -0,0 +1,141 @@
+from typing import Dict, Any, List, Optional
+from pymongo.errors import BulkWriteError
+from buspal_backend.models.conversation import ConversationModel
+from buspal_backend.services.storage.summary_worker import summary_worker
+from buspal_backend.config.app_config import app_config
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MessageWriteBuffer:
+    """
+    Write-behind buffer for conversation message appends.
+
+    Appends are grouped per chat and flushed with a single `bulk_write` every
+    `write_flush_interval_ms`, or as soon as `write_flush_max_ops` appends are
+    pending. Flushes are serialized so per-chat order is preserved, and failed
+    appends are put back in front of the queue for the next flush. While flushes
+    fail the loop backs off exponentially up to `write_retry_max_backoff_ms`, and
+    appends of a chat that failed `write_flush_max_attempts` flushes in a row are
+    dropped and logged instead of being retried forever.
+    """
+
+    def __init__(self):
+        self.config = app_config.storage_config
+        self.summary_threshold = app_config.message_config.summary_message_threshold
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._pending_ops = 0
+        # Consecutive failed flushes, overall and per chat
+        self._failures = 0
+        self._attempts: Dict[str, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.metrics = {
+            "flushes": 0,
+            "ops_flushed": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+            "last_flush_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+        }
+
+    def append(self, convo_id: str, message: Dict[str, Any]) -> None:
+        """Queue a message append. Flushes immediately once the batch is full."""
+        self._pending.setdefault(convo_id, []).append(message)
+        self._pending_ops += 1
+        if self._task is None and not self._closed:
+            self._task = asyncio.create_task(self._flush_loop())
+        # A full batch does not cut a backoff short
+        if self._pending_ops >= self.config.write_flush_max_ops and not self._failures:
+            self._wakeup.set()
+
+    async def _flush_loop(self) -> None:
+        interval = self.config.write_flush_interval_ms / 1000
+        max_backoff = self.config.write_retry_max_backoff_ms / 1000
+        while not self._closed:
+            timeout = min(interval * 2 ** self._failures, max_backoff)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Message buffer flush failed: {e}")
+
+    async def flush(self) -> None:
+        """Write all pending appends in one bulk write."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            size, self._pending_ops = self._pending_ops, 0
+
+            started = time.perf_counter()
+            failed: Dict[str, List[Dict[str, Any]]] = {}
+            try:
+                ConversationModel.push_messages_bulk(batch)
+            except BulkWriteError as e:
+                convo_ids = list(batch)
+                for error in e.details.get("writeErrors", []):
+                    convo_id = convo_ids[error["index"]]
+                    failed[convo_id] = batch[convo_id]
+            except Exception:
+                failed = batch
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            self._record(size, elapsed_ms, bool(failed))
+            self._failures = self._failures + 1 if failed else 0
+            if failed:
+                self._requeue(failed)
+                logger.error(f"Failed to flush messages for {len(failed)} chats, will retry")
+
+            flushed = [convo_id for convo_id in batch if convo_id not in failed]
+            for convo_id in flushed:
+                self._attempts.pop(convo_id, None)
+            if flushed:
+                self._schedule_summaries(flushed)
+
+    def _requeue(self, failed: Dict[str, List[Dict[str, Any]]]) -> None:
+        for convo_id, messages in failed.items():
+            attempts = self._attempts.get(convo_id, 0) + 1
+            if attempts >= self.config.write_flush_max_attempts:
+                self._attempts.pop(convo_id, None)
+                self.metrics["dropped"] += len(messages)
+                logger.error(f"Dropping {len(messages)} messages for {convo_id} after {attempts} failed flushes: {messages}")
+                continue
+            self._attempts[convo_id] = attempts
+            self._pending[convo_id] = messages + self._pending.get(convo_id, [])
+            self._pending_ops += len(messages)
+
+    def _schedule_summaries(self, convo_ids: List[str]) -> None:
+        counts = ConversationModel.get_message_counts(convo_ids)
+        for convo_id, count in counts.items():
+            if count >= self.summary_threshold:
+                summary_worker.schedule(convo_id)
+
+    def _record(self, size: int, elapsed_ms: float, failed: bool) -> None:
+        self.metrics["flushes"] += 1
+        self.metrics["ops_flushed"] += size
+        self.metrics["failed_flushes"] += int(failed)
+        self.metrics["last_flush_size"] = size
+        self.metrics["last_flush_ms"] = elapsed_ms
+        self.metrics["max_flush_ms"] = max(self.metrics["max_flush_ms"], elapsed_ms)
+        logger.debug(f"Flushed {size} message appends in {elapsed_ms:.1f}ms")
+
+    async def shutdown(self) -> None:
+        """Stop the flush loop and write everything still pending."""
+        self._closed = True
+        self._wakeup.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+        logger.info(f"Message buffer stopped: {self.metrics}")
+
+message_buffer = MessageWriteBuffer()
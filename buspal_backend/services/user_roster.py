@@ -0,0 +1,73 @@
+from typing import Dict, Any, List, Optional
+from cachetools import TTLCache
+from rapidfuzz import fuzz, process
+from buspal_backend.models.user import UserModel, normalize_name
+from buspal_backend.config.app_config import app_config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ChatRoster:
+    """Users of one chat, matched locally by exact, prefix, then fuzzy name."""
+
+    def __init__(self, users: List[Dict[str, Any]]):
+        self.users = users
+        self.names = [user.get("name_normalized") or normalize_name(user.get("name")) for user in users]
+        self.by_name = {}
+        for name, user in zip(self.names, users):
+            self.by_name.setdefault(name, user)
+
+    def resolve(self, name: str, fuzzy_threshold: int) -> Optional[Dict[str, Any]]:
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+        user = self.by_name.get(normalized)
+        if user:
+            return user
+
+        # Prefix match on a word boundary, e.g. "ali" -> "ali hassan"
+        for candidate, user in zip(self.names, self.users):
+            if candidate.startswith(normalized + " "):
+                return user
+
+        match = process.extractOne(normalized, self.names, scorer=fuzz.ratio, score_cutoff=fuzzy_threshold)
+        if match:
+            return self.users[match[2]]
+        return None
+
+class RosterCache:
+    """
+    Per-chat roster cache used to resolve participant names without a query per name.
+
+    A chat's roster is loaded with one query and dropped whenever a user of
+    that chat is written. Entries also expire after `ttl` seconds so writes
+    made by other instances are picked up.
+    """
+
+    def __init__(self, max_chats: int, ttl: int):
+        self._rosters: TTLCache = TTLCache(maxsize=max_chats, ttl=ttl)
+        self.fuzzy_threshold = app_config.message_config.name_match_threshold
+
+    def get(self, convo_id: str) -> ChatRoster:
+        roster = self._rosters.get(convo_id)
+        if roster is None:
+            roster = ChatRoster(UserModel.get_by_convo_id(convo_id))
+            self._rosters[convo_id] = roster
+        return roster
+
+    def invalidate(self, convo_id: Optional[str]) -> None:
+        if convo_id:
+            self._rosters.pop(convo_id, None)
+
+    def resolve(self, convo_id: str, name: str) -> Optional[Dict[str, Any]]:
+        return self.get(convo_id).resolve(name, self.fuzzy_threshold)
+
+    def resolve_many(self, convo_id: str, names: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Resolve several names against a single roster load."""
+        roster = self.get(convo_id)
+        return {name: roster.resolve(name, self.fuzzy_threshold) for name in names}
+
+roster_cache = RosterCache(
+    max_chats=app_config.message_config.roster_cache_max_chats,
+    ttl=app_config.message_config.roster_cache_ttl_seconds
+)
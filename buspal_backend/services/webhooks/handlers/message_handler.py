@@ -5,8 +5,9 @@ from buspal_backend.services.webhooks.parsers.message_parser import MessageParse
 from buspal_backend.services.webhooks.processors.message_processor import MessageProcessor
 from buspal_backend.services.webhooks.handlers.response_handler import ResponseHandler
 from buspal_backend.services.storage.conversation_storage import ConversationStorage
+from buspal_backend.services.storage.conversation_snapshot import ConversationSnapshot
 from buspal_backend.services.whatsapp import WhatsappService
-from buspal_backend.utils.helpers import fetch_messages
+from buspal_backend.utils.helpers import fetch_messages, get_user_by, start_roster_sync
 from buspal_backend.types.enums import AIMode
 from buspal_backend.core.exceptions import (
     MessageProcessingError, 
@@ -14,8 +15,8 @@ from buspal_backend.core.exceptions import (
     MessageValidationError
 )
 from buspal_backend.config.app_config import app_config
-from buspal_backend.models.conversation import ConversationModel
 import asyncio
+import datetime
 import logging
 
 logger = logging.getLogger(__name__)
@@ -48,9 +49,9 @@ class MessageHandler(WebhookHandler):
             
             self.parser.validate_message_data(message_data, message_type)
             remote_id = self.parser.get_remote_id(message_data)
-            convo = ConversationModel.get_by_id(remote_id)
-            mode = convo.get('mode', None) # type: ignore
-            self.mode = AIMode(mode if mode else AIMode.BUDDY.value)
+            # Reads only the fields this webhook needs, at most once each
+            snapshot = ConversationSnapshot(remote_id)
+            self.mode = snapshot.mode
 
             # Initialize other services after conversation mode is determined
             self.ai_service = AIServiceFactory.get_service(self.mode)
@@ -62,7 +63,12 @@ class MessageHandler(WebhookHandler):
             self.storage = ConversationStorage()
 
             # Process message
-            await self._process_message(message_data, remote_id)
+            storage_task = await self._process_message(message_data, remote_id, snapshot)
+            if storage_task:
+                # Storage keeps reading the snapshot in the background, report once it is done
+                storage_task.add_done_callback(lambda _: snapshot.report())
+            else:
+                snapshot.report()
             
             return {"status": "processed"}
             
@@ -77,8 +83,8 @@ class MessageHandler(WebhookHandler):
             await self._cleanup_on_error(remote_id)
             return {"status": "error"}
     
-    async def _process_message(self, message_data: Dict[str, Any], remote_id: str) -> None:
-        """Process the message based on its type and triggers."""
+    async def _process_message(self, message_data: Dict[str, Any], remote_id: str, snapshot: ConversationSnapshot) -> Optional[asyncio.Task]:
+        """Process the message based on its type and triggers. Returns the background storage task, if any."""
         try:
             # Extract message body and determine request types
             message_body = self.parser.extract_message_body(message_data)
@@ -91,6 +97,8 @@ class MessageHandler(WebhookHandler):
 
             logger.info(f"Processing message from {remote_id}, bot_reply: {bot_reply_requested}")
             
+            await self._ensure_group_roster(remote_id, snapshot)
+            
             # Fetch and format messages
             messages = await self._fetch_and_format_messages(
                 remote_id, 
@@ -99,28 +107,49 @@ class MessageHandler(WebhookHandler):
             
             if not messages:
                 logger.warning(f"No messages found for {remote_id}")
-                return
+                return None
 
             # Store messages asynchronously
-            asyncio.create_task(
-                self.storage.store_message_and_summarize(remote_id, messages)
+            storage_task = asyncio.create_task(
+                self.storage.store_message_and_summarize(remote_id, messages, snapshot)
             )
             
             if not self.processor.should_process_message(
                 bot_reply_requested,  
                 message_count
             ):
-                return
+                return storage_task
             
             # Handle responses
             if bot_reply_requested:
                 await self.response_handler.set_typing_status(remote_id, True)
-                await self.response_handler.handle_bot_reply(remote_id, messages)
+                await self.response_handler.handle_bot_reply(remote_id, messages, snapshot)
+            return storage_task
   
         except Exception as e:
             logger.error(f"Error processing message for {remote_id}: {e}")
             raise MessageProcessingError(f"Message processing failed: {e}")
     
+    async def _ensure_group_roster(self, remote_id: str, snapshot: ConversationSnapshot) -> None:
+        """Sync a group's participants on first contact, and refresh them in the background once stale."""
+        if not self.parser.is_group_message(remote_id):
+            return
+        if not snapshot.exists:
+            conversation = await get_user_by(remote_id)
+            if conversation:
+                snapshot.mark_created(conversation)
+        
+        synced_at = snapshot.roster_synced_at
+        if synced_at is None:
+            # Concurrent first messages wait for the same sync, a recent failed attempt is not retried
+            attempt = start_roster_sync(remote_id)
+            if not attempt.done():
+                await asyncio.shield(attempt)
+            return
+        max_age = datetime.timedelta(hours=app_config.message_config.roster_sync_interval_hours)
+        if datetime.datetime.utcnow() - synced_at.replace(tzinfo=None) > max_age:
+            start_roster_sync(remote_id)
+    
     async def _fetch_and_format_messages(
         self, 
         remote_id: str, 
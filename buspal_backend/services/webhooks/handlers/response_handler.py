@@ -1,7 +1,8 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from buspal_backend.services.whatsapp import WhatsappService
 from buspal_backend.services.ai.ai_provider import AIProvider
 from buspal_backend.services.storage.conversation_storage import ConversationStorage
+from buspal_backend.services.storage.conversation_snapshot import ConversationSnapshot
 from buspal_backend.core.exceptions import WhatsAppServiceError, AIServiceError
 import logging
 
@@ -15,13 +16,14 @@ class ResponseHandler:
         self.ai_service = ai_service
         self.storage = ConversationStorage()
     
-    async def handle_bot_reply(self, remote_id: str, messages: list) -> None:
+    async def handle_bot_reply(self, remote_id: str, messages: list, snapshot: Optional[ConversationSnapshot] = None) -> None:
         """Generate and send bot reply."""
         try:
             logger.info(f"Generating bot reply for {remote_id}")
             
-            # Get conversation context
-            context = self.storage.get_conversation_context(remote_id)
+            # Get conversation context relevant to the triggering message
+            query = messages[-1].get('message') if messages else None
+            context = await self.storage.get_conversation_context(remote_id, query, snapshot)
             
             # Generate AI response
             response = await self.ai_service.process(messages, context, remote_id)
@@ -5,6 +5,7 @@ import asyncio
 import random
 from typing import Optional
 import logging
+from buspal_backend.core.exceptions import MessageSendError
 
 logger = logging.getLogger(__name__)
 SESSION_NAME = os.environ.get('SESSION_NAME')
@@ -62,7 +63,7 @@ class WhatsappService():
       except aiohttp.ClientError as e:
           logger.error(f"[WhatsappService] Failed to go offline: {e}")
         
-  async def send_message(self, id: str, message: str, media_type: str = None):
+  async def send_message(self, id: str, message: str, media_type: str = None, raise_errors: bool = False):
       payload = {
           "chatId": id,
           "contentType": "MessageMediaFromURL" if media_type else "string",
@@ -88,4 +89,6 @@ class WhatsappService():
         
         logger.info(f"[WhatsappService] '{message}' sent to {id}")
       except aiohttp.ClientError as e:
-          logger.error(f"[WhatsappService] Failed to send message: {e}") 
\ No newline at end of file
+          logger.error(f"[WhatsappService] Failed to send message: {e}")
+          if raise_errors:
+              raise MessageSendError(f"Failed to send message to {id}: {e}") from e
\ No newline at end of file
@@ -1,8 +1,12 @@
 from agents import FunctionTool, RunContextWrapper, Tool, TResponseInputItem
 from buspal_backend.models.conversation import ConversationModel
 from buspal_backend.models.user import UserModel
-from typing import Any, List, Optional
+from buspal_backend.services.user_roster import roster_cache
+from buspal_backend.config.app_config import app_config
+from typing import Any, Dict, List, Optional
+from cachetools import TTLCache
 from datetime import datetime
+import asyncio
 import re
 import os
 import pytz
@@ -21,6 +25,13 @@ supported_media = ['image', 'sticker', 'video']
 # Global session for connection pooling
 _global_session: Optional[aiohttp.ClientSession] = None
 
+# Resolved conversations keyed by ("conversation", id), users by ("user", id, convo_id)
+# since resolving a user also records the chat it was seen in
+_identity_cache: TTLCache = TTLCache(maxsize=5000, ttl=600)
+
+# Roster sync task per group started recently, so concurrent or failing syncs are not repeated
+_roster_sync_attempts: TTLCache = TTLCache(maxsize=1000, ttl=600)
+
 async def _get_http_session() -> aiohttp.ClientSession:
     """Get or create global aiohttp session with connection pooling"""
     global _global_session
@@ -83,35 +94,126 @@ async def download_media(chat_id: str, message_id: str):
           return {}
 
 async def get_user_by(id: str, convo_id: str | None = None) -> Any:
+    """
+    Get or create the conversation (when `convo_id` is None) or the user `id`.
+
+    Creation is a single atomic upsert, so concurrent webhooks never create
+    duplicates. The contact name is fetched from the gateway only for new
+    documents, and resolved identities are cached to skip the upsert entirely.
+    """
     try:
-        res = None
+        cache_key = ("conversation", id) if convo_id is None else ("user", id, convo_id)
+        res = _identity_cache.get(cache_key)
+        if res is not None:
+            return res
+
         #If convo id is none, then id is the convo id
         if convo_id is None:
-           res = ConversationModel.get_by_id(id)
+           res = ConversationModel.get_or_create(id)
         else:
-          res = UserModel.get_by_id(id, convo_id)
+          res = UserModel.get_or_create(id, convo_id)
 
-        if res is not None:
-           return res
-      
-        data = { "contactId": id }
-        session = await _get_http_session()
-        async with session.post(f"{base_url}/contact/getClassInfo/{session_name}", json=data) as response:
-            response.raise_for_status()
-            result = await response.json()
-            contact_info = result.get('result')
-            name = contact_info.get('name')
-            res = None
+        if res.get('name') is None:
+            # Empty name marks contacts the gateway could not name, so they are only looked up once
+            name = await fetch_contact_name(id) or ""
             if convo_id is None:
-              res = ConversationModel.create(id, name)
+              ConversationModel.set_name_if_missing(id, name)
             else:
-              res = UserModel.create(wa_id=id, name=name, convo_id=convo_id)
-            return res
+              UserModel.set_name_if_missing(id, convo_id, name)
+              roster_cache.invalidate(convo_id)
+            res['name'] = name
+
+        _identity_cache[cache_key] = res
+        return res
     except aiohttp.ClientError as e:
         logger.error("Failed to get contact: ", e)
     except Exception as e:
         logger.error("Failed to get contact: ", e)
 
+async def fetch_contact_name(id: str) -> Optional[str]:
+    data = { "contactId": id }
+    session = await _get_http_session()
+    async with session.post(f"{base_url}/contact/getClassInfo/{session_name}", json=data) as response:
+        response.raise_for_status()
+        result = await response.json()
+        contact_info = result.get('result') or {}
+        return contact_info.get('name')
+
+def start_roster_sync(convo_id: str) -> asyncio.Task:
+    """
+    Start a roster sync for a group, unless one was attempted recently.
+
+    Returns the running or recent attempt, so concurrent first messages share one
+    sync and a failing gateway is retried at most once per attempt TTL.
+    """
+    attempt = _roster_sync_attempts.get(convo_id)
+    if attempt is None:
+        attempt = asyncio.create_task(sync_group_roster(convo_id))
+        _roster_sync_attempts[convo_id] = attempt
+    return attempt
+
+async def sync_group_roster(convo_id: str) -> int:
+    """
+    Upsert every participant of a group in one bulk write and warm the identity cache.
+
+    Participants come from the group metadata. Names are looked up only for
+    participants that have none stored yet, a few at a time, instead of
+    downloading the whole contact list. The group is marked synced even when
+    it reports no participants, so it is not synced again on every message.
+    """
+    try:
+        session = await _get_http_session()
+        async with session.post(f"{base_url}/groupChat/getClassInfo/{session_name}", json={"chatId": convo_id}) as response:
+            response.raise_for_status()
+            result = await response.json()
+        participants = (result.get('chat') or {}).get('groupMetadata', {}).get('participants', [])
+        participant_ids = [p['id']['_serialized'] if isinstance(p.get('id'), dict) else p.get('id') for p in participants]
+        participant_ids = [wa_id for wa_id in participant_ids if wa_id]
+        if not participant_ids:
+            ConversationModel.mark_roster_synced(convo_id)
+            logger.info(f"Group {convo_id} reported no participants")
+            return 0
+
+        UserModel.bulk_upsert(convo_id, [{"wa_id": wa_id} for wa_id in participant_ids])
+        users = UserModel.get_many(participant_ids)
+        unnamed = [user for user in users if user.get('name') is None]
+        if unnamed:
+            names = await _fetch_contact_names([user['wa_id'] for user in unnamed])
+            named = [{"wa_id": wa_id, "name": name} for wa_id, name in names.items()]
+            UserModel.bulk_upsert(convo_id, named)
+            for user in unnamed:
+                user['name'] = names.get(user['wa_id'])
+        ConversationModel.mark_roster_synced(convo_id)
+        # The chat's participants or names changed
+        roster_cache.invalidate(convo_id)
+
+        for user in users:
+            if user.get('name') is not None:
+                _identity_cache[("user", user['wa_id'], convo_id)] = user
+        logger.info(f"Synced roster of {len(users)} participants for {convo_id}, looked up {len(unnamed)} names")
+        return len(users)
+    except aiohttp.ClientError as e:
+        logger.error(f"Failed to sync group roster for {convo_id}: {e}")
+    except Exception as e:
+        logger.error(f"Failed to sync group roster for {convo_id}: {e}")
+    return 0
+
+async def _fetch_contact_names(wa_ids: List[str]) -> Dict[str, str]:
+    """Look up contact names with bounded concurrency. Contacts the gateway fails on are left out."""
+    semaphore = asyncio.Semaphore(app_config.message_config.roster_name_lookup_concurrency)
+
+    async def lookup(wa_id: str) -> Optional[str]:
+        async with semaphore:
+            try:
+                # Empty name marks contacts the gateway could not name, so they are only looked up once
+                return await fetch_contact_name(wa_id) or ""
+            except Exception as e:
+                logger.warning(f"Failed to fetch contact name for {wa_id}: {e}")
+                return None
+
+    names = await asyncio.gather(*(lookup(wa_id) for wa_id in wa_ids))
+    return {wa_id: name for wa_id, name in zip(wa_ids, names) if name is not None}
+
 async def parse_wa_message(message: dict[str, Any], skip_media: bool = False, is_dm: bool = False):
     sender_id = message.get('author')
     if is_dm:
@@ -1,127 +1,102 @@
 import azure.functions as func
-import json
 import logging
-import datetime
-import os
-from azure.servicebus import ServiceBusClient, ServiceBusMessage
 from buspal_backend.models.reminder import ReminderModel
-from buspal_backend.services.whatsapp import WhatsappService
-from reminder_processor import schedule_next_occurrence_enhanced
+from buspal_backend.services.reminders.dispatcher import reminder_dispatcher
+from buspal_backend.services.reminders.backends import reminder_backend, reminder_payload
+from buspal_backend.services.reminders.recurrence import recurrence_scheduler
+from buspal_backend.services.reminders.rephraser import reminder_rephraser
+from buspal_backend.config.app_config import app_config
 
-# Initialize WhatsApp service
-whatsapp_client = WhatsappService(
-    api_url=os.environ.get("WHATSAPP_API_URL") # type: ignore
-)
+# Reminders due within this many days are handed to the reminder backend
+SCHEDULING_WINDOW_DAYS = 13
 
-def main(mytimer: func.TimerRequest) -> None:
+async def main(mytimer: func.TimerRequest) -> None:
     """
     Daily timer function that processes long-term reminders.
     Runs daily at 9:00 AM Beirut time to:
-    1. Move pending reminders (due within 7 days) to Service Bus
+    1. Recover reminders left in sending by a crashed processor
     2. Process overdue pending reminders immediately
-    3. Clean up old completed reminders
+    3. Create the occurrences of recurring reminders due within 13 days
+    4. Move pending reminders (due within 13 days) to Service Bus
     """
     logging.info('Daily reminder scheduler started')
     
     try:
+        # Reminders whose sender died mid-send become overdue pending reminders
+        recovered_count = ReminderModel.recover_expired_leases()
+        logging.info(f"Recovered {recovered_count} reminders with expired leases")
+        
         # Process overdue pending reminders first
-        overdue_count = process_overdue_reminders()
+        overdue_count = await process_overdue_reminders()
         logging.info(f"Processed {overdue_count} overdue reminders")
         
+        # Precompute the window of recurring occurrences and enqueue them as one batch
+        occurrence_count = await recurrence_scheduler.precompute(days_ahead=SCHEDULING_WINDOW_DAYS)
+        logging.info(f"Created {occurrence_count} occurrences of recurring reminders")
+        
         # Move pending reminders due within x days to Service Bus
-        moved_count = move_pending_to_service_bus()
+        moved_count = await move_pending_to_service_bus()
         logging.info(f"Moved {moved_count} pending reminders to Service Bus")
         
-        # Clean up old reminders (optional, runs weekly)
-        if datetime.datetime.utcnow().weekday() == 0:  # Monday
-            cleaned_count = ReminderModel.cleanup_old_reminders(days_old=30)
-            logging.info(f"Cleaned up {cleaned_count} old reminders")
-        
         logging.info('Daily reminder scheduler completed successfully')
         
     except Exception as e:
         logging.error(f"Error in daily reminder scheduler: {str(e)}")
         raise
+    finally:
+        # Variant refills started for recurring reminders must finish within the invocation
+        await reminder_rephraser.shutdown()
 
-def process_overdue_reminders():
+async def process_overdue_reminders():
     """
     Process reminders that are already overdue but still in pending status.
-    These should be sent immediately.
+    They are claimed with a lease first, like process_reminders does, so an
+    overlapping run or a Service Bus delivery never sends them twice. Claimed
+    reminders are sent immediately, concurrently across chats and in order within a chat.
     """
-    overdue_reminders = ReminderModel.get_overdue_pending_reminders()
-    processed_count = 0
+    overdue_reminders = ReminderModel.claim_overdue_pending(app_config.reminder_config.claim_lease_seconds)
+    result = await reminder_dispatcher.dispatch(overdue_reminders)
+    logging.info(f"Overdue reminder dispatch: {result.report()}")
     
-    for reminder in overdue_reminders:
-        try:
-            # Send the reminder immediately
-            reminder_id = reminder['_id']
-            chat_id = reminder['chat_id']
-            message = reminder['message']
-            recurrence_pattern = reminder.get('recurrence_pattern')
-            
-            formatted_message = f"🔔 {message}"
-            whatsapp_client.send_message(chat_id, formatted_message)
-            
-            ReminderModel.mark_as_sent(reminder_id)
-            logging.info(f"Sent overdue reminder {reminder_id} to {chat_id}")
-            
-            if recurrence_pattern:
-                schedule_next_occurrence_enhanced(reminder, recurrence_pattern)
-                logging.info(f"Scheduled next occurrence for recurring reminder {reminder_id}")
-            
-            processed_count += 1
-            
-        except Exception as e:
-            logging.error(f"Failed to process overdue reminder {reminder.get('_id')}: {str(e)}")
-            ReminderModel.mark_as_failed(reminder.get('_id'), str(e))
+    recurring = [reminder for reminder in result.sent if reminder.get('recurrence_pattern')]
+    try:
+        await recurrence_scheduler.extend(recurring)
+    except Exception as e:
+        logging.error(f"Failed to schedule next occurrences of {len(recurring)} recurring reminders: {str(e)}")
     
-    return processed_count
+    return len(result.sent)
 
-def move_pending_to_service_bus():
+async def move_pending_to_service_bus():
     """
     Move pending reminders that are due within 13 days to Service Bus.
+
+    Pending reminders are streamed from a cursor in chunks of the queue's max
+    batch size. Each chunk is sent as Service Bus message batches and marked
+    scheduled with one update, so memory stays flat however many are pending.
     """
-    pending_reminders = ReminderModel.get_pending_reminders_due_soon(days_ahead=13)
     moved_count = 0
+    chunk_size = app_config.reminder_config.send_max_batch
+    chunk = []
     
-    connection_str = os.getenv("AZURE_SERVICE_BUS_CONNECTION_STRING")
-    queue_name = os.getenv("REMINDER_QUEUE_NAME", "reminders")
-    
-    if not connection_str:
-        logging.error("Service Bus connection string not configured")
-        return 0
-    
-    with ServiceBusClient.from_connection_string(connection_str) as client:
-        with client.get_queue_sender(queue_name) as sender:
-            for reminder in pending_reminders:
-                try:
-                    reminder_id = reminder['_id']
-                    
-                    reminder_payload = {
-                        "reminder_id": reminder_id,
-                        "chat_id": reminder['chat_id'],
-                        "message": reminder['message'],
-                        "recurrence_pattern": reminder.get('recurrence_pattern'),
-                        "scheduled_time": reminder['scheduled_time'].isoformat(),
-                        "created_at": reminder['created_at'].isoformat()
-                    }
-                    
-                    message_body = json.dumps(reminder_payload)
-                    scheduled_message = ServiceBusMessage(
-                        body=message_body,
-                        scheduled_enqueue_time_utc=reminder['scheduled_time']
-                    )
-
-                    sender.send_messages(scheduled_message)
-                
-                    ReminderModel.move_to_service_bus(reminder_id)
-                    
-                    logging.info(f"Moved reminder {reminder_id} to Service Bus")
-                    moved_count += 1
-                    
-                except Exception as e:
-                    logging.error(f"Failed to move reminder {reminder.get('_id')} to Service Bus: {str(e)}")
-                    # Keep as pending, will retry next day
+    try:
+        for reminder in ReminderModel.get_pending_reminders_due_soon(days_ahead=SCHEDULING_WINDOW_DAYS):
+            chunk.append(reminder)
+            if len(chunk) >= chunk_size:
+                moved_count += await _promote_chunk(chunk)
+                chunk = []
+        if chunk:
+            moved_count += await _promote_chunk(chunk)
+    except Exception as e:
+        # Remaining reminders stay pending and are retried next day
+        logging.error(f"Failed to move pending reminders to Service Bus after {moved_count}: {str(e)}")
     
     return moved_count
 
+async def _promote_chunk(reminders):
+    """Enqueue one chunk of pending reminders and mark them scheduled. Returns the number moved."""
+    queued = [(reminder_payload(reminder), reminder['scheduled_time']) for reminder in reminders]
+    await reminder_backend.schedule_many(queued)
+    
+    moved = ReminderModel.move_many_to_service_bus([reminder['_id'] for reminder in reminders])
+    logging.info(f"Moved {moved} reminders to Service Bus")
+    return moved
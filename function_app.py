@@ -1,4 +1,5 @@
 import azure.functions as func
+from typing import List
 
 from buspal_backend import app as fastapi_app
 from reminder_processor import main as reminder_processor
@@ -6,15 +7,16 @@ from daily_reminder_scheduler import main as daily_scheduler
 
 app = func.AsgiFunctionApp(app=fastapi_app, http_auth_level=func.AuthLevel.ANONYMOUS)
 
-# Service Bus trigger for processing reminders
+# Service Bus trigger for processing reminders, in batches (see maxMessageBatchSize in host.json)
 @app.service_bus_queue_trigger(
-    arg_name="msg", 
+    arg_name="msgs", 
     queue_name="reminders",
-    connection="SERVICEBUSCONNSTR_AZURE_SERVICE_BUS_CONNECTION_STRING"
+    connection="SERVICEBUSCONNSTR_AZURE_SERVICE_BUS_CONNECTION_STRING",
+    cardinality=func.Cardinality.MANY
 )
-async def process_reminder(msg: func.ServiceBusMessage) -> None:
-    """Process reminder messages from Service Bus queue"""
-    await reminder_processor(msg)
+async def process_reminder(msgs: List[func.ServiceBusMessage]) -> None:
+    """Process batches of reminder messages from Service Bus queue"""
+    await reminder_processor(msgs)
 
 #Daily timer for moving long-term reminders to Service Bus
 @app.timer_trigger(
@@ -23,6 +25,6 @@ async def process_reminder(msg: func.ServiceBusMessage) -> None:
     run_on_startup=False,
     use_monitor=False
 ) 
-def daily_reminder_scheduler(mytimer: func.TimerRequest) -> None:
+async def daily_reminder_scheduler(mytimer: func.TimerRequest) -> None:
     """Daily scheduler for processing long-term reminders"""
-    daily_scheduler(mytimer)
\ No newline at end of file
+    await daily_scheduler(mytimer)
\ No newline at end of file
@@ -0,0 +1,48 @@
+import os
+
+# Settings read at import time by buspal_backend.config
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("WHATSAPP_API_URL", "http://localhost")
+
+import functools
+import mongomock
+import pytest
+from mongomock.collection import BulkOperationBuilder
+from buspal_backend.db.query_plan_check import model_classes
+
+def _ignore_sort(add):
+    # pymongo >= 4.9 passes `sort` to bulk update builders, mongomock 4.3 predates it
+    @functools.wraps(add)
+    def wrapper(self, *args, sort=None, **kwargs):
+        return add(self, *args, **kwargs)
+    return wrapper
+
+BulkOperationBuilder.add_update = _ignore_sort(BulkOperationBuilder.add_update)
+BulkOperationBuilder.add_replace = _ignore_sort(BulkOperationBuilder.add_replace)
+
+@pytest.fixture
+def database(monkeypatch):
+    """Point every model at a fresh in-memory database."""
+    database = mongomock.MongoClient()["buspal-test"]
+    for model in model_classes():
+        monkeypatch.setattr(model, "collection", database[model.collection.name])
+    return database
+
+@pytest.fixture
+def mongod_database(monkeypatch):
+    """
+    Point every model at a scratch database on a real mongod, for benchmarks
+    that mongomock cannot measure. Skipped unless MONGO_TEST_URI is set.
+    """
+    uri = os.getenv("MONGO_TEST_URI")
+    if not uri:
+        pytest.skip("MONGO_TEST_URI is not set")
+    from pymongo import MongoClient
+    client = MongoClient(uri)
+    database = client["buspal-benchmark"]
+    client.drop_database(database.name)
+    for model in model_classes():
+        monkeypatch.setattr(model, "collection", database[model.collection.name])
+    yield database
+    client.drop_database(database.name)
+    client.close()
@@ -0,0 +1,73 @@
+import random
+import time
+import tracemalloc
+import pytest
+from buspal_backend.db.indexes import ensure_indexes
+from buspal_backend.models.expense import ExpenseModel
+from buspal_backend.services.expense_settlement import ExpenseSettlementService
+
+CONVO_ID = "aggregation@g.us"
+
+def seed_expenses(collection, count: int, people: int = 12, seed: int = 3) -> None:
+    rng = random.Random(seed)
+    user_ids = [f"961{i:03d}@c.us" for i in range(people)]
+    documents = []
+    for _ in range(count):
+        payer = rng.choice(user_ids)
+        members = rng.sample(user_ids, rng.randint(2, people))
+        amount = rng.randint(100, 20000) * len(members) / 100
+        documents.append({
+            "convo_id": CONVO_ID,
+            "description": "Expense",
+            "total_amount": amount,
+            "payer_id": payer,
+            "payer_name": payer,
+            "participants": [{"user_id": m, "name": m, "share_amount": amount / len(members)} for m in members],
+            "expense_type": "equal",
+            "is_settled": rng.random() < 0.3,
+        })
+    for start in range(0, count, 5000):
+        collection.insert_many(documents[start:start + 5000])
+
+def python_balances(include_settled: bool):
+    expenses = ExpenseModel.get_by_convo_id(CONVO_ID, include_settled)
+    return ExpenseSettlementService.calculate_net_balances(expenses), len(expenses)
+
+def measure(function):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def assert_same_balances(aggregated, computed):
+    assert set(aggregated) == set(computed)
+    for user_id, balance in computed.items():
+        assert aggregated[user_id]["amount"] == pytest.approx(balance["amount"], abs=0.01)
+
+# mongomock does not evaluate expressions nested in array literals, so these need a real mongod
+@pytest.mark.parametrize("include_settled", [False, True])
+def test_aggregation_matches_python_balances(mongod_database, include_settled):
+    seed_expenses(mongod_database.expenses, 300)
+
+    aggregated = ExpenseModel.aggregate_net_balances(CONVO_ID, include_settled)
+    computed, count = python_balances(include_settled)
+
+    assert aggregated["expense_count"] == count
+    assert_same_balances(aggregated["balances"], computed)
+
+def test_aggregation_vs_python_over_50k_expenses(mongod_database):
+    ensure_indexes(mongod_database)
+    seed_expenses(mongod_database.expenses, 50_000)
+
+    aggregated, aggregation_seconds, aggregation_peak = measure(
+        lambda: ExpenseModel.aggregate_net_balances(CONVO_ID, include_settled=True))
+    (computed, count), python_seconds, python_peak = measure(lambda: python_balances(include_settled=True))
+
+    print(f"\n{count} expenses: aggregation {aggregation_seconds * 1000:.0f} ms / {aggregation_peak / 1e6:.1f} MB peak, "
+          f"python {python_seconds * 1000:.0f} ms / {python_peak / 1e6:.1f} MB peak")
+    assert aggregated["expense_count"] == count == 50_000
+    assert_same_balances(aggregated["balances"], computed)
+    assert aggregation_peak < python_peak / 10
@@ -0,0 +1,134 @@
+import threading
+from buspal_backend.db.indexes import ensure_indexes
+from buspal_backend.db.migrations import run_migrations
+from buspal_backend.models.balance import BalanceLedgerModel
+from buspal_backend.models.expense import ExpenseModel
+from buspal_backend.services.expense_settlement import ExpenseSettlementService
+
+CONVO_ID = "expenses@g.us"
+RAMI, LEA, OMAR = "961001@c.us", "961002@c.us", "961003@c.us"
+
+def participants(*user_ids, share=10.0):
+    return [{"user_id": user_id, "name": user_id.split("@")[0], "share_amount": share} for user_id in user_ids]
+
+def add_expense(amount=30.0, payer=RAMI):
+    return ExpenseSettlementService.add_expense(
+        CONVO_ID, "Dinner", amount, payer, "Payer", participants(RAMI, LEA, OMAR, share=amount / 3)
+    )
+
+def cents(user_id):
+    ledger = ExpenseSettlementService.get_ledger(CONVO_ID)
+    return next((entry["cents"] for entry in ledger["entries"].values() if entry["user_id"] == user_id), 0)
+
+def test_missing_ledger_is_reported_empty_without_being_written(database):
+    ledger = ExpenseSettlementService.get_ledger(CONVO_ID)
+
+    assert ledger["expense_count"] == 0
+    assert BalanceLedgerModel.get_by_convo_id(CONVO_ID) is None
+
+def test_first_expense_creates_the_ledger_and_concurrent_adds_are_all_counted(database):
+    ensure_indexes(database)
+    threads = [threading.Thread(target=add_expense) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ledger = ExpenseSettlementService.get_ledger(CONVO_ID)
+    assert ledger["expense_count"] == 20
+    assert cents(RAMI) == 20 * 2000
+    assert ExpenseSettlementService.check_ledger_consistency(CONVO_ID)["consistent"]
+
+def test_rebuild_retries_when_a_delta_lands_while_it_computes(database, monkeypatch):
+    add_expense()
+    ExpenseModel.create(CONVO_ID, "Taxi", 9.0, LEA, "Lea", participants(LEA, OMAR, RAMI, share=3.0))
+    compute = ExpenseSettlementService._compute_ledger
+    calls = []
+
+    def racing_compute(convo_id):
+        computed = compute(convo_id)
+        if not calls:
+            # A concurrent add_expense applies its delta after the rebuild read the expenses
+            ExpenseSettlementService.update_ledger(convo_id, [
+                ExpenseModel.create(convo_id, "Coffee", 3.0, OMAR, "Omar", participants(OMAR, share=3.0))
+            ])
+        calls.append(convo_id)
+        return computed
+
+    monkeypatch.setattr(ExpenseSettlementService, "_compute_ledger", staticmethod(racing_compute))
+    ExpenseSettlementService.rebuild_ledger(CONVO_ID)
+
+    assert len(calls) == 2
+    monkeypatch.setattr(ExpenseSettlementService, "_compute_ledger", staticmethod(compute))
+    assert ExpenseSettlementService.check_ledger_consistency(CONVO_ID)["consistent"]
+
+def test_migration_builds_ledgers_for_chats_that_predate_them(database):
+    ExpenseModel.create(CONVO_ID, "Dinner", 30.0, RAMI, "Rami", participants(RAMI, LEA, OMAR))
+
+    run_migrations(database)
+
+    assert cents(RAMI) == 2000
+    assert cents(LEA) == -1000
+    assert database.migrations.find_one({"_id": "build_balance_ledgers"})["result"] == 1
+
+def test_settling_specific_expenses_reverses_only_those_still_open(database):
+    first, second = add_expense(), add_expense(60.0, payer=LEA)
+    ExpenseSettlementService.settle_payments(CONVO_ID, [str(first["_id"])])
+
+    result = ExpenseSettlementService.settle_payments(CONVO_ID, [str(first["_id"]), str(second["_id"]), "not-an-id"])
+
+    assert result["settled_count"] == 1
+    assert ExpenseSettlementService.get_ledger(CONVO_ID)["expense_count"] == 0
+    assert ExpenseSettlementService.check_ledger_consistency(CONVO_ID)["consistent"]
+
+def test_settle_all_applies_negative_deltas_and_keeps_expenses_added_meanwhile(database, monkeypatch):
+    add_expense()
+    add_expense(90.0, payer=OMAR)
+    version = ExpenseSettlementService.get_ledger(CONVO_ID)["version"]
+    get_by_settlement = ExpenseModel.get_by_settlement.__func__
+
+    def add_during_settlement(cls, convo_id, settlement_id):
+        # An expense added after the update_many must stay on the ledger
+        add_expense(15.0, payer=LEA)
+        return get_by_settlement(cls, convo_id, settlement_id)
+
+    monkeypatch.setattr(ExpenseModel, "get_by_settlement", classmethod(add_during_settlement))
+    result = ExpenseSettlementService.settle_payments(CONVO_ID)
+
+    ledger = ExpenseSettlementService.get_ledger(CONVO_ID)
+    assert result["settled_count"] == 2
+    assert ledger["version"] == version + 2
+    assert ledger["expense_count"] == 1
+    assert cents(LEA) == 1000
+    assert ExpenseSettlementService.check_ledger_consistency(CONVO_ID)["consistent"]
+
+def test_uneven_shares_keep_the_ledger_summing_to_zero(database):
+    # Shares rounded half up add up to a cent more than the rounded total
+    ExpenseSettlementService.add_expense(CONVO_ID, "Taxi", 100.0, RAMI, "Payer", [
+        {"user_id": RAMI, "name": "Rami", "share_amount": 33.335},
+        {"user_id": LEA, "name": "Lea", "share_amount": 33.335},
+        {"user_id": OMAR, "name": "Omar", "share_amount": 33.33},
+    ])
+    ExpenseSettlementService.add_expense(CONVO_ID, "Snacks", 10.0, LEA, "Payer", [
+        {"user_id": LEA, "name": "Lea", "share_amount": 3.335},
+        {"user_id": OMAR, "name": "Omar", "share_amount": 6.665},
+    ])
+
+    ledger = ExpenseSettlementService.get_ledger(CONVO_ID)
+    assert sum(entry["cents"] for entry in ledger["entries"].values()) == 0
+    assert cents(RAMI) == 6667
+    assert cents(OMAR) == -4000
+    assert ExpenseSettlementService.check_ledger_consistency(CONVO_ID)["consistent"]
+
+def test_settlement_drops_entries_brought_back_to_zero(database):
+    expense = add_expense()
+    add_expense(90.0, payer=OMAR)
+    ExpenseSettlementService.settle_payments(CONVO_ID, [str(expense["_id"])])
+
+    users = {entry["user_id"] for entry in ExpenseSettlementService.get_ledger(CONVO_ID)["entries"].values()}
+    assert users == {RAMI, LEA, OMAR}
+
+    ExpenseSettlementService.settle_payments(CONVO_ID)
+
+    assert ExpenseSettlementService.get_ledger(CONVO_ID)["entries"] == {}
+    assert ExpenseSettlementService.check_ledger_consistency(CONVO_ID)["consistent"]
@@ -0,0 +1,110 @@
+import threading
+import pytest
+from pymongo.errors import DuplicateKeyError
+from buspal_backend.core.exceptions import IndexCreationError
+from buspal_backend.db.indexes import ensure_indexes
+from buspal_backend.db.migrations import run_migrations
+from buspal_backend.models.conversation import ConversationModel
+from buspal_backend.models.user import UserModel
+
+GROUP_ID = "120363000000000001@g.us"
+SENDER_ID = "96170000001@c.us"
+
+def run_concurrently(count: int, target) -> list:
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return results
+
+def test_simultaneous_first_messages_create_one_user_and_conversation(database):
+    ensure_indexes(database)
+
+    def first_message():
+        conversation = ConversationModel.get_or_create(GROUP_ID)
+        user = UserModel.get_or_create(SENDER_ID, GROUP_ID)
+        return conversation, user
+
+    results = run_concurrently(100, first_message)
+
+    assert len(results) == 100
+    assert database.conversations.count_documents({"convo_id": GROUP_ID}) == 1
+    assert database.users.count_documents({"wa_id": SENDER_ID}) == 1
+    assert all(user["convo_id"] == GROUP_ID for _, user in results)
+
+def test_upsert_that_loses_the_insert_race_returns_the_winner(database, monkeypatch):
+    ensure_indexes(database)
+    upsert = UserModel._upsert.__func__
+
+    def racing_upsert(cls, wa_id, convo_id):
+        # Another webhook inserts the user between our lookup and insert, as mongod reports it
+        monkeypatch.setattr(UserModel, "_upsert", classmethod(upsert))
+        database.users.insert_one({"wa_id": wa_id, "convo_id": convo_id, "name": "Rami"})
+        raise DuplicateKeyError("E11000 duplicate key error collection: users index: wa_id_unique")
+
+    monkeypatch.setattr(UserModel, "_upsert", classmethod(racing_upsert))
+
+    user = UserModel.get_or_create(SENDER_ID, GROUP_ID)
+
+    assert user["name"] == "Rami"
+    assert database.users.count_documents({"wa_id": SENDER_ID}) == 1
+
+def test_upsert_stores_gateway_names_literally(database):
+    UserModel.bulk_upsert(GROUP_ID, [{"wa_id": SENDER_ID, "name": "$convo_id"}])
+
+    user = UserModel.get_by_id(SENDER_ID)
+    assert user["name"] == "$convo_id"
+    assert user["name_normalized"] == "$convo_id"
+
+def test_duplicates_are_merged_before_unique_indexes_replace_old_ones(database):
+    database.conversations.create_index("convo_id", name="convo_id")
+    database.users.create_index("wa_id", name="wa_id")
+    database.conversations.insert_many([
+        {"convo_id": GROUP_ID, "name": None, "messages": [{"message": "first"}], "summaries": [], "receipts": []},
+        {"convo_id": GROUP_ID, "name": "Trip", "messages": [{"message": "second"}], "summaries": [{"content": "s"}],
+         "receipts": [], "digests": {"1": [{"content": "d"}]}},
+    ])
+    database.users.insert_many([
+        {"wa_id": SENDER_ID, "convo_id": GROUP_ID, "name": None, "last_read": {"a": 1}},
+        {"wa_id": SENDER_ID, "convo_id": GROUP_ID, "name": "Rami", "name_normalized": "rami", "last_read": {"a": 2, "b": 3}},
+    ])
+
+    run_migrations(database)
+    ensure_indexes(database)
+
+    conversation = database.conversations.find_one({"convo_id": GROUP_ID})
+    assert database.conversations.count_documents({}) == 1
+    assert conversation["name"] == "Trip"
+    assert [m["message"] for m in conversation["messages"]] == ["first", "second"]
+    assert conversation["summaries"] == [{"content": "s"}]
+    assert conversation["digests"] == {"1": [{"content": "d"}]}
+    user = database.users.find_one({"wa_id": SENDER_ID})
+    assert database.users.count_documents({}) == 1
+    assert (user["name"], user["last_read"]) == ("Rami", {"a": 1, "b": 3})
+    assert "convo_id_unique" in database.conversations.index_information()
+    assert "convo_id" not in database.conversations.index_information()
+    assert "wa_id_unique" in database.users.index_information()
+
+def test_failed_unique_index_keeps_the_old_one_and_other_collections_indexed(database):
+    database.users.create_index("wa_id", name="wa_id")
+    database.users.insert_many([{"wa_id": SENDER_ID}, {"wa_id": SENDER_ID}])
+
+    with pytest.raises(IndexCreationError) as error:
+        ensure_indexes(database)
+
+    assert list(error.value.details) == ["users.wa_id_unique"]
+    assert "wa_id" in database.users.index_information()
+    assert "convo_id_name_normalized" in database.users.index_information()
+    assert "expires_at_finished_ttl" in database.reminders.index_information()
@@ -0,0 +1,104 @@
+import datetime
+import pytest
+from buspal_backend.services.reminders.recurrence import RecurrenceRule
+
+def utc(*args) -> datetime.datetime:
+    return datetime.datetime(*args)
+
+def times(pattern: str, start: datetime.datetime, end: datetime.datetime):
+    return [moment for moment, _ in RecurrenceRule.parse(pattern).occurrences(start, end)]
+
+def test_weekly_interval_with_several_weekdays():
+    # Monday 5 January 2026, 09:00 in Beirut
+    start = utc(2026, 1, 5, 7)
+    assert times("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH", start, utc(2026, 2, 6)) == [
+        utc(2026, 1, 8, 7),
+        utc(2026, 1, 19, 7),
+        utc(2026, 1, 22, 7),
+        utc(2026, 2, 2, 7),
+        utc(2026, 2, 5, 7),
+    ]
+
+def test_weekly_interval_starting_after_the_last_weekday_of_the_week():
+    # Friday 9 January 2026: the next Monday is in the week two weeks on
+    assert times("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH", utc(2026, 1, 9, 7), utc(2026, 1, 23)) == [
+        utc(2026, 1, 19, 7),
+        utc(2026, 1, 22, 7),
+    ]
+
+def test_count_decrements_on_each_occurrence():
+    occurrences = list(RecurrenceRule.parse("FREQ=DAILY;COUNT=3").occurrences(utc(2026, 1, 5, 7), utc(2026, 2, 1)))
+
+    assert [moment for moment, _ in occurrences] == [utc(2026, 1, 6, 7), utc(2026, 1, 7, 7)]
+    assert [str(rule) if rule else None for _, rule in occurrences] == ["FREQ=DAILY;COUNT=2", None]
+    assert RecurrenceRule.parse("FREQ=DAILY;COUNT=1").following() is None
+
+def test_until_in_utc_is_compared_in_utc():
+    rule = RecurrenceRule.parse("FREQ=DAILY;UNTIL=20260108T070000Z")
+
+    assert rule.until == datetime.datetime(2026, 1, 8, 7, tzinfo=datetime.timezone.utc)
+    assert str(rule) == "FREQ=DAILY;UNTIL=20260108T070000Z"
+    assert times(str(rule), utc(2026, 1, 5, 7), utc(2026, 2, 1)) == [
+        utc(2026, 1, 6, 7), utc(2026, 1, 7, 7), utc(2026, 1, 8, 7),
+    ]
+
+def test_until_without_z_is_local_wall_clock_time():
+    # 08:59:59 in Beirut is before the 09:00 occurrence on the 8th
+    rule = RecurrenceRule.parse("FREQ=DAILY;UNTIL=20260108T085959")
+
+    assert rule.until.tzinfo is None
+    assert str(rule) == "FREQ=DAILY;UNTIL=20260108T085959"
+    assert times(str(rule), utc(2026, 1, 5, 7), utc(2026, 2, 1)) == [utc(2026, 1, 6, 7), utc(2026, 1, 7, 7)]
+
+def test_until_date_includes_the_whole_day():
+    assert times("FREQ=DAILY;UNTIL=20260107", utc(2026, 1, 5, 7), utc(2026, 2, 1)) == [
+        utc(2026, 1, 6, 7), utc(2026, 1, 7, 7),
+    ]
+
+def test_month_day_31_is_clamped_in_short_months_without_drifting():
+    # 31 January 2026, 09:00 in Beirut
+    expected = [
+        utc(2026, 2, 28, 7),
+        utc(2026, 3, 31, 6),
+        utc(2026, 4, 30, 6),
+        utc(2026, 5, 31, 6),
+    ]
+    assert times("FREQ=MONTHLY;BYMONTHDAY=31", utc(2026, 1, 31, 7), utc(2026, 6, 1)) == expected
+    # Legacy monthly reminders are anchored to the day they were created on
+    assert times("monthly", utc(2026, 1, 31, 7), utc(2026, 6, 1)) == expected
+
+def test_month_day_29_in_february_of_a_leap_year():
+    assert times("FREQ=YEARLY;BYMONTHDAY=29", utc(2024, 2, 29, 7), utc(2029, 1, 1)) == [
+        utc(2025, 2, 28, 7), utc(2026, 2, 28, 7), utc(2027, 2, 28, 7), utc(2028, 2, 29, 7),
+    ]
+
+def test_occurrences_keep_their_local_hour_across_dst_changes():
+    # Beirut moves from UTC+2 to UTC+3 on 29 March 2026 and back on 25 October
+    assert times("FREQ=DAILY", utc(2026, 3, 27, 7), utc(2026, 3, 31)) == [
+        utc(2026, 3, 28, 7), utc(2026, 3, 29, 6), utc(2026, 3, 30, 6),
+    ]
+    assert times("FREQ=DAILY", utc(2026, 10, 23, 6), utc(2026, 10, 27)) == [
+        utc(2026, 10, 24, 6), utc(2026, 10, 25, 7), utc(2026, 10, 26, 7),
+    ]
+
+def test_without_an_end_only_the_next_occurrence_is_yielded():
+    assert times("FREQ=WEEKLY", utc(2026, 1, 5, 7), None) == [utc(2026, 1, 12, 7)]
+
+def test_legacy_patterns_and_prefix_parse():
+    assert RecurrenceRule.parse("daily") == RecurrenceRule("DAILY")
+    assert RecurrenceRule.parse("RRULE:FREQ=WEEKLY;BYDAY=TH,MO").by_weekday == (0, 3)
+
+@pytest.mark.parametrize("pattern", [
+    "FREQ=HOURLY",
+    "INTERVAL=2",
+    "FREQ=DAILY;INTERVAL=0",
+    "FREQ=DAILY;COUNT=zero",
+    "FREQ=WEEKLY;BYDAY=XX",
+    "FREQ=MONTHLY;BYDAY=MO",
+    "FREQ=MONTHLY;BYMONTHDAY=32",
+    "FREQ=DAILY;BYSETPOS=1",
+    "FREQ=DAILY;UNTIL=tomorrow",
+])
+def test_unsupported_rules_are_rejected(pattern):
+    with pytest.raises(ValueError):
+        RecurrenceRule.parse(pattern)
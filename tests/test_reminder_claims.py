@@ -0,0 +1,94 @@
+import datetime
+import pytest
+from buspal_backend.models.reminder import ReminderModel
+
+CHAT_ID = "reminders@g.us"
+
+def at(minutes: int) -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+
+def claim(reminder_id: str, lease_seconds: int = 300):
+    return {reminder["_id"]: reminder["claim_token"] for reminder in ReminderModel.claim_many([reminder_id], lease_seconds)}
+
+def test_overdue_pending_reminders_are_claimed_once(database):
+    ReminderModel.create("overdue-1", CHAT_ID, "Pay rent", at(-90), status="pending")
+    ReminderModel.create("overdue-2", CHAT_ID, "Call mom", at(-30), status="pending")
+    ReminderModel.create("future", CHAT_ID, "Later", at(30), status="pending")
+
+    first = ReminderModel.claim_overdue_pending(300)
+    second = ReminderModel.claim_overdue_pending(300)
+
+    assert [reminder["_id"] for reminder in first] == ["overdue-1", "overdue-2"]
+    assert all(reminder["status"] == "sending" and reminder["lease_expires_at"] for reminder in first)
+    assert second == []
+    assert ReminderModel.get_by_id("future")["status"] == "pending"
+
+def test_expired_overdue_claims_are_recovered_and_claimed_again(database):
+    ReminderModel.create("overdue", CHAT_ID, "Pay rent", at(-90), status="pending")
+    ReminderModel.claim_overdue_pending(0)
+
+    assert ReminderModel.recover_expired_leases() == 1
+    assert [reminder["attempts"] for reminder in ReminderModel.claim_overdue_pending(300)] == [2]
+
+def test_reminders_waiting_for_a_retry_are_left_out_of_chat_windows(database):
+    ReminderModel.create("retry", CHAT_ID, "Pay rent", at(-5))
+    ReminderModel.create("due", CHAT_ID, "Call mom", at(0))
+    ReminderModel.release_for_retry({"retry": "gateway timeout"}, {"retry": at(2)}, claim("retry"))
+
+    claimed = ReminderModel.claim_many(["due"], 300, {CHAT_ID: at(1)})
+
+    assert [reminder["_id"] for reminder in claimed] == ["due"]
+    assert ReminderModel.get_by_id("retry")["status"] == "scheduled"
+
+def test_reminders_are_claimable_once_their_retry_is_due(database):
+    ReminderModel.create("retry", CHAT_ID, "Pay rent", at(-5))
+    ReminderModel.create("due", CHAT_ID, "Call mom", at(0))
+    ReminderModel.release_for_retry({"retry": "gateway timeout"}, {"retry": at(-1)}, claim("retry"))
+
+    claimed = ReminderModel.claim_many(["due"], 300, {CHAT_ID: at(1)})
+
+    assert [reminder["_id"] for reminder in claimed] == ["retry", "due"]
+    assert all("retry_at" not in reminder for reminder in claimed)
+    assert claimed[0]["attempts"] == 2
+
+def test_the_retry_delivery_claims_its_own_reminder(database):
+    ReminderModel.create("retry", CHAT_ID, "Pay rent", at(-5))
+    ReminderModel.release_for_retry({"retry": "gateway timeout"}, {"retry": at(2)}, claim("retry"))
+
+    assert [reminder["_id"] for reminder in ReminderModel.claim_many(["retry"], 300)] == ["retry"]
+
+def test_results_of_an_expired_claim_are_not_written(database):
+    ReminderModel.create("late", CHAT_ID, "Pay rent", at(-5))
+    stale = claim("late", 0)
+    current = claim("late")
+    assert current["late"] != stale["late"]
+    ReminderModel.mark_many_as_sent(current)
+
+    # The first sender finishes after its lease was taken over
+    ReminderModel.mark_many_as_failed({"late": "gateway timeout"}, stale)
+    ReminderModel.release_for_retry({"late": "gateway timeout"}, {"late": at(2)}, stale)
+
+    reminder = ReminderModel.get_by_id("late")
+    assert reminder["status"] == "sent"
+    assert "retry_at" not in reminder and "error_message" not in reminder
+
+@pytest.mark.asyncio
+async def test_deliveries_skipped_by_a_live_lease_are_rescheduled_for_its_expiry(database, monkeypatch):
+    from buspal_backend.services.reminders import processor
+    ReminderModel.create("leased", CHAT_ID, "Pay rent", at(-5))
+    ReminderModel.create("sent", CHAT_ID, "Call mom", at(-5))
+    claim("leased")
+    ReminderModel.mark_many_as_sent(claim("sent"))
+    scheduled = []
+
+    async def schedule_many(reminders):
+        scheduled.extend(reminders)
+    monkeypatch.setattr(processor.reminder_backend, "schedule_many", schedule_many)
+
+    await processor.process_reminders([
+        {"reminder_id": reminder_id, "chat_id": CHAT_ID, "message": "Pay rent"} for reminder_id in ("leased", "sent")
+    ])
+
+    assert [(payload["reminder_id"], fire_at) for payload, fire_at in scheduled] == [
+        ("leased", ReminderModel.get_by_id("leased")["lease_expires_at"])
+    ]
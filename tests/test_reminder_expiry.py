@@ -0,0 +1,94 @@
+import datetime
+from buspal_backend.db.indexes import INDEXES, ensure_indexes
+from buspal_backend.db.migrations import run_migrations
+from buspal_backend.models.reminder import ReminderModel
+
+CHAT_ID = "reminders@g.us"
+
+def at(minutes: int) -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+
+def expiring(reminder_id: str) -> bool:
+    reminder = ReminderModel.get_by_id(reminder_id)
+    return reminder.get("finished") is True and reminder.get("expires_at") is not None
+
+def claim(*reminder_ids: str):
+    return {reminder["_id"]: reminder["claim_token"] for reminder in ReminderModel.claim_many(list(reminder_ids), 300)}
+
+def test_finished_reminders_are_flagged_for_expiry(database):
+    for reminder_id in ("sent", "failed", "cancelled", "following"):
+        ReminderModel.create(reminder_id, CHAT_ID, "Pay rent", at(-10), "daily", series_id="cancelled")
+    ReminderModel.collection.update_one({"_id": "following"}, {"$set": {"scheduled_time": at(20)}})
+
+    ReminderModel.mark_many_as_sent(claim("sent"))
+    ReminderModel.mark_many_as_failed({"failed": "gateway timeout"}, claim("failed"))
+    ReminderModel.cancel_reminder("cancelled")
+    assert ReminderModel.cancel_following("cancelled") == ["following"]
+
+    assert all(expiring(reminder_id) for reminder_id in ("sent", "failed", "cancelled", "following"))
+
+def test_reminders_released_for_retry_no_longer_expire(database):
+    ReminderModel.create("retry", CHAT_ID, "Pay rent", at(-5))
+
+    ReminderModel.release_for_retry({"retry": "gateway timeout"}, {"retry": at(1)}, claim("retry"))
+
+    reminder = ReminderModel.get_by_id("retry")
+    assert "finished" not in reminder and "expires_at" not in reminder
+
+def test_backfill_flags_finished_reminders_stored_before_the_flag(database):
+    expires_at = datetime.datetime(2025, 3, 1)
+    ReminderModel.collection.insert_many([
+        {"_id": "expiring", "status": "cancelled", "expires_at": expires_at},
+        {"_id": "scheduled", "status": "scheduled"},
+    ])
+
+    assert ReminderModel.backfill_expiry() == 1
+    assert ReminderModel.backfill_expiry() == 0
+
+    assert ReminderModel.get_by_id("expiring")["expires_at"] == expires_at
+    assert expiring("expiring")
+    assert "finished" not in ReminderModel.get_by_id("scheduled")
+
+def test_backfill_runs_once_as_a_migration(database):
+    ReminderModel.collection.insert_one({"_id": "expiring", "status": "sent", "expires_at": at(10)})
+
+    run_migrations(database)
+    ReminderModel.collection.insert_one({"_id": "later", "status": "sent", "expires_at": at(10)})
+    run_migrations(database)
+
+    assert database.migrations.find_one({"_id": "backfill_reminder_expiry"})["result"] == 1
+    assert expiring("expiring")
+    assert "finished" not in ReminderModel.get_by_id("later")
+
+def test_backfill_gives_reminders_without_an_expiry_one(mongod_database):
+    # mongomock cannot add milliseconds to dates in update pipelines
+    updated_at = datetime.datetime(2025, 1, 1)
+    ReminderModel.collection.insert_many([
+        {"_id": "legacy", "status": "sent", "updated_at": updated_at},
+        {"_id": "scheduled", "status": "scheduled", "updated_at": updated_at},
+    ])
+
+    assert ReminderModel.backfill_expiry() == 1
+
+    assert ReminderModel.get_by_id("legacy")["expires_at"] == updated_at + ReminderModel.retention
+    assert expiring("legacy")
+    assert "expires_at" not in ReminderModel.get_by_id("scheduled")
+
+def test_ttl_index_filters_on_the_finished_flag():
+    ttl = next(index.document for index in INDEXES["reminders"] if index.document["name"] == "expires_at_finished_ttl")
+
+    assert ttl["expireAfterSeconds"] == 0
+    # $in is only allowed in partial filters from MongoDB 6.0
+    assert ttl["partialFilterExpression"] == {"finished": True}
+
+def test_ttl_index_replaces_the_status_filtered_one(database):
+    database.reminders.create_index(
+        "expires_at", name="expires_at_ttl", expireAfterSeconds=0,
+        partialFilterExpression={"status": {"$in": ["sent", "failed", "cancelled"]}}
+    )
+
+    ensure_indexes(database)
+
+    indexes = database.reminders.index_information()
+    assert "expires_at_ttl" not in indexes
+    assert indexes["expires_at_finished_ttl"]["expireAfterSeconds"] == 0
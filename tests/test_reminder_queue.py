@@ -0,0 +1,44 @@
+import datetime
+import json
+import pytest
+from azure.servicebus import ServiceBusMessageBatch
+from azure.servicebus.exceptions import ServiceBusConnectionError
+from buspal_backend.config.app_config import ReminderConfig
+from buspal_backend.services.reminders.reminder_queue import ServiceBusReminderQueue
+
+class FakeSender:
+    """Sender whose batches hold three small messages, failing the `fail_on`-th send."""
+
+    def __init__(self, sent, fail_on=None):
+        self.sent = sent
+        self.fail_on = fail_on
+        self.sends = 0
+
+    async def create_message_batch(self):
+        return ServiceBusMessageBatch(max_size_in_bytes=600)
+
+    async def send_messages(self, batch):
+        self.sends += 1
+        if self.sends == self.fail_on:
+            raise ServiceBusConnectionError(message="link detached")
+        self.sent.extend(json.loads(str(message)) for message in batch._messages)
+
+    async def close(self):
+        pass
+
+async def _next(senders):
+    return next(senders)
+
+@pytest.mark.asyncio
+async def test_reconnect_retries_only_the_reminders_not_sent_yet(monkeypatch):
+    queue = ServiceBusReminderQueue(ReminderConfig())
+    sent = []
+    senders = iter([FakeSender(sent, fail_on=2), FakeSender(sent)])
+    monkeypatch.setattr(queue, "_get_sender", lambda: _next(senders))
+    when = datetime.datetime.now(datetime.timezone.utc)
+    reminders = [({"reminder_id": f"r{i}", "padding": "x" * 60}, when) for i in range(8)]
+
+    await queue._send_batch(reminders)
+
+    assert [payload["reminder_id"] for payload in sent] == [f"r{i}" for i in range(8)]
+    assert queue.metrics["reconnects"] == 1
\ No newline at end of file
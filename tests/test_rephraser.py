@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+import json
+import pytest
+from buspal_backend.config.app_config import ReminderConfig
+from buspal_backend.models.reminder import ReminderModel
+from buspal_backend.services.reminders.rephraser import ReminderRephraser
+
+CHAT_ID = "reminders@g.us"
+
+class SlowProvider:
+    """Answers the series prompt once `release` is set."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def generate_completion(self, history, mode):
+        await self.release.wait()
+        count = history[0]["count"]
+        return json.dumps({"messages": [f"Water the plants ({i})" for i in range(count)]})
+
+def rephraser() -> ReminderRephraser:
+    service = ReminderRephraser(ReminderConfig(rephrase_variant_count=2))
+    service._ai_service = SlowProvider()
+    return service
+
+def at(days: int) -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(days=days)
+
+@pytest.mark.asyncio
+async def test_late_refill_is_stored_on_the_tail_of_the_series(database):
+    ReminderModel.create("first", CHAT_ID, "Water the plants", at(1), "daily")
+    service = rephraser()
+
+    service.refill("first", "Water the plants")
+    await asyncio.sleep(0)
+    # Occurrences are precomputed while the model is still generating
+    ReminderModel.create("second", CHAT_ID, "Water the plants", at(2), "daily", series_id="first")
+    ReminderModel.create("third", CHAT_ID, "Water the plants", at(3), "daily", series_id="first")
+    ReminderModel.link_occurrences({"first": "second", "second": "third"})
+    service.ai_service.release.set()
+    await service.shutdown()
+
+    assert ReminderModel.get_by_id("third")["message_variants"] == ["Water the plants (0)", "Water the plants (1)"]
+    assert not ReminderModel.get_by_id("first").get("message_variants")
+    assert not ReminderModel.get_by_id("second").get("message_variants")
+
+def test_series_tail_stops_at_missing_occurrences(database):
+    ReminderModel.create("first", CHAT_ID, "Water the plants", at(1), "daily")
+    ReminderModel.link_occurrences({"first": "deleted"})
+
+    assert ReminderModel.get_series_tail("first") == "first"
+    assert ReminderModel.get_series_tail("unknown") == "unknown"
+
+@pytest.mark.asyncio
+async def test_shutdown_waits_for_inflight_refills(database):
+    ReminderModel.create("first", CHAT_ID, "Water the plants", at(1), "daily")
+    service = rephraser()
+
+    service.refill("first", "Water the plants")
+    shutdown = asyncio.create_task(service.shutdown())
+    await asyncio.sleep(0)
+    assert not shutdown.done()
+
+    service.ai_service.release.set()
+    await shutdown
+    assert len(ReminderModel.get_by_id("first")["message_variants"]) == 2
+
+@pytest.mark.asyncio
+async def test_reminder_function_waits_for_refills_before_returning(database, monkeypatch):
+    import reminder_processor
+    from buspal_backend.services.reminders.rephraser import reminder_rephraser
+    ReminderModel.create("first", CHAT_ID, "Water the plants", at(1), "daily")
+    provider = SlowProvider()
+    provider.release.set()
+    monkeypatch.setattr(reminder_rephraser, "_ai_service", provider)
+
+    reminder_rephraser.refill("first", "Water the plants")
+    await reminder_processor.main([])
+
+    assert not reminder_rephraser._inflight
+    assert ReminderModel.get_by_id("first")["message_variants"]
@@ -0,0 +1,128 @@
+import asyncio
+import datetime
+import random
+import time
+import tracemalloc
+import pytest
+from buspal_backend.db.migrations import run_migrations
+from buspal_backend.models.conversation import ConversationModel
+from buspal_backend.models.summary_archive import SummaryArchiveModel
+from buspal_backend.services.storage.retrieval_index import BM25Index, ConversationIndexRegistry
+from buspal_backend.services.storage.summary_worker import SummaryWorker
+
+CONVO_ID = "retrieval@g.us"
+
+def synthetic_summaries(count: int, words_per_summary: int = 40, seed: int = 7):
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    return [
+        {
+            "content": " ".join(rng.choices(vocabulary, k=words_per_summary)),
+            "participants": [f"user{rng.randrange(20)}"],
+            "start_date": None,
+            "end_date": None
+        }
+        for _ in range(count)
+    ]
+
+def test_search_ranks_matching_entries_first():
+    index = BM25Index()
+    index.add({"content": "we booked the train to paris for friday"})
+    index.add({"content": "dinner at the sushi place was great"})
+    index.add({"content": "who pays for the paris hotel"})
+
+    results = index.search("paris train tickets", 2)
+
+    assert [result["content"] for result in results] == [
+        "we booked the train to paris for friday",
+        "who pays for the paris hotel",
+    ]
+
+def test_query_latency_and_memory_over_10k_summaries():
+    summaries = synthetic_summaries(10_000)
+    tracemalloc.start()
+    index = BM25Index()
+    for summary in summaries:
+        index.add(summary)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(11)
+    queries = [" ".join(f"word{rng.randrange(5000)}" for _ in range(6)) for _ in range(200)]
+    started = time.perf_counter()
+    for query in queries:
+        assert index.search(query, 5)
+    per_query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    print(f"\nBM25 over {len(index)} summaries: {per_query_ms:.3f} ms/query, "
+          f"index ~{index.memory_bytes() / 1e6:.1f} MB, build peak {peak / 1e6:.1f} MB")
+    assert per_query_ms < 20
+    assert index.memory_bytes() < 50e6
+
+@pytest.mark.asyncio
+async def test_registry_loads_archive_in_background_and_keeps_concurrent_additions(database):
+    SummaryArchiveModel.create_many(CONVO_ID, synthetic_summaries(50))
+    registry = ConversationIndexRegistry(max_chats=4, max_entries=100)
+
+    # Two searches race the first load, an entry is archived while it runs
+    first = asyncio.ensure_future(registry.search(CONVO_ID, "word1", 5))
+    second = asyncio.ensure_future(registry.search(CONVO_ID, "word1", 5))
+    await asyncio.sleep(0)
+    late = SummaryArchiveModel.create(CONVO_ID, {"content": "late lunch in beirut", "participants": ["Rami"]})
+    registry.add(CONVO_ID, [late])
+    await asyncio.gather(first, second)
+
+    index = await registry.get(CONVO_ID)
+    assert len(index) == 51
+    assert (await registry.search(CONVO_ID, "beirut lunch", 1))[0]["content"] == "late lunch in beirut"
+
+@pytest.mark.asyncio
+async def test_registry_indexes_only_the_most_recent_entries(database):
+    def archive(numbers):
+        entries = [
+            {"convo_id": CONVO_ID, "content": f"summary number{i}", "participants": [],
+             "created_at": datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=i)}
+            for i in numbers
+        ]
+        SummaryArchiveModel.collection.insert_many(entries)
+        return entries
+
+    archive(range(10))
+    registry = ConversationIndexRegistry(max_chats=4, max_entries=4)
+
+    index = await registry.get(CONVO_ID)
+    assert [entry["content"] for entry in index.entries] == [f"summary number{i}" for i in range(6, 10)]
+
+    # Growing to twice the cap drops the index, the next use reloads the latest entries
+    registry.add(CONVO_ID, archive(range(10, 14)))
+    reloaded = await registry.get(CONVO_ID)
+    assert reloaded is not index
+    assert [entry["content"] for entry in reloaded.entries] == [f"summary number{i}" for i in range(10, 14)]
+
+def test_summary_worker_archives_summarized_messages():
+    messages = [
+        {"sender": "Rami", "date": "2026-10-01 10:00:00 EEST", "message": "see you at the marina"},
+        {"sender": "Lea", "date": "2026-10-01 10:01:00 EEST", "message": None, "media": {"ref": "abc"}},
+    ]
+
+    entries = SummaryWorker._archive_messages(messages)
+
+    assert entries == [{
+        "kind": "message",
+        "content": "see you at the marina",
+        "participants": ["Rami"],
+        "start_date": "2026-10-01 10:00:00 EEST",
+        "end_date": "2026-10-01 10:00:00 EEST",
+    }]
+
+def test_backfill_archives_existing_summaries_once(database):
+    ConversationModel.create(CONVO_ID, "Trip", messages=[], summaries=[{"content": "planned the trip"}])
+    ConversationModel.update_by_id(CONVO_ID, {"digests": {"1": [{"content": "older history"}]}})
+    SummaryArchiveModel.create(CONVO_ID, {"content": "planned the trip"})
+
+    run_migrations(database)
+    run_migrations(database)
+
+    contents = sorted(SummaryArchiveModel.get_contents(CONVO_ID))
+    assert contents == ["older history", "planned the trip"]
+    assert database.migrations.find_one({"_id": "backfill_summary_archive"})["result"] == 1
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from buspal_backend.models.conversation import ConversationModel
+from buspal_backend.models.user import UserModel
+from buspal_backend.utils import helpers
+
+GROUP_ID = "120363000000000002@g.us"
+
+class Gateway:
+    """Minimal WhatsApp gateway serving group metadata and contact names."""
+
+    def __init__(self, participants, names):
+        self.participants = participants
+        self.names = names
+        self.calls = []
+        self.app = web.Application()
+        self.app.router.add_post("/groupChat/getClassInfo/{session}", self.group_info)
+        self.app.router.add_post("/contact/getClassInfo/{session}", self.contact_info)
+
+    async def group_info(self, request):
+        self.calls.append("groupChat")
+        await asyncio.sleep(0.01)
+        participants = [{"id": {"_serialized": wa_id}} for wa_id in self.participants]
+        return web.json_response({"chat": {"groupMetadata": {"participants": participants}}})
+
+    async def contact_info(self, request):
+        contact_id = (await request.json())["contactId"]
+        self.calls.append(contact_id)
+        return web.json_response({"result": {"name": self.names.get(contact_id)}})
+
+@pytest_asyncio.fixture
+async def gateway(monkeypatch, database):
+    gateway = Gateway(["961001@c.us", "961002@c.us", "961003@c.us"], {"961001@c.us": "Rami", "961002@c.us": "Lea"})
+    server = TestServer(gateway.app)
+    await server.start_server()
+    monkeypatch.setattr(helpers, "base_url", str(server.make_url("")).rstrip("/"))
+    monkeypatch.setattr(helpers, "_identity_cache", helpers.TTLCache(maxsize=100, ttl=600))
+    monkeypatch.setattr(helpers, "_roster_sync_attempts", helpers.TTLCache(maxsize=100, ttl=600))
+    ConversationModel.get_or_create(GROUP_ID)
+    yield gateway
+    await helpers.cleanup_http_session()
+    await server.close()
+
+@pytest.mark.asyncio
+async def test_sync_looks_up_only_unnamed_participants_and_caches_stored_users(gateway):
+    UserModel.create("961002@c.us", "Lea Known", "other@g.us")
+
+    assert await helpers.sync_group_roster(GROUP_ID) == 3
+
+    assert sorted(call for call in gateway.calls if call != "groupChat") == ["961001@c.us", "961003@c.us"]
+    assert UserModel.get_by_id("961001@c.us")["name"] == "Rami"
+    assert UserModel.get_by_id("961003@c.us")["name"] == ""
+    # The cache holds what is stored, including the existing user's original chat
+    assert helpers._identity_cache[("user", "961002@c.us", GROUP_ID)] == {"wa_id": "961002@c.us", "convo_id": "other@g.us", "name": "Lea Known"}
+    assert ConversationModel.get_header(GROUP_ID)["roster_synced_at"] is not None
+
+@pytest.mark.asyncio
+async def test_group_without_participants_is_still_marked_synced(gateway):
+    gateway.participants = []
+
+    assert await helpers.sync_group_roster(GROUP_ID) == 0
+
+    assert ConversationModel.get_header(GROUP_ID)["roster_synced_at"] is not None
+
+@pytest.mark.asyncio
+async def test_concurrent_and_repeated_syncs_share_one_attempt(gateway):
+    attempts = [helpers.start_roster_sync(GROUP_ID) for _ in range(10)]
+    await asyncio.gather(*attempts)
+    helpers.start_roster_sync(GROUP_ID)
+    await asyncio.sleep(0.05)
+
+    assert gateway.calls.count("groupChat") == 1
+
+@pytest.mark.asyncio
+async def test_sync_drops_the_cached_roster_of_the_group(gateway):
+    from buspal_backend.services.user_roster import roster_cache
+    assert roster_cache.resolve(GROUP_ID, "Rami") is None
+
+    await helpers.sync_group_roster(GROUP_ID)
+
+    assert roster_cache.resolve(GROUP_ID, "Rami")["wa_id"] == "961001@c.us"
+
+@pytest.mark.asyncio
+async def test_users_cached_for_another_chat_are_resolved_again(gateway):
+    UserModel.collection.insert_one({"wa_id": "961004@c.us", "name": "Nour"})
+    helpers._identity_cache[("user", "961004@c.us", "other@g.us")] = {"wa_id": "961004@c.us", "name": "Nour"}
+
+    user = await helpers.get_user_by("961004@c.us", GROUP_ID)
+
+    assert user["convo_id"] == GROUP_ID
+    assert UserModel.get_by_id("961004@c.us")["convo_id"] == GROUP_ID
+    assert helpers._identity_cache[("user", "961004@c.us", GROUP_ID)] is user
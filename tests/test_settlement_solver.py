@@ -0,0 +1,76 @@
+import random
+import time
+import pytest
+from buspal_backend.services.expense_settlement import EXACT_SOLVER_MAX_PEOPLE, ExpenseSettlementService
+
+def random_balances(rng: random.Random, people: int):
+    """Integer-cent balances summing to zero, with occasional zero-sum subgroups."""
+    amounts = [rng.choice([rng.randint(-50000, 50000), rng.choice([-1500, 1500, -2500, 2500])]) for _ in range(people - 1)]
+    amounts.append(-sum(amounts))
+    return {f"user{i}": amount for i, amount in enumerate(amounts) if amount}
+
+def apply_transfers(cents, transfers):
+    remaining = dict(cents)
+    for debtor, creditor, amount in transfers:
+        assert amount > 0
+        remaining[debtor] += amount
+        remaining[creditor] -= amount
+    return remaining
+
+def max_zero_sum_groups(amounts):
+    """Brute force: most disjoint zero-sum groups the balances split into."""
+    if not amounts:
+        return 0
+    first, rest = amounts[0], amounts[1:]
+    best = 0
+    for mask in range(1 << len(rest)):
+        chosen = [rest[i] for i in range(len(rest)) if mask >> i & 1]
+        if first + sum(chosen) == 0:
+            others = [rest[i] for i in range(len(rest)) if not mask >> i & 1]
+            best = max(best, 1 + max_zero_sum_groups(others))
+    return best
+
+@pytest.mark.parametrize("seed", range(300))
+def test_transfers_net_every_balance_to_zero_and_exact_never_loses_to_greedy(seed):
+    rng = random.Random(seed)
+    cents = random_balances(rng, rng.randint(2, EXACT_SOLVER_MAX_PEOPLE))
+
+    exact = ExpenseSettlementService._settle_exact(cents)
+    greedy = ExpenseSettlementService._settle_greedy(cents)
+
+    assert set(apply_transfers(cents, exact).values()) <= {0}
+    assert set(apply_transfers(cents, greedy).values()) <= {0}
+    assert len(exact) <= len(greedy)
+    if len(cents) <= 7:
+        assert len(exact) == len(cents) - max_zero_sum_groups(list(cents.values()))
+
+def test_minimize_transactions_returns_amounts_in_currency():
+    balances = {
+        "a": {"amount": 10.005, "name": "A"},
+        "b": {"amount": -5.0, "name": "B"},
+        "c": {"amount": -5.01, "name": "C"},
+    }
+
+    transactions = ExpenseSettlementService.minimize_transactions(balances)
+
+    assert sorted((t["from"], t["to"], t["amount"]) for t in transactions) == [("b", "a", 5.0), ("c", "a", 5.01)]
+
+def test_solver_benchmark_across_group_sizes():
+    rng = random.Random(42)
+    report = []
+    for people in (4, 8, EXACT_SOLVER_MAX_PEOPLE):
+        cents = random_balances(rng, people)
+        started = time.perf_counter()
+        exact = ExpenseSettlementService._settle_exact(cents)
+        exact_ms = (time.perf_counter() - started) * 1000
+        greedy = ExpenseSettlementService._settle_greedy(cents)
+        report.append(f"{people:>5} people: exact {exact_ms:8.2f} ms, {len(exact)} vs {len(greedy)} greedy transfers")
+        assert exact_ms < 2000
+    for people in (50, 500, 5000):
+        cents = random_balances(rng, people)
+        started = time.perf_counter()
+        greedy = ExpenseSettlementService._settle_greedy(cents)
+        greedy_ms = (time.perf_counter() - started) * 1000
+        report.append(f"{people:>5} people: greedy {greedy_ms:7.2f} ms, {len(greedy)} transfers")
+        assert len(greedy) < len(cents)
+    print("\n" + "\n".join(report))
@@ -0,0 +1,141 @@
+import datetime
+import time
+import pytest
+from buspal_backend.config.app_config import ReminderConfig
+from buspal_backend.models.reminder import ReminderModel
+from buspal_backend.services.reminders.backends import TimingWheel, TimingWheelReminderBackend
+
+CHAT_ID = "reminders@g.us"
+
+def wheel() -> TimingWheel:
+    # 1s ticks, 4 slots per level: level 0 spans 4 ticks, level 1 16, level 2 64
+    return TimingWheel(1, 2, 3, now=0)
+
+def location(timing_wheel: TimingWheel, key: str):
+    _, level, slot = timing_wheel._locations[key]
+    return level, slot
+
+def test_entries_are_placed_on_the_lowest_level_covering_their_delay():
+    timing_wheel = wheel()
+    timing_wheel.add("near", "near", 3)
+    timing_wheel.add("middle", "middle", 10)
+    timing_wheel.add("far", "far", 40)
+    timing_wheel.add("beyond", "beyond", 1000)
+
+    assert location(timing_wheel, "near") == (0, 3)
+    assert location(timing_wheel, "middle") == (1, 10 >> 2 & 3)
+    assert location(timing_wheel, "far") == (2, 40 >> 4 & 3)
+    # Delays past the wheel's span are clamped onto its last level
+    assert timing_wheel._locations["beyond"][0] == timing_wheel.max_delay
+    assert location(timing_wheel, "beyond")[0] == 2
+
+def test_fractional_times_round_up_and_due_entries_are_rejected():
+    timing_wheel = wheel()
+
+    assert timing_wheel.add("fraction", "fraction", 2.2)
+    assert not timing_wheel.add("now", "now", 0)
+    assert not timing_wheel.add("past", "past", -5)
+
+    assert timing_wheel._locations["fraction"][0] == 3
+    assert "now" not in timing_wheel and "past" not in timing_wheel
+    assert timing_wheel.advance(2) == []
+    assert timing_wheel.advance(3) == ["fraction"]
+
+def test_entries_cascade_down_when_their_slot_is_reached():
+    timing_wheel = wheel()
+    timing_wheel.add("middle", "middle", 10)
+    timing_wheel.add("far", "far", 40)
+
+    assert timing_wheel.advance(8) == []
+    assert location(timing_wheel, "middle") == (0, 10 & 3)
+
+    assert timing_wheel.advance(32) == ["middle"]
+    # The level 2 slot was reached at tick 32, leaving 8 ticks for level 1
+    assert location(timing_wheel, "far") == (1, 40 >> 2 & 3)
+
+    assert timing_wheel.advance(39) == []
+    assert timing_wheel.advance(40) == ["far"]
+    assert len(timing_wheel) == 0
+
+def test_entries_fire_in_time_order_across_levels():
+    timing_wheel = wheel()
+    times = {"e": 50, "a": 1, "d": 17, "b": 4, "c": 5, "f": 63}
+    for key, timestamp in times.items():
+        timing_wheel.add(key, key, timestamp)
+
+    assert timing_wheel.advance(100) == ["a", "b", "c", "d", "e", "f"]
+
+def test_removed_and_replaced_entries_do_not_fire_twice():
+    timing_wheel = wheel()
+    timing_wheel.add("moved", "first", 5)
+    timing_wheel.add("moved", "second", 20)
+    timing_wheel.add("removed", "removed", 6)
+
+    assert timing_wheel.remove("removed") == "removed"
+    assert timing_wheel.remove("missing") is None
+    assert timing_wheel.advance(10) == []
+    assert timing_wheel.advance(20) == ["second"]
+
+def at(minutes: int) -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+
+async def noop(payload):
+    pass
+
+@pytest.mark.asyncio
+async def test_start_only_loads_reminders_inside_the_load_horizon(database):
+    ReminderModel.create("overdue", CHAT_ID, "Missed", at(-10), status="scheduled")
+    ReminderModel.create("soon", CHAT_ID, "Soon", at(30), status="scheduled")
+    ReminderModel.create("pending", CHAT_ID, "Promoted", at(45), status="pending")
+    ReminderModel.create("later", CHAT_ID, "Later", at(24 * 60), status="scheduled")
+    backend = TimingWheelReminderBackend(ReminderConfig(wheel_load_horizon_minutes=60), noop)
+
+    await backend.start()
+    try:
+        assert "soon" in backend.wheel and "pending" in backend.wheel
+        assert "later" not in backend.wheel
+        assert "overdue" not in backend.wheel
+        assert backend.metrics["loaded"] == 3
+    finally:
+        await backend.close()
+
+@pytest.mark.asyncio
+async def test_later_windows_are_loaded_as_time_passes(database):
+    backend = TimingWheelReminderBackend(ReminderConfig(wheel_load_horizon_minutes=60), noop)
+    await backend.load(time.time() + 3600, overdue=True)
+    ReminderModel.create("later", CHAT_ID, "Later", at(90), status="scheduled")
+    ReminderModel.create("much-later", CHAT_ID, "Much later", at(180), status="scheduled")
+
+    # Scheduling past the loaded window leaves the reminder to the next load
+    await backend.schedule({"reminder_id": "later"}, at(90))
+    assert "later" not in backend.wheel
+
+    assert await backend.load(time.time() + 2 * 3600) == 1
+    assert "later" in backend.wheel
+    assert "much-later" not in backend.wheel
+
+@pytest.mark.asyncio
+async def test_reminders_released_for_retry_are_loaded_at_their_retry_time(database):
+    backend = TimingWheelReminderBackend(ReminderConfig(wheel_load_horizon_minutes=60), noop)
+    ReminderModel.create("retry", CHAT_ID, "Pay rent", at(-5))
+    tokens = {reminder["_id"]: reminder["claim_token"] for reminder in ReminderModel.claim_many(["retry"], 300)}
+    ReminderModel.release_for_retry({"retry": "gateway timeout"}, {"retry": at(90)}, tokens)
+
+    await backend.load(time.time() + 3600, overdue=True)
+    assert "retry" not in backend.wheel
+
+    assert await backend.load(time.time() + 2 * 3600) == 1
+    assert backend.wheel._locations["retry"][0] * backend.wheel.tick_seconds >= time.time() + 85 * 60
+
+@pytest.mark.asyncio
+async def test_reminders_left_sending_are_loaded_at_their_lease_expiry(database):
+    backend = TimingWheelReminderBackend(ReminderConfig(wheel_load_horizon_minutes=60), noop)
+    ReminderModel.create("sending", CHAT_ID, "Pay rent", at(-5))
+    ReminderModel.create("sent", CHAT_ID, "Call mom", at(-5))
+    ReminderModel.claim_many(["sending"], 30 * 60)
+    sent = {reminder["_id"]: reminder["claim_token"] for reminder in ReminderModel.claim_many(["sent"], 30 * 60)}
+    ReminderModel.mark_many_as_sent(sent)
+
+    assert await backend.load(time.time() + 3600, overdue=True) == 1
+    assert "sent" not in backend.wheel
+    assert backend.wheel._locations["sending"][0] * backend.wheel.tick_seconds >= time.time() + 29 * 60
@@ -0,0 +1,26 @@
+from buspal_backend.db.migrations import run_migrations
+from buspal_backend.models.user import UserModel, normalize_name
+
+CONVO_ID = "users@g.us"
+
+def test_normalize_name_collapses_whitespace_and_case():
+    assert normalize_name("  Rami   ABI\tNader ") == "rami abi nader"
+    assert normalize_name(None) == ""
+
+def test_normalized_names_are_backfilled_once_in_batches(database):
+    database.users.insert_many([
+        {"wa_id": f"961{i}@c.us", "convo_id": CONVO_ID, "name": f"User  {i}"} for i in range(5)
+    ])
+    database.users.insert_one({"wa_id": "961x@c.us", "convo_id": CONVO_ID, "name": "Lea", "name_normalized": "lea"})
+
+    assert UserModel.backfill_normalized_names(batch_size=2) == 5
+    assert UserModel.get_by_name("user 3", CONVO_ID)["wa_id"] == "9613@c.us"
+
+def test_backfill_runs_as_a_one_time_migration(database):
+    run_migrations(database)
+    database.users.insert_one({"wa_id": "961y@c.us", "convo_id": CONVO_ID, "name": "Late"})
+
+    run_migrations(database)
+
+    assert database.migrations.find_one({"_id": "backfill_normalized_names"})["applied_at"]
+    assert "name_normalized" not in database.users.find_one({"wa_id": "961y@c.us"})
@@ -0,0 +1,57 @@
+import pytest
+from buspal_backend.config.app_config import StorageConfig
+from buspal_backend.models.conversation import ConversationModel
+from buspal_backend.services.storage.write_buffer import MessageWriteBuffer
+
+HEALTHY_ID = "healthy@g.us"
+POISON_ID = "poison@g.us"
+
+def buffer(max_attempts: int = 3) -> MessageWriteBuffer:
+    write_buffer = MessageWriteBuffer()
+    write_buffer.config = StorageConfig(write_flush_max_attempts=max_attempts)
+    # mongomock cannot project $size, which the summary threshold check uses
+    write_buffer._schedule_summaries = lambda convo_ids: None
+    return write_buffer
+
+def stored(convo_id: str):
+    return ConversationModel.collection.find_one({"convo_id": convo_id})["messages"]
+
+@pytest.mark.asyncio
+async def test_appends_failing_every_flush_are_dropped_after_the_cap(database):
+    ConversationModel.collection.insert_many([
+        {"convo_id": HEALTHY_ID, "messages": []},
+        # $push fails on a non-array field, as it would on any document-level write error
+        {"convo_id": POISON_ID, "messages": "corrupted"},
+    ])
+    write_buffer = buffer()
+    write_buffer.append(POISON_ID, {"message": "never stored"})
+
+    await write_buffer.flush()
+    await write_buffer.flush()
+    assert write_buffer._pending == {POISON_ID: [{"message": "never stored"}]}
+    await write_buffer.flush()
+
+    assert write_buffer._pending == {}
+    assert write_buffer._pending_ops == 0
+    assert write_buffer.metrics["dropped"] == 1
+
+    # The chat no longer holds back later flushes
+    write_buffer.append(HEALTHY_ID, {"message": "hello"})
+    await write_buffer.flush()
+    assert stored(HEALTHY_ID) == [{"message": "hello"}]
+    assert write_buffer._failures == 0
+
+@pytest.mark.asyncio
+async def test_successful_flush_resets_the_attempts_of_a_chat(database):
+    ConversationModel.collection.insert_one({"convo_id": POISON_ID, "messages": "corrupted"})
+    write_buffer = buffer()
+    write_buffer.append(POISON_ID, {"message": "first"})
+    await write_buffer.flush()
+    await write_buffer.flush()
+
+    ConversationModel.collection.update_one({"convo_id": POISON_ID}, {"$set": {"messages": []}})
+    await write_buffer.flush()
+
+    assert write_buffer._attempts == {}
+    assert write_buffer._failures == 0
+    assert stored(POISON_ID) == [{"message": "first"}]